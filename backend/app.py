@@ -1,36 +1,35 @@
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()
+from flask import Blueprint, Flask, current_app, request, jsonify, Response, g
 from flask_pymongo import PyMongo
 from flask_cors import CORS
 from bson import ObjectId
 import json
 from datetime import datetime
-import pandas as pd
 import numpy as np
 import dotenv 
 import os
+import logging
+from functools import wraps
+from werkzeug.local import LocalProxy
 dotenv.load_dotenv()
-from utils.HybridRecommender import recommend, add_recommender_interaction, init_app, get_demographic_recommendations, get_recency_scores, get_collaborative_scores, get_context_recommendations
+# scikit-learn is only imported when the model first needs it, which keeps this import short
+from utils.HybridRecommender import recommend, add_recommender_interaction, add_recommender_review, get_product_ratings, get_catalog_version, rating_summary, init_app, get_demographic_recommendations, get_recency_scores, get_collaborative_scores, get_context_recommendations, get_products_by_id, get_similar_products, get_trending
+from utils.HybridRecommender import MongoCommandListener, render_metrics, timed
+from utils.HybridRecommender import PROFILER, PROFILE_HEADER, get_model_status, request_model_rebuild
+from utils.HybridRecommender import get_tenant, get_tenant_stats, UnknownTenant, Filters
+from utils.HybridRecommender.metrics import HTTP_REQUEST_SECONDS
+from utils import user_views
+from utils.startup import Startup
+from utils.http_cache import CatalogCache, catalog_cached
+_import_seconds = time.perf_counter() - _import_started
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
 # from utils.HybridRecommender.demographic import get_demographic_recommendations
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-
-# MongoDB configuration
-app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db")
-mongo = PyMongo(app)
-
-# Initialize the recommender system with MongoDB
-init_app(app)
-
-# Create text index for search
-try:
-    mongo.db.products.create_index([
-        ("product_name", "text"),
-        ("description", "text"),
-        ("category", "text"),
-        ("brand", "text")
-    ])
-except Exception as e:
-    print(f"Index might already exist: {e}")
+api = Blueprint('api', __name__)
+# The current app's PyMongo, made in create_app(); its client is shared with the recommender
+mongo = LocalProxy(lambda: current_app.extensions['pymongo'])
 
 # JSON encoder for ObjectId
 class JSONEncoder(json.JSONEncoder):
@@ -47,19 +46,119 @@ class JSONEncoder(json.JSONEncoder):
             return obj.tolist()
         return super().default(obj)
 
-app.json_encoder = JSONEncoder
+def _ensure_indexes(db):
+    # Create text index for search
+    try:
+        db.products.create_index([
+            ("product_name", "text"),
+            ("description", "text"),
+            ("category", "text"),
+            ("brand", "text")
+        ])
+    except Exception as e:
+        logger.info("Index might already exist: %s", e)
+
+    # The polling change feed looks up edited products by updated_at every second
+    db.products.create_index('updated_at', sparse=True)
+
+    # Unique per-user index backing the materialized cart and order views
+    user_views.ensure_indexes(db)
+
+def create_app(config=None):
+    """Build the API app
+
+    Only the Mongo client is set up here. Indexes, the cart and order views and the
+    recommender model are prepared by a warm-up, on a background thread unless WARM_UP is
+    "sync", so the process answers /healthz at once and /readyz once the warm-up is done.
+    The Mongo client, recommender tenant and catalog cache live in app.extensions, so each
+    app built here is independent of any other. Serve it with gunicorn 'app:create_app()'.
+    """
+    startup = Startup()
+    startup.record('imports', _import_seconds)
+    with startup.stage('app'):
+        app = Flask(__name__)
+        CORS(app, resources={r"/*": {"origins": "*"}})
+
+        # MongoDB configuration
+        app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db")
+        app.config["WARM_UP"] = os.getenv("WARM_UP", "background")
+        app.config.update(config or {})
+        app.json_encoder = JSONEncoder
+        app.register_blueprint(api)
+        app.extensions['startup'] = startup
+
+        # Opt-in profiling: fraction of requests sampled and number of slowest captures kept
+        PROFILER.configure(
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            capacity=int(os.getenv("PROFILE_KEEP", "20"))
+        )
+
+    with startup.stage('mongo_client'):
+        # One connection pool serves both the routes and the recommender
+        pymongo = app.extensions['pymongo'] = PyMongo()
+        pymongo.init_app(app, event_listeners=[MongoCommandListener()])
+        tenant = init_app(app, client=pymongo.cx)
+        # Serialized catalog responses, valid while the recommender's catalog fingerprint is unchanged
+        app.extensions['catalog_cache'] = CatalogCache(lambda: get_catalog_version(tenant))
+
+    startup.warm_up([
+        ('indexes', lambda: _ensure_indexes(pymongo.db)),
+        ('user_views', lambda: user_views.rebuild_if_empty(pymongo.db)),
+        ('model', tenant.start),
+    ], background=app.config["WARM_UP"] != 'sync')
+    return app
+
+@api.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_app_request
+def _record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            # Without the blueprint prefix, so the labels match those recorded before it existed
+            endpoint=(request.endpoint or 'unknown').rsplit('.', 1)[-1],
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+@api.app_errorhandler(UnknownTenant)
+def _unknown_tenant(e):
+    return jsonify({'error': 'Unknown tenant'}), 404
+
+def _tenant():
+    """Storefront named by ?tenant= or the X-Tenant header, loaded up front so an unknown one is a 404
+
+    Without a name it is the recommender create_app() bound to this app's database.
+    """
+    name = request.args.get('tenant') or request.headers.get('X-Tenant')
+    if not name:
+        return current_app.extensions['recommender']
+    get_tenant(name)
+    return name
+
+def profiled(view):
+    """Profile the view when the request opts in via header or is sampled"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        force = request.headers.get(PROFILE_HEADER) == '1'
+        return PROFILER.run(request.path, view, *args, force=force, **kwargs)
+    return wrapper
 
 # ==========================================================================
 # =============================== Login Routes===============================
 # ==========================================================================
-@app.route('/api/signup', methods=['POST'])
+@api.route('/api/signup', methods=['POST'])
 def signup():
     data = request.json
     if not data or not data.get('email') or not data.get('password') or not data.get('location'):
         return jsonify({'error': 'Missing required fields'}), 400
     
     last_user = mongo.db.users.find_one({}, sort=[('user_id', -1)])
-    print(last_user, 'last_user')
+    logger.debug("Last user before signup: %s", last_user)
     
     if mongo.db.users.find_one({'email': data['email']}, {'_id': 0}):
         return jsonify({'error': 'User already exists'}), 409
@@ -87,7 +186,7 @@ def signup():
         'location': data['location']
     }), 201
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     if not data or not data.get('email') or not data.get('password'):
@@ -111,93 +210,32 @@ def login():
 # =============================== User Routes ===============================
 # ==========================================================================
 
-@app.route('/api/cart_interactions/<user_id>', methods=['GET'])
+@api.route('/api/cart_interactions/<user_id>', methods=['GET'])
 def get_cart_interactions(user_id):
     try:
-        pipeline = [
-            {
-                '$match': {
-                    'user_id': int(user_id),
-                    'interaction_type': 'add_to_cart'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'products',
-                    'localField': 'product_id',
-                    'foreignField': 'product_id',
-                    'as': 'product'
-                }
-            },
-            {
-                '$unwind': '$product'
-            },
-            {
-                '$project': {
-                    '_id': 0,
-                    'product_id': 1,
-                    'timestamp': 1,
-                    'product_name': '$product.product_name',
-                    'price': '$product.price',
-                    'description': '$product.description',
-                    'category': '$product.category',
-                    'brand': '$product.brand'
-                }
-            },
-            {
-                '$sort': {'timestamp': -1}
-            }
-        ]
-        
-        interactions = list(mongo.db.interactions.aggregate(pipeline))
-        return jsonify({'cart_interactions': interactions})
+        limit, offset = user_views.parse_page_args(request.args)
+        interactions, total = user_views.get_page(mongo.db, 'add_to_cart', int(user_id), limit, offset)
+        # Current names and prices from the in-memory catalog, so the page needs no second request
+        current = get_products_by_id([item['product_id'] for item in interactions], tenant=_tenant())
+        interactions = user_views.refresh_items(interactions, current)
+        return jsonify({'cart_interactions': interactions, 'total': total, 'limit': limit, 'offset': offset})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/previous_orders/<user_id>', methods=['GET'])
+@api.route('/api/previous_orders/<user_id>', methods=['GET'])
 def get_previous_orders(user_id):
     try:
-        pipeline = [
-            {
-                '$match': {
-                    'user_id': int(user_id),
-                    'interaction_type': 'purchase'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'products',
-                    'localField': 'product_id',
-                    'foreignField': 'product_id',
-                    'as': 'product'
-                }
-            },
-            {
-                '$unwind': '$product'
-            },
-            {
-                '$project': {
-                    '_id': 0,
-                    'product_id': 1,
-                    'timestamp': 1,
-                    'product_name': '$product.product_name',
-                    'price': '$product.price',
-                    'description': '$product.description',
-                    'category': '$product.category',
-                    'brand': '$product.brand'
-                }
-            },
-            {
-                '$sort': {'timestamp': -1}
-            }
-        ]
-        
-        orders = list(mongo.db.interactions.aggregate(pipeline))
-        return jsonify({'previous_orders': orders})
+        limit, offset = user_views.parse_page_args(request.args)
+        orders, total = user_views.get_page(mongo.db, 'purchase', int(user_id), limit, offset)
+        return jsonify({'previous_orders': orders, 'total': total, 'limit': limit, 'offset': offset})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/profile/<user_id>', methods=['GET'])
+@api.route('/api/profile/<user_id>', methods=['GET'])
 def get_profile(user_id):
     try:
         user = mongo.db.users.find_one({'user_id': int(user_id)}, {'_id': 0, 'email': 1, 'preferences': 1})
@@ -298,7 +336,7 @@ def get_profile(user_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/interactions', methods=['POST'])
+@api.route('/api/interactions', methods=['POST'])
 def add_interaction():
     data = request.json
     if not data or not data.get('user_id') or not data.get('product_id') or not data.get('interaction_type'):
@@ -320,8 +358,9 @@ def add_interaction():
     if not mongo.db.users.find_one({'user_id': user_id}):
         return jsonify({'error': 'User not found'}), 404
 
-    # Verify product exists
-    if not mongo.db.products.find_one({'product_id': product_id}):
+    # Verify product exists, fetching the fields copied into the cart/order views
+    product = mongo.db.products.find_one({'product_id': product_id}, user_views.PRODUCT_PROJECTION)
+    if not product:
         return jsonify({'error': 'Product not found'}), 404
 
     interaction = {
@@ -332,35 +371,217 @@ def add_interaction():
     }
     
     result = mongo.db.interactions.insert_one(interaction)
-    
+    user_views.record_interaction(mongo.db, user_id, product, interaction['interaction_type'], interaction['timestamp'])
+    add_recommender_interaction(interaction, tenant=current_app.extensions['recommender'])
+
     return jsonify({
         'message': 'Interaction recorded successfully',
         'interaction_id': str(result.inserted_id)
     }), 201
 
 
+@api.route('/api/reviews', methods=['POST'])
+def add_review():
+    data = request.json
+    if not data or not data.get('user_id') or not data.get('product_id') or data.get('rating') is None:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        user_id = int(data['user_id'])
+        product_id = int(data['product_id'])
+        rating = int(data['rating'])
+    except (ValueError, TypeError):
+        return jsonify({'error': 'user_id, product_id and rating must be valid integers'}), 400
+    if not 1 <= rating <= 5:
+        return jsonify({'error': 'rating must be between 1 and 5'}), 400
+
+    if not mongo.db.users.find_one({'user_id': user_id}, {'_id': 1}):
+        return jsonify({'error': 'User not found'}), 404
+    if not mongo.db.products.find_one({'product_id': product_id}, {'_id': 1}):
+        return jsonify({'error': 'Product not found'}), 404
+
+    review = {
+        'user_id': user_id,
+        'product_id': product_id,
+        'rating': rating,
+        'review_text': data.get('review_text', ''),
+        'created_at': datetime.utcnow()
+    }
+    result = mongo.db.reviews.insert_one(review)
+    add_recommender_review(review, tenant=current_app.extensions['recommender'])
+
+    return jsonify({
+        'message': 'Review recorded successfully',
+        'review_id': str(result.inserted_id)
+    }), 201
+
+
 # ==========================================================================
 # =============================== Product Routes ===========================
 # ==========================================================================
 
-@app.route('/api/products', methods=['GET'])
+def _lookup_id(product_id):
+    try:
+        return int(product_id)
+    except ValueError:
+        return product_id
+
+def _rating_validator(product_id):
+    """The product's review count and mean, which change without the catalog changing"""
+    product_id = _lookup_id(product_id)
+    if not isinstance(product_id, int):
+        # No such product; the route answers 404 without a validator
+        return None
+    ratings = get_product_ratings(product_id, tenant=_tenant())
+    return f"{ratings['rating_count']}-{ratings['avg_rating']}"
+
+@api.route('/api/products', methods=['GET'])
+@catalog_cached('public, max-age=300')
 def get_products():
     products = list(mongo.db.products.find({}, {'_id': 0}))
     return jsonify({'products': products})
 
-@app.route('/api/products/<product_id>', methods=['GET'])
-def get_product(product_id):
+# Most products one batch request may ask for, and the fields it may select
+MAX_BATCH_PRODUCTS = 100
+BATCH_FIELDS = ('product_id', 'product_name', 'category', 'brand', 'price', 'description', 'avg_rating', 'rating_count')
+
+def _batch_args():
+    """(ids, fields) from a JSON body on POST or ?ids=1,2&fields=a,b on GET; fields is None for all"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ValueError('The body must be a JSON object')
+        ids = data.get('ids') or []
+        if not isinstance(ids, list):
+            raise ValueError('ids must be a list of integers')
+        return ids, data.get('fields')
+    ids, fields = request.args.get('ids'), request.args.get('fields')
+    return ids.split(',') if ids else [], fields.split(',') if fields else None
+
+def _batch_id(value):
+    """value as a product id: an integer, or a string of digits; anything else (true, 1.7) is a ValueError"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    raise ValueError(value)
+
+def _records(frame):
+    """JSON-ready dicts for the rows of a product DataFrame indexed by product_id; NaN becomes None"""
+    frame = frame.reset_index()
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+@api.route('/api/products/batch', methods=['GET', 'POST'])
+def get_products_batch():
     try:
-        lookup_id = int(product_id)
-    except ValueError:
-        lookup_id = product_id
-        
-    product = mongo.db.products.find_one({'product_id': lookup_id}, {'_id': 0})
+        ids, fields = _batch_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        product_ids = [_batch_id(product_id) for product_id in ids]
+    except (ValueError, TypeError):
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    if not product_ids or len(product_ids) > MAX_BATCH_PRODUCTS:
+        return jsonify({'error': f'Between 1 and {MAX_BATCH_PRODUCTS} ids are required'}), 400
+    if fields is not None and (not isinstance(fields, list) or not set(fields) <= set(BATCH_FIELDS)):
+        return jsonify({'error': f'fields must be a list of: {", ".join(BATCH_FIELDS)}'}), 400
+
+    try:
+        tenant = _tenant()
+        products_df = get_products_by_id(product_ids, tenant=tenant)
+        with timed('serialization'):
+            if products_df is None:
+                # Model still loading: same answer from MongoDB
+                found = {product['product_id']: product
+                         for product in mongo.db.products.find({'product_id': {'$in': product_ids}}, {'_id': 0})}
+                products = [{**found[product_id], **get_product_ratings(product_id, tenant=tenant)}
+                            for product_id in product_ids if product_id in found]
+            else:
+                products = _records(products_df)
+            if fields is not None:
+                products = [{'product_id': product['product_id'], **{field: product.get(field) for field in fields}}
+                            for product in products]
+            returned = {product['product_id'] for product in products}
+            return jsonify({
+                'products': products,
+                'missing': [product_id for product_id in product_ids if product_id not in returned]
+            })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/products/<product_id>', methods=['GET'])
+# Revalidated on every use, since reviews move the rating shown alongside the product
+@catalog_cached('public, no-cache', validator=_rating_validator)
+def get_product(product_id):
+    product = mongo.db.products.find_one({'product_id': _lookup_id(product_id)}, {'_id': 0})
     if not product:
         return jsonify({'error': 'Product not found'}), 404
+    product.update(get_product_ratings(product['product_id'], tenant=_tenant()))
     return jsonify(product)
 
-@app.route('/api/products/search', methods=['GET'])
+@api.route('/api/products/<product_id>/similar', methods=['GET'])
+def get_similar(product_id):
+    try:
+        product_id = int(product_id)
+        k = min(int(request.args.get('k', 8)), 50)
+    except ValueError:
+        return jsonify({'error': 'product_id and k must be valid integers'}), 400
+
+    tenant = _tenant()
+    try:
+        similar_df = get_similar_products(product_id, k, tenant=tenant)
+        with timed('serialization'):
+            products = []
+            for idx, row in similar_df.iterrows():
+                products.append({
+                    'product_id': str(idx),
+                    'category': row['category'],
+                    'brand': row['brand'],
+                    'price': float(row['price']),
+                    'product_name': row['product_name'],
+                    'description': row['description'],
+                    'score': float(row['score']),
+                    **rating_summary(row.get('avg_rating'), row.get('rating_count'))
+                })
+            return jsonify({'products': products})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/trending', methods=['GET'])
+def get_trending_products():
+    try:
+        k = min(int(request.args.get('k', 20)), 50)
+    except ValueError:
+        return jsonify({'error': 'k must be a valid integer'}), 400
+    if k < 1:
+        return jsonify({'error': 'k must be at least 1'}), 400
+
+    tenant = _tenant()
+    try:
+        trending_df = get_trending(
+            k, category=request.args.get('category'), location=request.args.get('location'), tenant=tenant
+        )
+        with timed('serialization'):
+            products = []
+            for idx, row in trending_df.iterrows():
+                products.append({
+                    'product_id': str(idx),
+                    'category': row['category'],
+                    'brand': row['brand'],
+                    'price': float(row['price']),
+                    'product_name': row['product_name'],
+                    'description': row['description'],
+                    'score': float(row['score']),
+                    **rating_summary(row.get('avg_rating'), row.get('rating_count'))
+                })
+            return jsonify({'products': products})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/products/search', methods=['GET'])
+@catalog_cached('public, max-age=60')
 def search_products():
     query = request.args.get('query', '')
     category = request.args.get('category')
@@ -395,42 +616,120 @@ def search_products():
 # =============================== Recommendation Routes ===================
 # ==========================================================================
 
-@app.route('/api/recommendations/<user_id>', methods=['GET'])
+@api.route('/api/recommendations/<user_id>', methods=['GET'])
+@profiled
 def get_recommendations(user_id):
     try:
-        recommendations_df = recommend(user_id, k=20)
-        print(recommendations_df)
+        filters = Filters.from_args(request.args)
+    except ValueError:
+        return jsonify({'error': 'min_price and max_price must be numbers'}), 400
+
+    tenant = _tenant()
+    try:
+        recommendations_df = recommend(user_id, k=20, tenant=tenant, filters=filters)
+        logger.debug("Recommendations for user %s:\n%s", user_id, recommendations_df)
         # return recommendations_df
-        recommendations = []
-        for idx, row in recommendations_df.iterrows():
-            recommendations.append({
-                'product_id': str(idx),
-                'category': row['category'],
-                'brand': row['brand'],
-                'price': float(row['price']),
-                'product_name': row['product_name'],
-                'description': row['description'],
-                # 'score': float(row['score']),
-                'recommendation_category': row['recommendation_source']
-            })
-        return jsonify({'recommendations': recommendations})
+        with timed('serialization'):
+            recommendations = []
+            for idx, row in recommendations_df.iterrows():
+                recommendations.append({
+                    'product_id': str(idx),
+                    'category': row['category'],
+                    'brand': row['brand'],
+                    'price': float(row['price']),
+                    'product_name': row['product_name'],
+                    'description': row['description'],
+                    # 'score': float(row['score']),
+                    'recommendation_category': row['recommendation_source'],
+                    **rating_summary(row.get('avg_rating'), row.get('rating_count'))
+                })
+            return jsonify({'recommendations': recommendations})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# ==========================================================================
+# =============================== Metrics Routes ==========================
+# ==========================================================================
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# ==========================================================================
+# =============================== Health Routes ===========================
+# ==========================================================================
+
+@api.route('/healthz', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok'})
+
+@api.route('/readyz', methods=['GET'])
+def readiness():
+    report = current_app.extensions['startup'].report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+
 # ==========================================================================
 # =============================== Dev Routes =============================
 # ==========================================================================
 
-@app.route('/api/dev/demographics', methods=['GET'])
+@api.route('/api/dev/demographics', methods=['GET'])
 def get_demographics():
     location = request.args.get('location')
     if not location:
         return jsonify({'error': 'Missing location parameter'}), 400
-    recommendations = get_demographic_recommendations(location=location, n_items=20)
+    recommendations = get_demographic_recommendations(location=location, n_items=20, tenant=_tenant())
     return jsonify({'recommendations': recommendations})
 
-# @app.route('/api/dev/recency', methods=['GET'])
+@api.route('/api/dev/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify({'profiles': [captured.summary() for captured in PROFILER.profiles()]})
+
+@api.route('/api/dev/profiles/<int:profile_id>', methods=['GET'])
+def get_profile_capture(profile_id):
+    captured = PROFILER.get(profile_id)
+    if not captured:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    fmt = request.args.get('format', 'text')
+    if fmt == 'text':
+        return Response(captured.to_text(), mimetype='text/plain')
+    if fmt == 'collapsed':
+        return Response(captured.to_collapsed(), mimetype='text/plain')
+    if fmt == 'pstats':
+        return Response(
+            captured.to_pstats(),
+            mimetype='application/octet-stream',
+            headers={'Content-Disposition': f'attachment; filename=profile-{profile_id}.prof'}
+        )
+    return jsonify({'error': 'format must be one of: text, collapsed, pstats'}), 400
+
+@api.route('/api/dev/profiles', methods=['DELETE'])
+def clear_profiles():
+    PROFILER.clear()
+    return jsonify({'message': 'Profiles cleared'})
+
+@api.route('/api/dev/model', methods=['GET'])
+def model_status():
+    return jsonify(get_model_status(_tenant()))
+
+@api.route('/api/dev/model/rebuild', methods=['POST'])
+def rebuild_model():
+    tenant = _tenant()
+    request_model_rebuild(tenant)
+    return jsonify({'message': 'Rebuild requested', **get_model_status(tenant)}), 202
+
+@api.route('/api/dev/tenants', methods=['GET'])
+def tenant_stats():
+    return jsonify(get_tenant_stats())
+
+@api.route('/api/dev/http-cache', methods=['GET'])
+def http_cache_stats():
+    return jsonify(current_app.extensions['catalog_cache'].stats())
+
+# @api.route('/api/dev/recency', methods=['GET'])
 # def get_recency():
 #     location = request.args.get('location')
 #     if not location:
@@ -439,4 +738,4 @@ def get_demographics():
 #     return jsonify({'recommendations': recommendations})
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
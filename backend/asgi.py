@@ -0,0 +1,279 @@
+"""ASGI variant of the read-heavy API routes, backed by Motor
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5001
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+import dotenv
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+dotenv.load_dotenv()
+from utils.HybridRecommender import init_async_app, recommend_async, add_recommender_interaction, get_product_ratings, get_products_by_id, rating_summary, render_metrics, timed, Filters
+from utils import user_views
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db")
+VALID_INTERACTION_TYPES = ['view', 'add_to_cart', 'purchase']
+
+_service = None
+
+
+def _json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class APIJSONResponse(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _db():
+    return _service.db
+
+
+async def _json_body(request):
+    """The request's JSON object, or None for a malformed or non-object body (a 400, as in the Flask app)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# ==========================================================================
+# =============================== Login Routes===============================
+# ==========================================================================
+
+async def login(request):
+    data = await _json_body(request)
+    if not data or not data.get('email') or not data.get('password'):
+        return APIJSONResponse({'error': 'Missing required fields'}, status_code=400)
+
+    user = await _db().users.find_one({
+        'email': data['email'],
+        'password': data['password']  # In production, verify hashed password
+    }, {'_id': 0, 'preferences': 1, 'user_id': 1})
+
+    if not user:
+        return APIJSONResponse({'error': 'Invalid credentials'}, status_code=401)
+
+    return APIJSONResponse({
+        'message': 'Login successful',
+        'user_id': str(user['user_id']),
+        'preferences': user.get('preferences', {})
+    })
+
+
+# ==========================================================================
+# =============================== User Routes ===============================
+# ==========================================================================
+
+async def _get_view_page(request, interaction_type, key, current=False):
+    try:
+        limit, offset = user_views.parse_page_args(request.query_params)
+        user_id = int(request.path_params['user_id'])
+        collection = user_views.VIEW_COLLECTIONS[interaction_type]
+        document = await _db()[collection].find_one({'user_id': user_id}, user_views.page_projection(limit, offset))
+        items, total = user_views.page_from_document(document)
+        if current:
+            # Current names and prices from the in-memory catalog, as the Flask route does
+            items = user_views.refresh_items(items, get_products_by_id([item['product_id'] for item in items]))
+        return APIJSONResponse({key: items, 'total': total, 'limit': limit, 'offset': offset})
+    except ValueError as e:
+        return APIJSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        return APIJSONResponse({'error': str(e)}, status_code=500)
+
+
+async def get_cart_interactions(request):
+    return await _get_view_page(request, 'add_to_cart', 'cart_interactions', current=True)
+
+
+async def get_previous_orders(request):
+    return await _get_view_page(request, 'purchase', 'previous_orders')
+
+
+async def add_interaction(request):
+    data = await _json_body(request)
+    if not data or not data.get('user_id') or not data.get('product_id') or not data.get('interaction_type'):
+        return APIJSONResponse({'error': 'Missing required fields'}, status_code=400)
+
+    if data['interaction_type'] not in VALID_INTERACTION_TYPES:
+        return APIJSONResponse(
+            {'error': f'Invalid interaction type. Must be one of: {", ".join(VALID_INTERACTION_TYPES)}'},
+            status_code=400
+        )
+
+    try:
+        user_id = int(data['user_id'])
+        product_id = int(data['product_id'])
+    except (ValueError, TypeError):
+        return APIJSONResponse({'error': 'user_id and product_id must be valid integers'}, status_code=400)
+
+    user, product = await asyncio.gather(
+        _db().users.find_one({'user_id': user_id}, {'_id': 1}),
+        _db().products.find_one({'product_id': product_id}, user_views.PRODUCT_PROJECTION)
+    )
+    if not user:
+        return APIJSONResponse({'error': 'User not found'}, status_code=404)
+    if not product:
+        return APIJSONResponse({'error': 'Product not found'}, status_code=404)
+
+    interaction = {
+        'user_id': user_id,
+        'product_id': product_id,
+        'interaction_type': data['interaction_type'],
+        'timestamp': datetime.utcnow()
+    }
+    result = await _db().interactions.insert_one(interaction)
+    view_spec = user_views.view_update(user_id, product, interaction['interaction_type'], interaction['timestamp'])
+    if view_spec:
+        collection, query, update = view_spec
+        try:
+            await _db()[collection].update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent first interaction for the same user inserted the document first
+            await _db()[collection].update_one(query, update)
+    add_recommender_interaction(interaction)
+
+    return APIJSONResponse({
+        'message': 'Interaction recorded successfully',
+        'interaction_id': str(result.inserted_id)
+    }, status_code=201)
+
+
+# ==========================================================================
+# =============================== Product Routes ===========================
+# ==========================================================================
+
+async def get_products(request):
+    products = await _db().products.find({}, {'_id': 0}).to_list(None)
+    return APIJSONResponse({'products': products})
+
+
+async def get_product(request):
+    product_id = request.path_params['product_id']
+    try:
+        lookup_id = int(product_id)
+    except ValueError:
+        lookup_id = product_id
+
+    product = await _db().products.find_one({'product_id': lookup_id}, {'_id': 0})
+    if not product:
+        return APIJSONResponse({'error': 'Product not found'}, status_code=404)
+    product.update(get_product_ratings(product['product_id']))
+    return APIJSONResponse(product)
+
+
+async def search_products(request):
+    query = request.query_params.get('query', '')
+    category = request.query_params.get('category')
+    brand = request.query_params.get('brand')
+
+    search_filter = {}
+    if query:
+        search_filter['$text'] = {'$search': query}
+    if category:
+        search_filter['category'] = {'$regex': f'^{category}$', '$options': 'i'}
+    if brand:
+        search_filter['brand'] = {'$regex': f'^{brand}$', '$options': 'i'}
+
+    try:
+        if query:
+            cursor = _db().products.find(
+                search_filter,
+                {'_id': 0, 'score': {'$meta': 'textScore'}}
+            ).sort([('score', {'$meta': 'textScore'})])
+        else:
+            cursor = _db().products.find(search_filter, {'_id': 0})
+        return APIJSONResponse({'products': await cursor.to_list(None)})
+    except Exception as e:
+        return APIJSONResponse({'error': str(e)}, status_code=500)
+
+
+# ==========================================================================
+# =============================== Recommendation Routes ===================
+# ==========================================================================
+
+async def get_recommendations(request):
+    user_id = request.path_params['user_id']
+    try:
+        filters = Filters.from_args(request.query_params)
+    except ValueError:
+        return APIJSONResponse({'error': 'min_price and max_price must be numbers'}, status_code=400)
+    try:
+        recommendations_df = await recommend_async(user_id, k=20, filters=filters)
+        with timed('serialization'):
+            recommendations = []
+            for idx, row in recommendations_df.iterrows():
+                recommendations.append({
+                    'product_id': str(idx),
+                    'category': row['category'],
+                    'brand': row['brand'],
+                    'price': float(row['price']),
+                    'product_name': row['product_name'],
+                    'description': row['description'],
+                    'recommendation_category': row['recommendation_source'],
+                    **rating_summary(row.get('avg_rating'), row.get('rating_count'))
+                })
+            return APIJSONResponse({'recommendations': recommendations})
+    except Exception as e:
+        return APIJSONResponse({'error': str(e)}, status_code=500)
+
+
+async def metrics(request):
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4')
+
+
+async def startup():
+    global _service
+    # Building the matrices is blocking, but it happens once before serving
+    _service = init_async_app(MONGO_URI)
+
+
+async def shutdown():
+    if _service is not None:
+        _service.close()
+
+
+routes = [
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/cart_interactions/{user_id}', get_cart_interactions, methods=['GET']),
+    Route('/api/previous_orders/{user_id}', get_previous_orders, methods=['GET']),
+    Route('/api/interactions', add_interaction, methods=['POST']),
+    Route('/api/products', get_products, methods=['GET']),
+    Route('/api/products/search', search_products, methods=['GET']),
+    Route('/api/products/{product_id}', get_product, methods=['GET']),
+    Route('/api/recommendations/{user_id}', get_recommendations, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
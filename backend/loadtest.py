@@ -0,0 +1,270 @@
+"""Replay shopping sessions from the interaction log against the API and report per-route latency
+
+Each session is one user's run of interactions with no gap longer than --session-gap
+minutes. A virtual user replays it as: log in, browse /api/products, search the first
+product's category, then view and record each interaction, then fetch recommendations.
+
+Usage (from backend/):
+    python loadtest.py --concurrency 1,4,16,64 --duration 30            # in-process, mongomock stand-in
+    python loadtest.py --url http://localhost:5000 --concurrency 32     # against a running server (needs httpx)
+
+The in-process mode seeds a mongomock database from the CSV exports and calls the Flask app
+through its test client, so it measures the application code without network or MongoDB
+latency. Against a real server, users need `loadtest+<user_id>@example.com` / `loadtest`
+credentials for the login step to succeed; pass --no-login otherwise.
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/ecommerce_db'
+PASSWORD = 'loadtest'
+
+
+def credentials(user_id):
+    return {'email': f'loadtest+{user_id}@example.com', 'password': PASSWORD}
+
+
+def load_sessions(data_dir, session_gap=30):
+    """Sessions as (user_id, [(product_id, interaction_type, category), ...]) in log order"""
+    interactions = pd.read_csv(os.path.join(data_dir, 'interactions.csv'), parse_dates=['timestamp'])
+    products = pd.read_csv(os.path.join(data_dir, 'products.csv'), usecols=['product_id', 'category'])
+    interactions = interactions.merge(products, on='product_id', how='left').sort_values(['user_id', 'timestamp'])
+    new_user = interactions['user_id'].ne(interactions['user_id'].shift())
+    gap = interactions['timestamp'].diff() > pd.Timedelta(minutes=session_gap)
+    interactions['session'] = (new_user | gap).cumsum()
+
+    sessions = []
+    for _, events in interactions.groupby('session', sort=False):
+        steps = list(zip(events['product_id'], events['interaction_type'], events['category']))
+        sessions.append((int(events['user_id'].iloc[0]), steps))
+    # Replay in the order the sessions started, not grouped by user
+    starts = interactions.groupby('session', sort=False)['timestamp'].min().to_numpy()
+    return [sessions[i] for i in np.argsort(starts, kind='stable')]
+
+
+class Stats:
+    """Latencies and failures per route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, seconds, status):
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+        if status is None or status >= 400:
+            self.errors[route] += 1
+
+    def report(self, elapsed):
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ms = np.array(latencies) * 1000
+            p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+            routes[route] = {
+                'requests': len(ms),
+                'throughput_rps': round(len(ms) / elapsed, 2),
+                'error_rate': round(self.errors[route] / len(ms), 4),
+                'statuses': {str(status): count for status, count in self.statuses[route].items()},
+                'latency_ms': {
+                    'mean': round(float(ms.mean()), 2), 'p50': round(p50, 2), 'p90': round(p90, 2),
+                    'p95': round(p95, 2), 'p99': round(p99, 2), 'max': round(float(ms.max()), 2),
+                },
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'requests': total,
+            'elapsed_seconds': round(elapsed, 2),
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(sum(self.errors.values()) / total, 4) if total else 0.0,
+            'routes': routes,
+        }
+
+
+class InProcessTarget:
+    """Calls the Flask app through per-thread test clients"""
+
+    def __init__(self, app, concurrency):
+        self.app = app
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='loadtest')
+
+    def _request(self, method, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.open(path, method=method, json=body).status_code
+
+    async def request(self, method, path, body=None):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._request, method, path, body)
+
+    async def close(self):
+        self._pool.shutdown(wait=True)
+
+
+class HttpTarget:
+    """Sends real HTTP requests to a running server"""
+
+    def __init__(self, url, concurrency):
+        # Imported lazily so the in-process mode does not require httpx
+        import httpx
+        self._client = httpx.AsyncClient(
+            base_url=url, timeout=30.0,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+
+    async def request(self, method, path, body=None):
+        response = await self._client.request(method, path, json=body)
+        return response.status_code
+
+    async def close(self):
+        await self._client.aclose()
+
+
+async def _call(target, stats, route, method, path, body=None):
+    started = time.perf_counter()
+    try:
+        status = await target.request(method, path, body)
+    except Exception:
+        status = None
+    stats.record(route, time.perf_counter() - started, status)
+    return status
+
+
+async def replay_session(target, stats, user_id, steps, login=True, think_time=0.0):
+    async def pause():
+        if think_time:
+            await asyncio.sleep(think_time)
+
+    if login:
+        await _call(target, stats, 'POST /api/login', 'POST', '/api/login', credentials(user_id))
+    await _call(target, stats, 'GET /api/products', 'GET', '/api/products')
+    await pause()
+    category = steps[0][2]
+    if isinstance(category, str):
+        await _call(target, stats, 'GET /api/products/search', 'GET', f'/api/products/search?category={category}')
+    for product_id, interaction_type, _ in steps:
+        await pause()
+        await _call(target, stats, 'GET /api/products/<product_id>', 'GET', f'/api/products/{product_id}')
+        await _call(target, stats, 'POST /api/interactions', 'POST', '/api/interactions', {
+            'user_id': user_id, 'product_id': int(product_id), 'interaction_type': interaction_type
+        })
+    await _call(target, stats, 'GET /api/recommendations/<user_id>', 'GET', f'/api/recommendations/{user_id}')
+
+
+async def run_load(target, sessions, concurrency, duration=None, max_sessions=None, login=True, think_time=0.0):
+    """Replay sessions with `concurrency` virtual users until duration seconds or max_sessions have passed"""
+    stats = Stats()
+    next_session = 0
+    deadline = None if duration is None else time.perf_counter() + duration
+    limit = max_sessions or (len(sessions) if duration is None else None)
+
+    async def virtual_user():
+        nonlocal next_session
+        while (deadline is None or time.perf_counter() < deadline) and (limit is None or next_session < limit):
+            user_id, steps = sessions[next_session % len(sessions)]
+            next_session += 1
+            await replay_session(target, stats, user_id, steps, login=login, think_time=think_time)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+    report = stats.report(time.perf_counter() - started)
+    report.update(concurrency=concurrency, sessions=next_session)
+    return report
+
+
+def seed_database(db, data_dir):
+    """Load the CSV exports into db, with login credentials and timestamps shifted up to now"""
+    products = pd.read_csv(os.path.join(data_dir, 'products.csv'))
+    users = pd.read_csv(os.path.join(data_dir, 'users.csv'))
+    interactions = pd.read_csv(os.path.join(data_dir, 'interactions.csv'), parse_dates=['timestamp'])
+    reviews = pd.read_csv(os.path.join(data_dir, 'reviews.csv'))
+    # Keep the log's recency profile relative to the moment the test runs
+    interactions['timestamp'] += datetime.now() - interactions['timestamp'].max()
+
+    db.products.insert_many(products.to_dict('records'))
+    db.users.insert_many([{**user, **credentials(user['user_id'])} for user in users.to_dict('records')])
+    db.interactions.insert_many([
+        {**row, 'timestamp': row['timestamp'].to_pydatetime()} for row in interactions.to_dict('records')
+    ])
+    db.reviews.insert_many(reviews.to_dict('records'))
+
+
+def inprocess_app(data_dir, uri=DEFAULT_MONGO_URI):
+    """The Flask app backed by a seeded mongomock database"""
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit('The in-process mode needs mongomock: pip install mongomock')
+    import flask_pymongo
+    import pymongo
+    from utils.HybridRecommender import core
+
+    client = mongomock.MongoClient(uri)
+    seed_database(client.get_database(), data_dir)
+
+    def connect(*args, **kwargs):
+        return client
+
+    # Every MongoClient the app opens gets the same in-memory database
+    pymongo.MongoClient = flask_pymongo.MongoClient = core.MongoClient = connect
+    os.environ['MONGO_URI'] = uri
+    # Load the model before the first request instead of in the background
+    os.environ['WARM_UP'] = 'sync'
+    from app import create_app
+    return create_app()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay logged shopping sessions against the API')
+    parser.add_argument('--url', default=None, help='Base URL of a running server; in-process when omitted')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--concurrency', default='8', help='Virtual users, or a comma-separated ramp such as 1,4,16')
+    parser.add_argument('--duration', type=float, default=None, help='Seconds per concurrency level')
+    parser.add_argument('--sessions', type=int, default=None, help='Sessions per concurrency level')
+    parser.add_argument('--session-gap', type=float, default=30, help='Minutes of inactivity that end a session')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Seconds a virtual user waits between pages')
+    parser.add_argument('--no-login', action='store_true')
+    parser.add_argument('--output', default=None, help='Also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    sessions = load_sessions(args.data_dir, args.session_gap)
+    if args.duration is None and args.sessions is None:
+        args.sessions = 200
+    app = None if args.url else inprocess_app(args.data_dir)
+
+    async def run_levels():
+        results = []
+        for concurrency in levels:
+            target = HttpTarget(args.url, concurrency) if args.url else InProcessTarget(app, concurrency)
+            try:
+                results.append(await run_load(
+                    target, sessions, concurrency, duration=args.duration, max_sessions=args.sessions,
+                    login=not args.no_login, think_time=args.think_time
+                ))
+            finally:
+                await target.close()
+        return results
+
+    report = {'target': args.url or 'in-process', 'levels': asyncio.run(run_levels())}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
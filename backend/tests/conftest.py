@@ -0,0 +1,92 @@
+"""Shared fixtures: a mongomock database seeded from data/ and apps built on it
+
+Like `loadtest.py`'s in-process mode, every MongoClient the code opens is replaced by one
+in-memory client, so the suite needs neither a MongoDB server nor network access.
+"""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, '..', 'data')
+MONGO_URI = 'mongodb://localhost:27017/ecommerce_db'
+
+# Read when the recommender package is imported: keep models and snapshots out of the repo,
+# rebuild only when a test asks, and apply changes in the request path rather than by polling
+_MODEL_DIR = tempfile.mkdtemp(prefix='recommender-tests-')
+for name, value in {
+    'CONTENT_INDEX_DIR': os.path.join(_MODEL_DIR, 'content_index'),
+    'MF_MODEL_DIR': os.path.join(_MODEL_DIR, 'als'),
+    'TRENDING_DIR': os.path.join(_MODEL_DIR, 'trending'),
+    'TENANT_SNAPSHOT_DIR': os.path.join(_MODEL_DIR, 'tenants'),
+    'REBUILD_INTERVAL': '0',
+    'REBUILD_AFTER_CHANGES': '0',
+    'CHANGE_FEED': 'off',
+}.items():
+    os.environ[name] = value
+sys.path.insert(0, BACKEND_DIR)
+
+import mongomock  # noqa: E402
+
+import loadtest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def mongo_client():
+    """One in-memory client, seeded from the CSV exports, returned for every MongoClient opened"""
+    import flask_pymongo
+    import pymongo
+    from utils.HybridRecommender import core
+
+    client = mongomock.MongoClient(MONGO_URI)
+    loadtest.seed_database(client.get_database(), DATA_DIR)
+
+    def connect(*args, **kwargs):
+        return client
+
+    with pytest.MonkeyPatch.context() as patch:
+        for module in (pymongo, flask_pymongo, core):
+            patch.setattr(module, 'MongoClient', connect)
+        yield client
+
+
+@pytest.fixture(scope='session')
+def db(mongo_client):
+    return mongo_client.get_database()
+
+
+@pytest.fixture(scope='session')
+def app(mongo_client):
+    """The API with its model loaded before the first request"""
+    from app import create_app
+    return create_app({'MONGO_URI': MONGO_URI, 'WARM_UP': 'sync'})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def frames():
+    """(interactions, products, reviews) DataFrames from the CSV exports"""
+    interactions = pd.read_csv(os.path.join(DATA_DIR, 'interactions.csv'), parse_dates=['timestamp'])
+    products = pd.read_csv(os.path.join(DATA_DIR, 'products.csv'))
+    reviews = pd.read_csv(os.path.join(DATA_DIR, 'reviews.csv'))
+    return interactions, products, reviews
+
+
+@pytest.fixture
+def recommender(frames):
+    """A HybridRecommender built from the CSV frames, without a database or files on disk"""
+    from utils.HybridRecommender.core import HybridRecommender
+
+    interactions, products, reviews = frames
+    recommender = HybridRecommender()
+    recommender.content_index_dir = None
+    recommender.trending_dir = None
+    recommender.load_frames(interactions.copy(), products.copy(), reviews.copy())
+    return recommender
@@ -0,0 +1,141 @@
+"""App factory, health and readiness, metrics, profiling and the cart/order views"""
+import importlib
+import marshal
+import time
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from conftest import MONGO_URI
+from utils import user_views
+
+
+def test_importing_app_builds_nothing():
+    module = importlib.import_module('app')
+    assert not hasattr(module, 'app')
+
+
+def test_health_and_readiness(client):
+    assert client.get('/healthz').json == {'status': 'ok'}
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    report = response.json
+    assert report['ready'] and report['error'] is None
+    assert {'imports', 'app', 'mongo_client', 'indexes', 'user_views', 'model'} <= set(report['stages'])
+
+
+def test_second_app_is_independent(app, mongo_client):
+    from app import create_app
+    other = create_app({'MONGO_URI': 'mongodb://localhost:27017/other_db', 'WARM_UP': 'sync'})
+    try:
+        assert other.extensions['recommender'] is not app.extensions['recommender']
+        assert other.extensions['catalog_cache'] is not app.extensions['catalog_cache']
+        assert other.extensions['pymongo'].db.name == 'other_db'
+        assert app.extensions['pymongo'].db.name == 'ecommerce_db'
+        assert app.extensions['recommender'].uri == MONGO_URI
+        assert other.test_client().get('/api/products').json == {'products': []}
+        assert len(app.test_client().get('/api/products').json['products']) == 500
+    finally:
+        other.extensions['recommender'].stop()
+
+
+def test_metrics_report_stages_and_requests(client):
+    assert client.get('/api/recommendations/1').status_code == 200
+    text = client.get('/metrics').data.decode()
+    assert 'recommender_stage_seconds_count{stage="db_fetch"}' in text
+    assert 'recommender_stage_seconds_count{stage="hydration"}' in text
+    assert 'recommender_strategy_seconds_count{strategy="collaborative"}' in text
+    assert 'http_request_seconds_count{endpoint="get_recommendations",method="GET",status="200"}' in text
+
+
+def test_forced_profile_is_captured(client):
+    client.delete('/api/dev/profiles')
+    assert client.get('/api/recommendations/1', headers={'X-Profile': '1'}).status_code == 200
+    profiles = client.get('/api/dev/profiles').json['profiles']
+    assert [profile['name'] for profile in profiles] == ['/api/recommendations/1']
+    profile_id = profiles[0]['profile_id']
+    assert 'function calls' in client.get(f'/api/dev/profiles/{profile_id}').data.decode()
+    # The strategies ran on the pool's threads and are part of the same profile
+    stats = marshal.loads(client.get(f'/api/dev/profiles/{profile_id}?format=pstats').data)
+    profiled = {(filename.rsplit('/', 1)[-1], function) for filename, _, function in stats}
+    assert {('collaborative.py', '_get_collaborative_scores'), ('session.py', 'get_session_scores')} <= profiled
+    assert client.get(f'/api/dev/profiles/{profile_id}?format=collapsed').status_code == 200
+    assert client.get(f'/api/dev/profiles/{profile_id}?format=nope').status_code == 400
+
+
+def test_profiling_falls_back_to_samples_when_another_profiler_runs(monkeypatch):
+    from utils.HybridRecommender import profiling
+
+    class _Busy:
+        def enable(self):
+            # What Python 3.12+ raises while another profiler is active
+            raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(profiling.cProfile, 'Profile', _Busy)
+    profiler = profiling.Profiler(interval=0.001)
+    assert profiler.run('busy', lambda: time.sleep(0.05) or 'done', force=True) == 'done'
+    [captured] = profiler.profiles()
+    assert captured.stats == {} and sum(captured.stacks.values()) > 0
+    assert 'No cProfile stats' in captured.to_text()
+
+
+def test_cart_view_follows_interactions(client, db):
+    user_id = 7
+    before = client.get(f'/api/cart_interactions/{user_id}').json['total']
+    response = client.post('/api/interactions', json={'user_id': user_id, 'product_id': 11, 'interaction_type': 'add_to_cart'})
+    assert response.status_code == 201
+    page = client.get(f'/api/cart_interactions/{user_id}?limit=1').json
+    assert page['total'] == before + 1 and page['limit'] == 1
+    assert page['cart_interactions'][0]['product_id'] == 11
+    assert page['cart_interactions'][0]['product_name'] == db.products.find_one({'product_id': 11})['product_name']
+    assert client.get(f'/api/cart_interactions/{user_id}?limit=0').json['limit'] == 1
+    assert client.get(f'/api/cart_interactions/{user_id}?limit=x').status_code == 400
+
+
+class _RacingCollection:
+    """A collection where another request inserts the user's document just before an upsert"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def update_one(self, query, update, upsert=False):
+        if upsert:
+            self.collection.insert_one({**query, 'items': [], 'count': 0})
+            raise DuplicateKeyError('E11000 duplicate key error')
+        return self.collection.update_one(query, update)
+
+
+def test_concurrent_first_interactions_both_reach_the_view(db):
+    user_id = db.carts.find_one(sort=[('user_id', -1)])['user_id'] + 1
+    product = db.products.find_one({'product_id': 13}, user_views.PRODUCT_PROJECTION)
+    user_views.record_interaction({'carts': _RacingCollection(db.carts)}, user_id, product, 'add_to_cart', datetime.utcnow())
+    view = db.carts.find_one({'user_id': user_id})
+    assert view['count'] == 1 and [item['product_id'] for item in view['items']] == [13]
+
+
+def test_cart_view_shows_current_prices(app, client):
+    user_id = 8
+    assert client.post('/api/interactions', json={'user_id': user_id, 'product_id': 12,
+                                                  'interaction_type': 'add_to_cart'}).status_code == 201
+    tenant = app.extensions['recommender']
+    state = tenant.recommender.state
+    product_df = state.product_df.copy()
+    product_df.loc[12, 'price'] = 1.25
+    tenant.recommender.update_state(product_df=product_df)
+    try:
+        [item] = client.get(f'/api/cart_interactions/{user_id}?limit=1').json['cart_interactions']
+        assert item['product_id'] == 12 and item['price'] == 1.25
+    finally:
+        tenant.recommender.update_state(product_df=state.product_df)
+
+
+def test_asgi_rejects_malformed_json_bodies():
+    from starlette.testclient import TestClient
+
+    import asgi
+    # Without the context manager the startup hook, and with it the database, is never touched
+    client = TestClient(asgi.app)
+    for path in ('/api/login', '/api/interactions'):
+        for body in ('{"user_id": 1,', '[1, 2]'):
+            response = client.post(path, content=body, headers={'Content-Type': 'application/json'})
+            assert response.status_code == 400 and 'error' in response.json()
@@ -0,0 +1,105 @@
+"""Request coalescing"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.HybridRecommender import interface
+from utils.HybridRecommender.coalesce import SingleFlight
+from utils.HybridRecommender.metrics import SINGLE_FLIGHT_CALLS
+
+
+def _concurrently(count, func):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(func())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.2)
+        return [1, 2, 3]
+
+    shared_before = SINGLE_FLIGHT_CALLS.value(operation='test', outcome='shared')
+    results, errors = _concurrently(8, lambda: flight.do('test', 'key', compute))
+    assert not errors and len(runs) == 1
+    assert results == [[1, 2, 3]] * 8
+    # Every caller gets its own copy
+    assert len({id(result) for result in results}) == 8
+    assert SINGLE_FLIGHT_CALLS.value(operation='test', outcome='shared') - shared_before == 7
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError('down')
+
+    results, errors = _concurrently(4, lambda: flight.do('test', 'failing', fail))
+    assert not results and len(errors) == 4
+
+
+def test_finished_calls_are_not_reused_in_process():
+    flight = SingleFlight()
+    counter = iter(range(10))
+    assert flight.do('test', 'key', lambda: next(counter)) == 0
+    assert flight.do('test', 'key', lambda: next(counter)) == 1
+
+
+def test_processes_share_results_through_the_store(tmp_path):
+    pytest.importorskip('fcntl')
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    assert first.do('test', 'key', lambda: 'computed', shared=True) == 'computed'
+    assert second.do('test', 'key', lambda: 'again', shared=True) == 'computed'
+    # Unshared calls and other keys never read the store
+    assert second.do('test', 'key', lambda: 'again') == 'again'
+    assert second.do('test', 'other', lambda: 'other', shared=True) == 'other'
+
+
+def test_stored_results_expire(tmp_path):
+    pytest.importorskip('fcntl')
+    first, second = SingleFlight(str(tmp_path), store_ttl=0.05), SingleFlight(str(tmp_path), store_ttl=0.05)
+    first.do('test', 'key', lambda: 'old', shared=True)
+    time.sleep(0.1)
+    assert second.do('test', 'key', lambda: 'new', shared=True) == 'new'
+
+
+
+class _Recommender:
+    """Just what the coalescing key reads from a HybridRecommender"""
+
+    def __init__(self, uri, version):
+        self.mongo_uri = uri
+        self.db = SimpleNamespace(name='shop')
+        self.state = SimpleNamespace(version=version, catalog=SimpleNamespace(version='c0ffee'))
+
+
+def test_shared_keys_name_the_data_source(tmp_path, monkeypatch):
+    pytest.importorskip('fcntl')
+    monkeypatch.setattr(interface, 'COALESCER', SingleFlight(str(tmp_path)))
+    runs = []
+    strategy = interface._coalesced('test', lambda self, location: runs.append(self) or len(runs), shared=True)
+    assert strategy(_Recommender('mongodb://a/shop', 1), 'Delhi') == 1
+    # Same database name and version number on another cluster: computed again
+    assert strategy(_Recommender('mongodb://b/shop', 1), 'Delhi') == 2
+    # Another process's version number for the same data: read from the store
+    assert strategy(_Recommender('mongodb://a/shop', 7), 'Delhi') == 1
+    assert len(runs) == 2
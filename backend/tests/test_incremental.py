@@ -0,0 +1,80 @@
+"""Change batches applied to a built model match a full rebuild"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.HybridRecommender.core import HybridRecommender
+from utils.HybridRecommender.incremental import ChangeBatch, interaction_weights
+
+
+def _built(interactions, products, reviews):
+    recommender = HybridRecommender()
+    recommender.content_index_dir = None
+    recommender.trending_dir = None
+    recommender.load_frames(interactions.copy(), products.copy(), reviews.copy())
+    return recommender
+
+
+def _documents(frame):
+    return frame.to_dict('records')
+
+
+def _assert_matches_rebuild(recommender, interactions, reviews):
+    expected, negative = interaction_weights(interactions.copy(), reviews.copy())
+    actual = recommender.user_item_matrix
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_names=False)
+    assert recommender.state.negative_weights.sort_index().equals(negative.sort_index())
+
+
+def test_batches_match_a_full_rebuild(frames):
+    interactions, products, reviews = frames
+    base_interactions, new_interactions = interactions.iloc[:-300], interactions.iloc[-300:]
+    base_reviews, new_reviews = reviews.iloc[:-50], reviews.iloc[-50:]
+    recommender = _built(base_interactions, products, base_reviews)
+
+    view = pd.DataFrame([{'user_id': 1, 'product_id': 10, 'interaction_type': 'view',
+                          'timestamp': interactions['timestamp'].max()}])
+    one_star = pd.DataFrame([{'user_id': 1, 'product_id': 10, 'rating': 1, 'review_text': 'Broke in a day.'}])
+    # The view and the review arrive in separate batches, as they would from the change feed
+    recommender.apply_changes(ChangeBatch(interactions=_documents(pd.concat([new_interactions, view]))))
+    assert recommender.user_item_matrix.loc[1, 10] == 1.0
+    recommender.apply_changes(ChangeBatch(reviews=_documents(pd.concat([new_reviews, one_star]))))
+    assert recommender.user_item_matrix.loc[1, 10] == 0
+
+    interactions = pd.concat([interactions, view], ignore_index=True)
+    reviews = pd.concat([reviews, one_star], ignore_index=True)
+    _assert_matches_rebuild(recommender, interactions, reviews)
+
+    # The review left the pair at -2; another view raises it to -1, which still clips to 0
+    recommender.apply_changes(ChangeBatch(interactions=_documents(view)))
+    assert recommender.user_item_matrix.loc[1, 10] == 0
+    _assert_matches_rebuild(recommender, pd.concat([interactions, view], ignore_index=True), reviews)
+
+
+def test_deleted_products_drop_their_negative_weights(frames):
+    interactions, products, reviews = frames
+    recommender = _built(interactions, products, reviews)
+    one_star = {'user_id': 1, 'product_id': 10, 'rating': 1, 'review_text': 'Broke in a day.'}
+    recommender.apply_changes(ChangeBatch(reviews=[one_star]))
+    assert (1, 10) in recommender.state.negative_weights.index
+    recommender.apply_changes(ChangeBatch(deleted_products={10}))
+    assert (1, 10) not in recommender.state.negative_weights.index
+
+
+def test_batches_for_known_users_do_not_copy_the_matrix(frames):
+    interactions, products, reviews = frames
+    recommender = _built(interactions, products, reviews)
+    view = {'user_id': 1, 'product_id': 10, 'interaction_type': 'view'}
+    # The first batch converts the pivot's dtype; later ones write into the same array
+    recommender.apply_changes(ChangeBatch(interactions=[view]))
+    before = recommender.user_item_matrix
+    weight = before.loc[1, 10]
+    recommender.apply_changes(ChangeBatch(interactions=[view]))
+    after = recommender.user_item_matrix
+    assert after is not before and np.shares_memory(after.to_numpy(), before.to_numpy())
+    assert after.loc[1, 10] == weight + 1
+
+    # A batch that fails part way leaves the weights alone
+    with pytest.raises(KeyError):
+        recommender.apply_changes(ChangeBatch(interactions=[view], products={99: {'product_name': 'No id'}}))
+    assert recommender.user_item_matrix.loc[1, 10] == weight + 1
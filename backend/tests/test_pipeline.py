@@ -0,0 +1,221 @@
+"""Loading, archiving and change capture of interactions, tenants, the strategy executor and evaluation"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+import pandas as pd
+import pytest
+
+import loadtest
+from conftest import DATA_DIR, MONGO_URI
+from utils.HybridRecommender.archive import InteractionArchive, export_interactions
+from utils.HybridRecommender.changefeed import ChangeFeed, PollingSource
+from utils.HybridRecommender.evaluation import evaluate
+from utils.HybridRecommender.executor import StrategyExecutor
+from utils.HybridRecommender.loader import INTERACTION_TYPES, load_interactions
+from utils.HybridRecommender.tenants import Tenant, TenantRegistry
+
+
+@pytest.fixture
+def small_db():
+    """A fresh database holding a handful of interactions a minute apart"""
+    db = mongomock.MongoClient().get_database('small')
+    start = datetime(2024, 1, 31, 23, 58)
+    db.interactions.insert_many([
+        {'user_id': 1 + i % 2, 'product_id': 10 + i, 'interaction_type': INTERACTION_TYPES[i % 3],
+         'timestamp': start + timedelta(minutes=i)}
+        for i in range(6)
+    ])
+    return db
+
+
+def test_load_interactions_into_arrays(small_db):
+    interactions = load_interactions(small_db.interactions, with_ids=True)
+    assert len(interactions) == 6
+    assert interactions.product_ids.tolist() == list(range(10, 16))
+    assert interactions.type_codes.tolist() == [0, 1, 2, 0, 1, 2]
+    assert len(set(interactions.id_keys())) == 6
+    frame = interactions.to_frame()
+    assert frame['interaction_type'].tolist()[:3] == ['view', 'add_to_cart', 'purchase']
+    later = load_interactions(small_db.interactions, {'timestamp': {'$gt': datetime(2024, 2, 1, 0, 1)}})
+    assert later.product_ids.tolist() == [14, 15]
+
+
+def test_archive_round_trip_and_watermark(small_db, tmp_path):
+    archive = InteractionArchive(str(tmp_path))
+    assert archive.watermark() is None
+    assert export_interactions(small_db, archive, now=datetime(2024, 2, 1, 0, 6)) == 4
+    assert archive.watermark() == datetime(2024, 2, 1, 0, 1)
+    # A repeated export adds nothing already archived
+    assert export_interactions(small_db, archive, now=datetime(2024, 2, 1, 0, 6)) == 0
+    assert export_interactions(small_db, archive, now=datetime(2024, 2, 2)) == 2
+    # The rows spill over a month boundary, so two month partitions exist
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_dir()) == ['month=2024-01', 'month=2024-02']
+
+    everything = archive.read()
+    assert sorted(everything.product_ids.tolist()) == list(range(10, 16))
+    assert everything.type_codes.tolist() == [0, 1, 2, 0, 1, 2]
+    january = archive.read(end=datetime(2024, 2, 1), columns=['product_id'])
+    assert january.product_ids.tolist() == [10, 11]
+
+
+def test_polling_source_reports_new_documents(small_db):
+    source = PollingSource(small_db, interval=0, deletion_scan_every=1).open()
+    assert source.poll() == []
+    small_db.interactions.insert_one({'user_id': 3, 'product_id': 20, 'interaction_type': 'view',
+                                      'timestamp': datetime(2024, 2, 2)})
+    small_db.products.insert_one({'product_id': 99, 'product_name': 'New'})
+    events = source.poll()
+    assert [(collection, operation) for collection, operation, _ in events] == [
+        ('interactions', 'insert'), ('products', 'insert')
+    ]
+    small_db.products.delete_one({'product_id': 99})
+    assert [event[:2] for event in source.poll()] == [('products', 'delete')]
+    # Edits are only seen through updated_at
+    small_db.products.insert_one({'product_id': 98, 'product_name': 'Old'})
+    assert [event[:2] for event in source.poll()] == [('products', 'insert')]
+    small_db.products.update_one({'product_id': 98}, {'$set': {'product_name': 'Renamed'}})
+    assert source.poll() == []
+    small_db.products.update_one({'product_id': 98}, {'$set': {'price': 5.0, 'updated_at': datetime.utcnow()}})
+    [(collection, operation, document)] = source.poll()
+    assert (collection, operation) == ('products', 'update') and document['product_name'] == 'Renamed'
+
+
+def test_change_feed_batches(recommender):
+    feed = ChangeFeed(recommender)
+    batch = feed._to_batch([
+        ('interactions', 'insert', {'user_id': 1, 'product_id': 2, 'interaction_type': 'view'}),
+        ('products', 'update', {'product_id': 5, 'product_name': 'Renamed'}),
+        ('products', 'delete', {'product_id': 6}),
+        ('reviews', 'delete', {'_id': 'x'}),
+    ])
+    assert len(batch.interactions) == 1 and list(batch.products) == [5]
+    assert batch.deleted_products == {6} and batch.needs_rebuild
+
+    recommender.apply_changes(batch)
+    assert recommender.product_df.loc[5, 'product_name'] == 'Renamed'
+    assert 6 not in recommender.product_df.index
+    assert 6 not in recommender.user_item_matrix.columns
+
+
+def test_tenants_are_evicted_to_snapshots_and_reloaded(recommender, mongo_client, tmp_path):
+    default = Tenant('default', recommender=recommender)
+    registry = TenantRegistry(default, uris={'north': MONGO_URI, 'south': MONGO_URI}, memory_budget=1,
+                              snapshot_dir=str(tmp_path))
+    try:
+        north = registry.get('north')
+        assert north.loaded_from == 'database'
+        registry.get('south')
+        # Over budget: the least recently used tenant other than the default goes to disk
+        assert registry.evictions == 1
+        registry.wait_for_evictions()
+        assert (tmp_path / 'north' / 'state.pkl').exists()
+        stats = registry.stats()
+        assert not stats['tenants']['north']['loaded'] and stats['tenants']['south']['loaded']
+
+        reloaded = registry.get('north')
+        assert reloaded is not north and reloaded.loaded_from == 'snapshot'
+        assert reloaded.recommender.product_df.equals(north.recommender.product_df)
+        assert registry.get() is default
+        with pytest.raises(KeyError):
+            registry.get('west')
+    finally:
+        for tenant in registry.loaded():
+            if tenant is not default:
+                tenant.stop()
+
+
+def test_evicted_tenants_stay_open_for_calls_in_flight(recommender, mongo_client, tmp_path):
+    default = Tenant('default', recommender=recommender)
+    registry = TenantRegistry(default, uris={'north': MONGO_URI}, snapshot_dir=str(tmp_path))
+    north = registry.get('north')
+    closed = threading.Event()
+    north.close = closed.set
+    entered, release = threading.Event(), threading.Event()
+
+    def slow():
+        entered.set()
+        release.wait(5)
+        return north.recommender.state.version
+
+    caller = threading.Thread(target=north.call, args=(slow,))
+    caller.start()
+    entered.wait(5)
+    assert registry.evict('north')
+    # The snapshot is written, but the client stays open while the call runs
+    for _ in range(100):
+        if (tmp_path / 'north' / 'state.pkl').exists():
+            break
+        time.sleep(0.05)
+    assert (tmp_path / 'north' / 'state.pkl').exists()
+    assert not closed.wait(0.2)
+    release.set()
+    caller.join(5)
+    registry.wait_for_evictions(5)
+    assert closed.is_set()
+    north.recommender.mongo.close()
+
+
+def test_executor_drops_slow_and_failing_strategies():
+    executor = StrategyExecutor(default_timeout=0.2)
+    release = threading.Event()
+
+    def fail():
+        raise RuntimeError('boom')
+
+    try:
+        results = executor.run({'fast': lambda: 1, 'slow': lambda: release.wait(5), 'broken': fail})
+    finally:
+        release.set()
+    assert results == {'fast': 1}
+
+
+def test_executor_runs_strategies_concurrently():
+    executor = StrategyExecutor()
+    started = time.perf_counter()
+    results = executor.run({name: lambda name=name: time.sleep(0.2) or name for name in 'abcd'})
+    assert results == {name: name for name in 'abcd'}
+    assert time.perf_counter() - started < 0.6
+
+
+def test_executor_deadlines_start_when_a_strategy_does():
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        executor = StrategyExecutor(pool, default_timeout=0.4)
+        # b waits 0.3s for the only worker, then runs well within its own 0.4s
+        results = executor.run({'a': lambda: time.sleep(0.3) or 'a', 'b': lambda: time.sleep(0.2) or 'b'})
+        assert results == {'a': 'a', 'b': 'b'}
+    finally:
+        pool.shutdown()
+
+
+def test_executor_cancels_strategies_still_queued_at_their_deadline():
+    pool = ThreadPoolExecutor(max_workers=1)
+    release, ran = threading.Event(), []
+    try:
+        pool.submit(release.wait, 5)
+        assert StrategyExecutor(pool, default_timeout=0.1).run({'queued': lambda: ran.append(1)}) == {}
+    finally:
+        release.set()
+        pool.shutdown()
+    assert not ran
+
+
+def test_load_sessions_split_on_inactivity():
+    sessions = loadtest.load_sessions(DATA_DIR, session_gap=30)
+    interactions = pd.read_csv(f'{DATA_DIR}/interactions.csv')
+    assert sum(len(steps) for _, steps in sessions) == len(interactions)
+    assert all(steps for _, steps in sessions)
+
+
+def test_offline_evaluation(frames):
+    interactions, products, _ = frames
+    # The busiest users only, to keep the run short
+    users = interactions['user_id'].value_counts().index[:100]
+    interactions = interactions[interactions['user_id'].isin(users)]
+    report = evaluate(interactions.copy(), products.copy(), k=10, split='last', workers=2)
+    assert report['users_evaluated'] == 100 and report['users_skipped_cold'] == 0
+    assert 0 <= report['ndcg@10'] <= 1 and 0 < report['catalog_coverage'] <= 1
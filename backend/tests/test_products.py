@@ -0,0 +1,103 @@
+"""Catalog routes: ETags and conditional GETs, and the multi-get endpoint"""
+import pytest
+
+
+def test_products_answer_conditional_requests(client):
+    response = client.get('/api/products')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'public, max-age=300'
+    assert response.headers['Last-Modified']
+
+    not_modified = client.get('/api/products', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304 and not not_modified.data
+    assert not_modified.headers['ETag'] == etag
+    assert client.get('/api/products', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_repeat_requests_are_served_from_cached_bytes(app, client):
+    cache = app.extensions['catalog_cache']
+    client.get('/api/products/search?category=Books')
+    hits = cache.stats()['hits']
+    response = client.get('/api/products/search?category=Books')
+    assert cache.stats()['hits'] == hits + 1
+    assert response.headers['Cache-Control'] == 'public, max-age=60'
+    assert all(product['category'] == 'Books' for product in response.json['products'])
+
+
+def test_catalog_change_moves_the_etag(app, client):
+    tenant = app.extensions['recommender']
+    etag = client.get('/api/products').headers['ETag']
+    state = tenant.recommender.state
+    product_df = state.product_df.copy()
+    product_df.loc[1, 'price'] = 1.0
+    tenant.recommender.update_state(product_df=product_df)
+    try:
+        response = client.get('/api/products', headers={'If-None-Match': etag})
+        assert response.status_code == 200 and response.headers['ETag'] != etag
+    finally:
+        tenant.recommender.update_state(product_df=state.product_df)
+    assert client.get('/api/products').headers['ETag'] == etag
+
+
+def test_product_detail_revalidates_on_new_reviews(client):
+    response = client.get('/api/products/3')
+    assert response.headers['Cache-Control'] == 'public, no-cache'
+    assert 'Last-Modified' not in response.headers
+    etag = response.headers['ETag']
+    assert client.get('/api/products/3', headers={'If-None-Match': etag}).status_code == 304
+
+    assert client.post('/api/reviews', json={'user_id': 1, 'product_id': 3, 'rating': 5}).status_code == 201
+    response = client.get('/api/products/3', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.json['rating_count'] >= 1
+
+
+def test_unknown_product_is_not_found(client):
+    assert client.get('/api/products/100000').status_code == 404
+    assert client.get('/api/products/abc').status_code == 404
+
+
+def test_batch_returns_products_in_request_order(client):
+    response = client.post('/api/products/batch', json={'ids': [5, 100000, 2, 5]})
+    assert response.status_code == 200
+    assert [product['product_id'] for product in response.json['products']] == [5, 2, 5]
+    assert response.json['missing'] == [100000]
+    assert client.get('/api/products/batch?ids=5,2').json['products'][1]['product_id'] == 2
+    assert client.post('/api/products/batch', json={'ids': ['5']}).json['products'][0]['product_id'] == 5
+    assert client.get('/api/products/batch?ids=5,-2').status_code == 400
+
+
+def test_batch_selects_fields(client):
+    products = client.get('/api/products/batch?ids=1,2&fields=price').json['products']
+    assert [sorted(product) for product in products] == [['price', 'product_id']] * 2
+
+
+def test_batch_matches_the_detail_route(client):
+    # Product 8 averages 17/6, which is not exact as a float32
+    detail = client.get('/api/products/8').json
+    [batched] = client.post('/api/products/batch', json={'ids': [8]}).json['products']
+    assert batched['avg_rating'] == 2.83
+    for field in ('product_name', 'price', 'category', 'brand', 'avg_rating', 'rating_count'):
+        assert batched[field] == detail[field]
+
+
+@pytest.mark.parametrize('body', [
+    {'ids': []},
+    {'ids': list(range(101))},
+    {'ids': ['x']},
+    {'ids': [True]},
+    {'ids': [1.7]},
+    {'ids': ['1.7']},
+    {'ids': [None]},
+    {'ids': [1], 'fields': ['password']},
+    {'ids': [1], 'fields': 'price'},
+])
+def test_batch_rejects_bad_requests(client, body):
+    assert client.post('/api/products/batch', json=body).status_code == 400
+
+
+@pytest.mark.parametrize('body', [[1, 2], {'ids': '12'}, {'ids': 12}])
+def test_batch_rejects_bodies_of_the_wrong_shape(client, body):
+    response = client.post('/api/products/batch', json=body)
+    assert response.status_code == 400 and response.json['error']
@@ -0,0 +1,68 @@
+"""Top-k kernels and the diversity stage"""
+from collections import Counter
+
+import numpy as np
+
+from utils.HybridRecommender.diversity import diversify
+from utils.HybridRecommender.ranking import Candidates, group_top_k, masked_top_k, merge_by_source, top_k
+
+
+def test_top_k_matches_a_full_sort_and_keeps_ties_in_order():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 20, size=1000).astype(np.float32)
+    expected = np.lexsort((np.arange(len(scores)), -scores))[:25]
+    assert np.array_equal(top_k(scores, 25), expected)
+    assert np.array_equal(top_k(scores, 5000), np.lexsort((np.arange(len(scores)), -scores)))
+    assert len(top_k(scores, 0)) == 0
+
+
+def test_masked_top_k():
+    scores = np.array([5, 4, 3, 2, 1, 0], dtype=np.float32)
+    exclude = np.array([True, False, False, False, False, False])
+    assert masked_top_k(scores, 3, exclude=exclude).tolist() == [1, 2, 3]
+    assert masked_top_k(scores, 10, min_score=2).tolist() == [0, 1, 2]
+
+
+def test_candidates_from_positions_sums_repeats_and_drops_unknown():
+    candidates = Candidates.from_positions(np.array([3, 1, 3, -1]), np.array([1.0, 1.5, 1.0, 9.0]), 5)
+    assert candidates.positions.tolist() == [3, 1]
+    assert candidates.scores.tolist() == [2.0, 1.5]
+    assert candidates.normalized().scores.tolist() == [1.0, 0.75]
+
+
+def test_merge_by_source_takes_a_quota_from_each_source():
+    first = Candidates([1, 2, 3], [3, 2, 1])
+    second = Candidates([2, 4, 5], [3, 2, 1])
+    positions, _, sources = merge_by_source([first, None, second], quota=2)
+    assert positions.tolist() == [1, 2, 4, 5]
+    assert sources.tolist() == [0, 0, 2, 2]
+
+
+def test_group_top_k():
+    scores = np.array([1, 5, 3, 4, 2, np.nan], dtype=np.float32)
+    groups = np.array([0, 0, 1, 1, 1, 0])
+    assert group_top_k(scores, groups, [1, 2]).tolist() == [1, 3, 2]
+
+
+def test_diversify_respects_caps(recommender):
+    catalog = recommender.catalog
+    positions = np.arange(len(catalog))
+    scores = np.linspace(1, 0, len(catalog), dtype=np.float32)
+    # Seven categories and ten brands: each cap alone still leaves enough items for 20
+    chosen = positions[diversify(positions, scores, catalog, 20, category_cap=3)]
+    assert len(set(chosen)) == 20
+    assert max(Counter(recommender.product_df['category'].iloc[chosen]).values()) <= 3
+    chosen = positions[diversify(positions, scores, catalog, 20, diversity=0, brand_cap=2)]
+    assert max(Counter(recommender.product_df['brand'].iloc[chosen]).values()) <= 2
+
+
+def test_diversify_without_diversity_keeps_relevance_order(recommender):
+    scores = np.array([0.1, 0.9, 0.5], dtype=np.float32)
+    assert diversify(np.array([4, 5, 6]), scores, recommender.catalog, 3, diversity=0).tolist() == [1, 2, 0]
+
+
+def test_diversify_fills_the_list_once_caps_run_out(recommender):
+    catalog = recommender.catalog
+    books = np.flatnonzero(catalog.category_codes == catalog.category_codes[0])[:10]
+    scores = np.ones(len(books), dtype=np.float32)
+    assert len(diversify(books, scores, catalog, 10, category_cap=3)) == 10
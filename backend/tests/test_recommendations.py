@@ -0,0 +1,173 @@
+"""Recommendation, similar-product and trending routes, and the strategies behind them"""
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.HybridRecommender.filters import Filters
+from utils.HybridRecommender.ranking import Candidates
+from utils.HybridRecommender.rerank import PriorityMerge, WeightedBlend
+from utils.HybridRecommender.session import SessionIndex, get_session_scores
+
+
+def test_recommendations_for_returning_user(client):
+    recommendations = client.get('/api/recommendations/1').json['recommendations']
+    assert len(recommendations) == 20
+    assert len({item['product_id'] for item in recommendations}) == 20
+    assert {item['recommendation_category'] for item in recommendations} <= {
+        'session', 'collaborative', 'recency', 'content', 'trending'
+    }
+
+
+def test_recommendations_are_deterministic(client):
+    first = client.get('/api/recommendations/2').json
+    assert client.get('/api/recommendations/2').json == first
+
+
+def test_filtered_recommendations_match_the_filters(client):
+    recommendations = client.get('/api/recommendations/1?category=Books&max_price=100').json['recommendations']
+    assert recommendations
+    assert all(item['category'] == 'Books' and item['price'] <= 100 for item in recommendations)
+    assert client.get('/api/recommendations/1?min_price=cheap').status_code == 400
+
+
+def test_filtered_recommendations_for_a_new_user_are_topped_up(client, db):
+    db.users.insert_one({'user_id': 100001, 'age': 30, 'gender': 'Female', 'location': 'Bangalore'})
+    try:
+        # 20 clothing items cost up to 200, but Bangalore users have interacted with only 17 of them
+        response = client.get('/api/recommendations/100001?category=Clothing&max_price=200')
+    finally:
+        db.users.delete_one({'user_id': 100001})
+    recommendations = response.json['recommendations']
+    assert len(recommendations) == 20
+    assert all(item['category'] == 'Clothing' and item['price'] <= 200 for item in recommendations)
+    assert {item['recommendation_category'] for item in recommendations} == {'demographic', 'trending'}
+
+
+def test_filters_mask(recommender):
+    catalog = recommender.catalog
+    mask = Filters(category='Books', min_price=50, max_price=150).mask(catalog)
+    products = recommender.product_df
+    expected = (products['category'] == 'Books') & products['price'].between(50, 150)
+    assert np.array_equal(mask, expected.to_numpy())
+    assert Filters().mask(catalog) is None
+    assert Filters(category='Books') == Filters.from_args({'category': 'Books', 'min_price': ''})
+
+
+def test_similar_products(client, db):
+    similar = client.get('/api/products/1/similar?k=5').json['products']
+    assert len(similar) == 5
+    assert '1' not in {item['product_id'] for item in similar}
+    scores = [item['score'] for item in similar]
+    assert scores == sorted(scores, reverse=True)
+    assert client.get('/api/products/x/similar').status_code == 400
+
+
+def test_content_index_is_persisted(frames, tmp_path):
+    from utils.HybridRecommender.content import load_or_build_index
+
+    products = frames[1].set_index('product_id')
+    built = load_or_build_index(products, str(tmp_path))
+    loaded = load_or_build_index(products, str(tmp_path))
+    assert np.array_equal(built.similar_to([1], 5)[0], loaded.similar_to([1], 5)[0])
+
+
+def test_trending(client):
+    trending = client.get('/api/trending?k=10').json['products']
+    assert len(trending) == 10
+    books = client.get('/api/trending?k=5&category=Books').json['products']
+    assert books and all(item['category'] == 'Books' for item in books)
+    assert client.get('/api/trending?k=0').status_code == 400
+    assert client.get('/api/trending?k=-3').status_code == 400
+
+
+def test_trending_counter_decays_older_interactions():
+    from utils.HybridRecommender.trending import TrendingCounter
+
+    counter = TrendingCounter(half_life_hours=1)
+    now = np.datetime64('2024-01-02T00:00:00')
+    # Product 1 has more interactions, but they are ten half-lives old
+    counter.add([1, 1, 1, 2], [None] * 4, [None] * 4, [0, 0, 0, 0],
+                [now - np.timedelta64(10, 'h')] * 3 + [now])
+    product_ids, scores = counter.top(2)
+    assert product_ids.tolist() == [2, 1]
+    assert scores[0] == 1.0
+    for k in (0, -3):
+        product_ids, scores = counter.top(k)
+        assert len(product_ids) == 0 and len(scores) == 0
+
+
+def test_session_scores_follow_transitions(recommender):
+    now = datetime(2024, 6, 1, 12)
+    log = pd.DataFrame({
+        'user_id': [1, 1, 2, 2, 3],
+        'product_id': [10, 20, 10, 20, 10],
+        'interaction_type': ['view'] * 5,
+        'timestamp': [now - timedelta(days=2), now - timedelta(days=2) + timedelta(minutes=1),
+                      now - timedelta(days=1), now - timedelta(days=1) + timedelta(minutes=1),
+                      now - timedelta(minutes=5)],
+    })
+    sessions = SessionIndex.from_interactions(log)
+    assert sessions.live_session(3, now) == [10]
+    assert sessions.live_session(1, now) == []
+    recommender.update_state(sessions=sessions)
+    candidates = get_session_scores(recommender, 3, now=now)
+    assert recommender.product_df.index[candidates.positions].tolist() == [20]
+
+    updated = sessions.updated([{'user_id': 3, 'product_id': 30, 'interaction_type': 'view', 'timestamp': now}])
+    assert updated.live_session(3, now) == [10, 30]
+    assert sessions.live_session(3, now) == [10]
+
+
+@pytest.mark.parametrize('reranker', [WeightedBlend(), PriorityMerge()])
+def test_rerankers_merge_sources_without_duplicates(recommender, reranker):
+    candidates = {
+        'collaborative': Candidates([1, 2, 3], [3.0, 2.0, 1.0]),
+        'recency': Candidates([3, 4], [2.0, 1.0]),
+    }
+    positions, scores, sources = reranker.rerank(recommender, candidates, 4)
+    assert sorted(positions.tolist()) == [1, 2, 3, 4]
+    assert list(scores) == sorted(scores, reverse=True)
+    assert set(sources) <= {'collaborative', 'recency'}
+
+
+def test_als_folds_in_new_users_without_changing_the_model(recommender, frames):
+    from utils.HybridRecommender.factorization import ALSModel
+
+    interactions, _, _ = frames
+    user_id = int(interactions['user_id'].iloc[0])
+    trained_on = recommender.user_item_matrix.drop(index=user_id)
+    model = ALSModel.train(trained_on, factors=8, iterations=2, workers=1, seed=0)
+    recommender.mf_model = model
+    factors = model.user_factors
+
+    with recommender.pinned():
+        first = recommender._get_als_scores(user_id, 10)
+        again = recommender._get_als_scores(user_id, 10)
+    assert len(first.positions) == 10 and first.positions.tolist() == again.positions.tolist()
+    assert model.user_vector(user_id) is None and model.user_factors is factors
+    assert len(recommender.state.fold_ins) == 1
+    # A new version starts with no fold-ins, since its matrix rows may differ
+    recommender.update_state(sessions=recommender.state.sessions)
+    assert len(recommender.state.fold_ins) == 0
+
+
+def test_scoring_stage_excludes_strategy_time(recommender, frames, monkeypatch):
+    from utils.HybridRecommender.metrics import STAGE_SECONDS, STRATEGY_SECONDS
+
+    interactions, _, _ = frames
+    recent = interactions[interactions['user_id'] == 1].to_dict('records')
+    now = interactions['timestamp'].max()
+    recency = recommender._recency_from_interactions
+
+    def slow_recency(*args, **kwargs):
+        time.sleep(0.2)
+        return recency(*args, **kwargs)
+
+    monkeypatch.setattr(recommender, '_recency_from_interactions', slow_recency)
+    scoring, recency_seconds = STAGE_SECONDS.total(stage='scoring')[0], STRATEGY_SECONDS.total(strategy='recency')[0]
+    assert len(recommender.score_user(1, 20, None, True, recent, now)) == 20
+    assert STRATEGY_SECONDS.total(strategy='recency')[0] - recency_seconds >= 0.2
+    assert STAGE_SECONDS.total(stage='scoring')[0] - scoring < 0.1
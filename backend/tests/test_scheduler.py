@@ -0,0 +1,116 @@
+"""Background model rebuilds"""
+import time
+
+from utils.HybridRecommender import scheduler as scheduler_module
+from utils.HybridRecommender.scheduler import RebuildScheduler
+
+
+class _State:
+    version = 1
+    build_seconds = 0.0
+
+    def age(self):
+        return 3600.0
+
+
+class _Recommender:
+    """Stands in for HybridRecommender: a model older than any interval whose rebuilds fail until told not to"""
+
+    def __init__(self):
+        self.state = _State()
+        self.attempts = 0
+        self.failing = True
+
+    def refresh(self):
+        self.attempts += 1
+        if self.failing:
+            raise ConnectionError('MongoDB unreachable')
+        return self.state
+
+    def model_status(self):
+        return {'version': self.state.version}
+
+
+def test_failed_rebuilds_back_off(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'RETRY_AFTER_SECONDS', 0.05)
+    recommender = _Recommender()
+    scheduler = RebuildScheduler(recommender, interval=60).start()
+    try:
+        time.sleep(0.5)
+        # Retries after 0.05, 0.1 and 0.2s, instead of one attempt after another
+        assert 2 <= recommender.attempts <= 5
+        status = scheduler.status()
+        assert status['failures'] == recommender.attempts
+        assert status['last_error'] == 'MongoDB unreachable'
+        assert 0 < status['retry_in_seconds'] <= 0.8
+    finally:
+        scheduler.stop(1)
+
+
+def test_backoff_is_capped_by_the_interval_and_reset_by_a_build():
+    recommender = _Recommender()
+    scheduler = RebuildScheduler(recommender, interval=5)
+    for _ in range(6):
+        scheduler.rebuild('interval')
+    assert scheduler.failures == 6 and scheduler.retry_delay() == 5
+
+    recommender.failing = False
+    assert scheduler.rebuild('manual')
+    status = scheduler.status()
+    assert status['failures'] == 0 and status['last_error'] is None and status['retry_in_seconds'] is None
+    assert status['last_trigger'] == 'manual'
+
+
+def test_manual_request_skips_the_backoff():
+    recommender = _Recommender()
+    scheduler = RebuildScheduler(recommender, interval=60)
+    scheduler.rebuild('interval')
+    assert scheduler._next_trigger() is None
+    scheduler.request_rebuild()
+    assert scheduler._next_trigger() == 'manual'
+
+
+def test_change_threshold_triggers_a_rebuild():
+    recommender = _Recommender()
+    recommender.failing = False
+    scheduler = RebuildScheduler(recommender, interval=0, change_threshold=3)
+    scheduler.notify_change(2)
+    assert scheduler._next_trigger() is None
+    scheduler.notify_change()
+    assert scheduler._next_trigger() == 'changes'
+    assert scheduler.rebuild('changes') and scheduler.pending_changes == 0
+
+
+def test_failed_builds_are_retried_without_an_interval(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'RETRY_AFTER_SECONDS', 0.05)
+    recommender = _Recommender()
+    scheduler = RebuildScheduler(recommender, interval=0, change_threshold=3)
+    scheduler.notify_change(3)
+    assert not scheduler.rebuild(scheduler._next_trigger())
+    # The changes the build was for are still pending, and wait out the backoff
+    assert scheduler.pending_changes == 3 and scheduler._next_trigger() is None
+    time.sleep(0.06)
+    assert scheduler._next_trigger() == 'changes'
+
+    recommender.failing = False
+    assert scheduler.rebuild('changes') and scheduler.pending_changes == 0
+    assert scheduler._next_trigger() is None
+
+
+def test_failed_manual_rebuild_is_retried_after_the_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'RETRY_AFTER_SECONDS', 0.05)
+    recommender = _Recommender()
+    scheduler = RebuildScheduler(recommender, interval=0, change_threshold=0).start()
+    try:
+        scheduler.request_rebuild()
+        time.sleep(0.3)
+        assert recommender.attempts >= 2
+        recommender.failing = False
+        # The next retry is at most 0.4s away
+        time.sleep(1.0)
+        assert scheduler.status()['failures'] == 0 and scheduler.last_trigger == 'retry'
+        attempts = recommender.attempts
+        time.sleep(0.1)
+        assert recommender.attempts == attempts
+    finally:
+        scheduler.stop(1)
@@ -1,4 +1,9 @@
 """HybridRecommender package initialization"""
-from .interface import init_app, recommend, add_recommender_interaction, get_demographic_recommendations, get_recency_scores, get_collaborative_scores, get_context_recommendations
+from .interface import init_app, init_async_app, recommend, recommend_async, add_recommender_interaction, add_recommender_review, get_product_ratings, get_catalog_version, get_demographic_recommendations, get_recency_scores, get_collaborative_scores, get_context_recommendations, get_products_by_id, get_similar_products, get_trending, get_model_status, request_model_rebuild, subscribe_to_changes, get_tenant, get_tenant_stats
+from .filters import Filters
+from .metrics import MongoCommandListener, render_metrics, timed
+from .profiling import PROFILER, PROFILE_HEADER
+from .ratings import rating_summary
+from .tenants import UnknownTenant
 
-__all__ = ['init_app', 'recommend', 'add_recommender_interaction', 'get_demographic_recommendations', 'get_recency_scores', 'get_collaborative_scores', 'get_context_recommendations']
\ No newline at end of file
+__all__ = ['init_app', 'init_async_app', 'recommend', 'recommend_async', 'add_recommender_interaction', 'add_recommender_review', 'get_product_ratings', 'get_catalog_version', 'get_demographic_recommendations', 'get_recency_scores', 'get_collaborative_scores', 'get_context_recommendations', 'get_products_by_id', 'get_similar_products', 'get_trending', 'get_model_status', 'request_model_rebuild', 'subscribe_to_changes', 'get_tenant', 'get_tenant_stats', 'MongoCommandListener', 'render_metrics', 'timed', 'PROFILER', 'PROFILE_HEADER', 'rating_summary', 'UnknownTenant', 'Filters']
\ No newline at end of file
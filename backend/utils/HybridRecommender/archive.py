@@ -0,0 +1,222 @@
+"""Append-only, month-partitioned Parquet archive of interactions
+
+Model rebuilds, offline evaluation and analysis read old interactions from here instead
+of MongoDB, which then only has to serve what arrived after the archive's watermark.
+
+Layout under the archive root:
+    month=2024-03/part-<until_ms>-<pid>.parquet   interactions exported by one run, sorted by time
+    watermark.json                                 {"until_ms": newest timestamp exported}
+
+Parts are only ever added. A part whose until_ms is past the watermark belongs to an
+export that did not finish, and readers skip it. Needs pyarrow.
+
+Usage (from backend/):
+    python -m utils.HybridRecommender.archive export --archive-dir models/archive
+    python -m utils.HybridRecommender.archive export --archive-dir models/archive --from-csv ../data/interactions.csv
+"""
+import argparse
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .loader import INTERACTION_FIELDS, INTERACTION_TYPES, InteractionArrays, load_interactions
+from .storage import save_json
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; exports then rely on running one at a time
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = 'watermark.json'
+# Only interactions at least this old are exported, so writes stamped by a lagging clock are not skipped
+EXPORT_LAG = timedelta(minutes=5)
+ROW_GROUP_SIZE = 128 * 1024
+_TYPE_CODES = {name: code for code, name in enumerate(INTERACTION_TYPES)}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The interaction archive needs pyarrow, listed in requirements.txt: pip install -r requirements.txt') from None
+    return pyarrow
+
+
+def _millis(value):
+    return int(np.datetime64(pd.Timestamp(value).to_datetime64(), 'ms').astype(np.int64))
+
+
+class InteractionArchive:
+    """Reads and appends the Parquet parts under root"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def watermark(self):
+        """Newest interaction timestamp the archive covers, as a datetime, or None for an empty archive"""
+        until_ms = self._until_ms()
+        return None if until_ms is None else pd.Timestamp(until_ms, unit='ms').to_pydatetime()
+
+    def _until_ms(self):
+        try:
+            with open(os.path.join(self.root, WATERMARK_FILE)) as f:
+                return json.load(f)['until_ms']
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def append(self, interactions, until):
+        """Archive interactions up to until and move the watermark there
+
+        Rows at or before the current watermark are dropped, so concurrent or repeated
+        exports of overlapping ranges never duplicate anything.
+        """
+        pa = _pyarrow()
+        until_ms = _millis(until)
+        with self._locked():
+            since_ms = self._until_ms()
+            if since_ms is not None and until_ms <= since_ms:
+                return 0
+            times = interactions.timestamps.astype(np.int64)
+            keep = times <= until_ms
+            if since_ms is not None:
+                keep &= times > since_ms
+            rows = interactions.take(np.flatnonzero(keep)[np.argsort(times[keep], kind='stable')])
+
+            months = rows.timestamps.astype('datetime64[M]')
+            for month in np.unique(months):
+                part = rows.take(months == month)
+                codes = part.type_codes
+                table = pa.table({
+                    'user_id': part.user_ids,
+                    'product_id': part.product_ids,
+                    'interaction_type': pa.DictionaryArray.from_arrays(
+                        pa.array(codes, mask=codes < 0), pa.array(INTERACTION_TYPES)
+                    ),
+                    'timestamp': pa.array(part.timestamps, type=pa.timestamp('ms')),
+                })
+                directory = os.path.join(self.root, f'month={month}')
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f'part-{until_ms}-{os.getpid()}.parquet')
+                pa.parquet.write_table(table, f'{path}.tmp', row_group_size=ROW_GROUP_SIZE, compression='zstd')
+                os.replace(f'{path}.tmp', path)
+            # Moving the watermark last is what makes the new parts visible
+            save_json(self.root, WATERMARK_FILE, {'until_ms': until_ms})
+        logger.info('Archived %d interactions up to %s', len(rows), self.watermark())
+        return len(rows)
+
+    def _parts(self, start_ms=None, end_ms=None):
+        until_ms = self._until_ms()
+        if until_ms is None:
+            return []
+        first = None if start_ms is None else str(np.datetime64(start_ms, 'ms').astype('datetime64[M]'))
+        last = None if end_ms is None else str(np.datetime64(end_ms, 'ms').astype('datetime64[M]'))
+        parts = []
+        for entry in sorted(os.listdir(self.root)):
+            if not entry.startswith('month='):
+                continue
+            # Months outside the requested range are never opened
+            month = entry[len('month='):]
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+            for name in sorted(os.listdir(os.path.join(self.root, entry))):
+                if name.startswith('part-') and name.endswith('.parquet') and int(name.split('-')[1]) <= until_ms:
+                    parts.append(os.path.join(self.root, entry, name))
+        return parts
+
+    def read(self, start=None, end=None, columns=None):
+        """Interactions with start <= timestamp < end as InteractionArrays
+
+        The time range prunes whole months by directory and row groups by their timestamp
+        statistics; columns limits what is decoded (all four by default).
+        """
+        pa = _pyarrow()
+        start_ms = None if start is None else _millis(start)
+        end_ms = None if end is None else _millis(end)
+        parts = self._parts(start_ms, end_ms)
+        if not parts:
+            return InteractionArrays.from_documents([], columns or INTERACTION_FIELDS)
+
+        timestamp = pa.dataset.field('timestamp')
+        condition = None
+        for bound, compare in ((start_ms, timestamp.__ge__), (end_ms, timestamp.__lt__)):
+            if bound is not None:
+                clause = compare(pa.scalar(bound, type=pa.timestamp('ms')))
+                condition = clause if condition is None else condition & clause
+        table = pa.dataset.dataset(parts, format='parquet').to_table(columns=columns, filter=condition)
+
+        arrays = {}
+        if 'user_id' in table.column_names:
+            arrays['user_ids'] = table['user_id'].to_numpy().astype(np.int32, copy=False)
+        if 'product_id' in table.column_names:
+            arrays['product_ids'] = table['product_id'].to_numpy().astype(np.int32, copy=False)
+        if 'interaction_type' in table.column_names:
+            arrays['type_codes'] = _type_codes(table['interaction_type'])
+        if 'timestamp' in table.column_names:
+            arrays['timestamps'] = table['timestamp'].to_numpy().astype('datetime64[ms]', copy=False)
+        return InteractionArrays(**arrays)
+
+    def read_frame(self, start=None, end=None, columns=None):
+        """read() as a DataFrame, for analysis"""
+        return self.read(start, end, columns).to_frame()
+
+
+def _type_codes(column):
+    """Our int8 type codes for a dictionary-encoded column whose dictionaries may differ between parts"""
+    codes = []
+    for chunk in column.chunks:
+        mapping = np.array([_TYPE_CODES.get(name, -1) for name in chunk.dictionary.to_pylist()] + [-1], dtype=np.int8)
+        indices = chunk.indices.fill_null(len(mapping) - 1).to_numpy()
+        codes.append(mapping[indices])
+    return np.concatenate(codes) if codes else np.empty(0, dtype=np.int8)
+
+
+def export_interactions(db, archive, now=None):
+    """Copy interactions older than EXPORT_LAG and newer than the watermark from MongoDB into the archive"""
+    until = (now or datetime.utcnow()) - EXPORT_LAG
+    query = {'timestamp': {'$lte': until}}
+    since = archive.watermark()
+    if since is not None:
+        query['timestamp']['$gt'] = since
+    return archive.append(load_interactions(db.interactions, query), until)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append interactions to the Parquet archive')
+    parser.add_argument('command', choices=['export'])
+    parser.add_argument('--archive-dir', default=os.getenv("INTERACTION_ARCHIVE_DIR"))
+    parser.add_argument('--from-csv', default=None, help='Archive a CSV export instead of reading MongoDB')
+    args = parser.parse_args(argv)
+    if not args.archive_dir:
+        parser.error('--archive-dir or INTERACTION_ARCHIVE_DIR is required')
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+    archive = InteractionArchive(args.archive_dir)
+    if args.from_csv:
+        interactions = InteractionArrays.from_frame(pd.read_csv(args.from_csv))
+        count = archive.append(interactions, interactions.timestamps.max())
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db"))
+        count = export_interactions(client.get_database(), archive)
+    print(json.dumps({'archived': count, 'watermark': str(archive.watermark())}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Non-blocking recommendation path for the ASGI app"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .core import RECENT_INTERACTION_FIELDS
+from .metrics import MongoCommandListener, timed
+
+
+class AsyncRecommender:
+    """Fetches recommendation inputs concurrently with Motor and scores them off the event loop"""
+
+    def __init__(self, recommender, max_workers=None):
+        self.recommender = recommender
+        self.client = None
+        self.db = None
+        # NumPy/pandas release the GIL for most of the scoring work, so threads are enough
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("RECOMMENDER_WORKERS", "4")),
+            thread_name_prefix='recommender'
+        )
+
+    def connect(self, uri):
+        self.client = AsyncIOMotorClient(uri, event_listeners=[MongoCommandListener()])
+        self.db = self.client.get_default_database()
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking or CPU-heavy call in the scoring pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def recommend(self, user_id, k=20, filters=None):
+        """Async counterpart of HybridRecommender.recommend"""
+        try:
+            user_id = int(user_id)
+        except (ValueError, TypeError):
+            return pd.DataFrame()
+
+        # The three lookups are independent, so issue them together
+        with timed('db_fetch'):
+            user, first_interaction, recent_interactions = await asyncio.gather(
+                self.db.users.find_one({'user_id': user_id}, {'_id': 0, 'location': 1}),
+                self.db.interactions.find_one({'user_id': user_id}, {'_id': 1}),
+                self.db.interactions.find(
+                    self.recommender.recent_interactions_query(user_id), RECENT_INTERACTION_FIELDS
+                ).sort('timestamp', -1).to_list(None),
+            )
+
+        return await self.run_blocking(
+            self.recommender.score_user, user_id, k, user, first_interaction is not None, recent_interactions,
+            None, filters
+        )
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,229 @@
+"""Tailing product, interaction and review writes into the in-process model
+
+Each worker process runs its own feed, so catalog edits and new interactions written by
+any process (the API, the migration script, other services) reach every worker's model.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+
+from .incremental import ChangeBatch
+from .metrics import CHANGE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ('products', 'interactions', 'reviews')
+
+
+class ChangeStreamSource:
+    """Changes from a MongoDB change stream; needs a replica set or sharded cluster"""
+
+    name = 'change_stream'
+
+    def __init__(self, db, batch_size=500, max_await=1.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_await = max_await
+        self._resume_token = None
+        self._stream = None
+
+    def open(self):
+        self._stream = self.db.watch(
+            [{'$match': {'ns.coll': {'$in': list(WATCHED_COLLECTIONS)}}}],
+            full_document='updateLookup',
+            resume_after=self._resume_token,
+            max_await_time_ms=int(self.max_await * 1000),
+        )
+        return self
+
+    def poll(self):
+        """Up to batch_size (collection, operation, document) events; may return an empty list"""
+        events = []
+        while len(events) < self.batch_size:
+            change = self._stream.try_next()
+            if change is None:
+                break
+            self._resume_token = self._stream.resume_token
+            operation = change['operationType']
+            document = change.get('fullDocument') or change.get('documentKey') or {}
+            if operation in ('insert', 'update', 'replace', 'delete'):
+                events.append((change['ns']['coll'], operation, document))
+        return events
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+
+class PollingSource:
+    """Fallback for standalone servers and local stand-ins without change streams
+
+    New documents are found by _id, product edits by an `updated_at` field the writer sets,
+    and deletions by periodically diffing product ids and the interaction count. The API has
+    no product edit route; edits made by other tools without setting `updated_at` are not
+    seen here and reach the model with the next scheduled rebuild.
+    """
+
+    name = 'polling'
+
+    def __init__(self, db, batch_size=500, interval=1.0, deletion_scan_every=30):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.deletion_scan_every = deletion_scan_every
+        self._polls = 0
+
+    def _latest_id(self, collection):
+        latest = self.db[collection].find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        return latest['_id'] if latest else None
+
+    def open(self):
+        self._last_ids = {collection: self._latest_id(collection) for collection in WATCHED_COLLECTIONS}
+        self._products_since = datetime.utcnow()
+        self._product_ids = set(self.db.products.distinct('product_id'))
+        self._interaction_count = self.db.interactions.estimated_document_count()
+        return self
+
+    def _new_documents(self, collection):
+        last_id = self._last_ids[collection]
+        query = {} if last_id is None else {'_id': {'$gt': last_id}}
+        documents = list(self.db[collection].find(query).sort('_id', 1).limit(self.batch_size))
+        if documents:
+            self._last_ids[collection] = documents[-1]['_id']
+        return documents
+
+    def poll(self):
+        self._polls += 1
+        events = [('interactions', 'insert', doc) for doc in self._new_documents('interactions')]
+        self._interaction_count += len(events)
+        events.extend(('reviews', 'insert', doc) for doc in self._new_documents('reviews'))
+
+        for doc in self._new_documents('products'):
+            self._product_ids.add(doc.get('product_id'))
+            events.append(('products', 'insert', doc))
+        since, self._products_since = self._products_since, datetime.utcnow()
+        # BSON dates keep milliseconds, so an edit in the poll's own millisecond is stored below since
+        since = since.replace(microsecond=since.microsecond // 1000 * 1000)
+        for doc in self.db.products.find({'updated_at': {'$gte': since}}).limit(self.batch_size):
+            events.append(('products', 'update', doc))
+
+        if self._polls % self.deletion_scan_every == 0:
+            current = set(self.db.products.distinct('product_id'))
+            events.extend(('products', 'delete', {'product_id': product_id}) for product_id in self._product_ids - current)
+            self._product_ids = current
+            count = self.db.interactions.estimated_document_count()
+            if count < self._interaction_count:
+                events.append(('interactions', 'delete', {}))
+            self._interaction_count = count
+
+        if not events:
+            time.sleep(self.interval)
+        return events
+
+    def close(self):
+        pass
+
+
+class ChangeFeed:
+    """Background thread turning database changes into ChangeBatches for the recommender and subscribers"""
+
+    def __init__(self, recommender, mode='auto', batch_size=500, interval=1.0):
+        self.recommender = recommender
+        # 'auto' tries change streams first, 'poll' forces the fallback
+        self.mode = mode
+        self.batch_size = batch_size
+        self.interval = interval
+        self.source = None
+        self.applied_batches = 0
+        self.last_error = None
+        self._subscribers = []
+        self._reopen = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Call callback(batch) after every batch is applied, e.g. to drop cached responses"""
+        self._subscribers.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def status(self):
+        return {
+            'source': self.source.name if self.source else None,
+            'applied_batches': self.applied_batches,
+            'last_error': self.last_error,
+        }
+
+    def _open_source(self):
+        db = self.recommender.db
+        if self.mode == 'auto':
+            try:
+                return ChangeStreamSource(db, self.batch_size, self.interval).open()
+            except (PyMongoError, NotImplementedError, TypeError) as e:
+                # Standalone servers refuse change streams; local stand-ins may not implement watch() at all
+                logger.info('Change streams unavailable (%s), polling for changes instead', e)
+        return PollingSource(db, self.batch_size, self.interval).open()
+
+    def _to_batch(self, events):
+        batch = ChangeBatch()
+        product_df = self.recommender.state.product_df
+        for collection, operation, document in events:
+            CHANGE_EVENTS.inc(collection=collection, operation=operation)
+            if collection in ('interactions', 'reviews'):
+                if operation == 'insert':
+                    (batch.interactions if collection == 'interactions' else batch.reviews).append(document)
+                else:
+                    batch.needs_rebuild = True
+            elif operation == 'delete':
+                product_id = document.get('product_id')
+                if product_id is None and product_df is not None and '_id' in product_df:
+                    # Change stream deletes only carry the _id
+                    matches = product_df.index[product_df['_id'] == document.get('_id')]
+                    product_id = matches[0] if len(matches) else None
+                if product_id is not None:
+                    batch.products.pop(product_id, None)
+                    batch.deleted_products.add(product_id)
+            elif document.get('product_id') is not None:
+                batch.products[document['product_id']] = document
+                batch.deleted_products.discard(document['product_id'])
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.source is None:
+                    self.source = self._open_source()
+                elif self._reopen:
+                    self.source.open()
+                    self._reopen = False
+                batch = self._to_batch(self.source.poll())
+                if not batch:
+                    continue
+                self.recommender.apply_changes(batch)
+                self.applied_batches += 1
+                if batch.needs_rebuild and self.recommender.scheduler is not None:
+                    self.recommender.scheduler.request_rebuild()
+                for callback in self._subscribers:
+                    callback(batch)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception('Change feed failed, reopening')
+                if isinstance(self.source, ChangeStreamSource):
+                    # Reopened with the last resume token, so no change is skipped
+                    self.source.close()
+                    self._reopen = True
+                self._stop.wait(self.interval)
@@ -0,0 +1,136 @@
+"""Request coalescing: concurrent identical computations share one run
+
+While the first caller for a key computes, later callers with the same key wait for it
+and receive copies of its result (or its exception) instead of starting their own.
+Nothing is kept once the computation finishes, so this never serves a result older than
+the call that produced it.
+
+Worker processes can also share: with a store directory set, calls marked shared take
+an fcntl lock on a per-key file. After waiting on the lock, a process reuses the result
+the lock holder pickled there, if it is at most store_ttl seconds old. Without fcntl
+(Windows) calls only coalesce within a process.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from .metrics import SINGLE_FLIGHT_CALLS
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; calls then coalesce within one process only
+    fcntl = None
+
+# Stored results and lock files untouched for this many store_ttl periods are removed
+SWEEP_AFTER_TTLS = 10
+# Leader runs between sweeps of the store directory
+SWEEP_EVERY = 256
+
+
+def _copy(result):
+    """A copy callers may modify without affecting each other; DataFrames and arrays are tiny here"""
+    copy = getattr(result, 'copy', None)
+    return copy() if callable(copy) else result
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """At most one in-flight computation per key; safe to share between threads"""
+
+    def __init__(self, store_dir=None, store_ttl=2.0):
+        self.store_dir = store_dir
+        self.store_ttl = store_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("SINGLE_FLIGHT_DIR") or None, float(os.getenv("SINGLE_FLIGHT_TTL", "2")))
+
+    def do(self, operation, key, func, *args, shared=False, **kwargs):
+        """func(*args, **kwargs), or the result of the identical call already running for key
+
+        operation labels the metrics; key must be hashable and have a stable repr when
+        shared, which lets other processes reuse the result through the store.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            SINGLE_FLIGHT_CALLS.inc(operation=operation, outcome='shared')
+            if call.error is not None:
+                raise call.error
+            return _copy(call.result)
+
+        try:
+            if shared and self.store_dir is not None and fcntl is not None:
+                call.result, outcome = self._run_locked(operation, key, func, args, kwargs)
+            else:
+                call.result, outcome = func(*args, **kwargs), 'computed'
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        SINGLE_FLIGHT_CALLS.inc(operation=operation, outcome=outcome)
+        return _copy(call.result)
+
+    def _run_locked(self, operation, key, func, args, kwargs):
+        """Run func holding the key's file lock, unless the previous holder stored a fresh result"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, hashlib.sha1(repr((operation, key)).encode()).hexdigest())
+        with open(f'{path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if time.time() - os.path.getmtime(f'{path}.pkl') <= self.store_ttl:
+                    with open(f'{path}.pkl', 'rb') as f:
+                        return pickle.load(f), 'stored'
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            result = func(*args, **kwargs)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, f'{path}.pkl')
+        self._runs += 1
+        if self._runs % SWEEP_EVERY == 0:
+            self._sweep()
+        return result, 'computed'
+
+    def _sweep(self):
+        """Remove long-expired results and their lock files
+
+        Unlinking a lock file another process has just opened can at worst let two
+        processes compute the same key once; it never hands out a wrong result.
+        """
+        cutoff = time.time() - SWEEP_AFTER_TTLS * max(self.store_ttl, 1.0)
+        for entry in os.scandir(self.store_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def in_flight(self):
+        """Number of keys being computed right now"""
+        with self._lock:
+            return len(self._calls)
+
+
+COALESCER = SingleFlight.from_env()
@@ -1,25 +1,32 @@
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 
-def _get_collaborative_scores(self, user_id, n_items=20):
+from .ranking import Candidates, masked_top_k
+
+def _get_collaborative_scores(self, user_id, n_items=20, allowed=None):
     try:
         user_id = int(user_id)
     except (ValueError, TypeError):
-        return pd.Series(0.0, index=self.product_df.index)
+        return Candidates.empty()
 
-    if self.user_item_matrix is None or user_id not in self.user_item_matrix.index:
-        return pd.Series(0.0, index=self.product_df.index)
+    if self.mf_model is not None:
+        return self._get_als_scores(user_id, n_items, allowed)
 
-    user_vec = self.user_item_matrix.loc[user_id].values.reshape(1, -1)
-    sims = cosine_similarity(user_vec, self.user_item_matrix)[0]
-    sim_users = pd.Series(sims, index=self.user_item_matrix.index).nlargest(6).iloc[1:]
+    if self.user_item_matrix is None or user_id not in self.user_item_matrix.index:
+        return Candidates.empty()
 
-    rec = pd.Series(0.0, index=self.user_item_matrix.columns)
-    for sim_user, score in sim_users.items():
-        rec += self.user_item_matrix.loc[sim_user] * score
+    # Imported here so that loading the package does not pay for scikit-learn
+    from sklearn.metrics.pairwise import cosine_similarity
+    weights = self.user_item_matrix.to_numpy(dtype=np.float32)
+    row = self.user_item_matrix.index.get_loc(user_id)
+    sims = cosine_similarity(weights[row:row + 1], weights)[0].astype(np.float32)
+    own_row = np.zeros(len(sims), dtype=bool)
+    own_row[row] = True
+    neighbours = masked_top_k(sims, self.n_neighbours, exclude=own_row)
 
-    aligned = pd.Series(0.0, index=self.product_df.index)
-    aligned.loc[rec.index] = rec
-    if aligned.max() > 0:
-        aligned /= aligned.max()
-    return aligned
+    rec = sims[neighbours] @ weights[neighbours]
+    positions = self.catalog.positions(self.user_item_matrix.columns)
+    excluded = positions < 0
+    if allowed is not None:
+        excluded |= ~allowed[positions]
+    best = masked_top_k(rec, n_items, exclude=excluded, min_score=0.0)
+    return Candidates(positions[best], rec[best]).normalized()
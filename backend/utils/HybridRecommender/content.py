@@ -0,0 +1,190 @@
+"""Content-based similarity over product names and descriptions"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .metrics import timed
+from .ranking import Candidates, masked_top_k
+from .storage import save_array, save_json
+
+logger = logging.getLogger(__name__)
+
+# Word unigrams/bigrams hashed into a fixed space, so no vocabulary has to be stored
+N_FEATURES = 2 ** 18
+TEXT_FIELDS = ('product_name', 'description', 'category', 'brand')
+INDEX_VERSION = 2
+
+
+def _product_text(product_df):
+    return product_df.reindex(columns=list(TEXT_FIELDS)).fillna('').astype(str).agg(' '.join, axis=1)
+
+
+def _hash_text(product_df):
+    # scikit-learn is imported on first use; it is the slowest import of the package
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False, norm=None, dtype=np.float32
+    ).transform(_product_text(product_df))
+
+
+def _compact(matrix):
+    matrix = matrix.astype(np.float32).tocsr()
+    matrix.indices = matrix.indices.astype(np.int32)
+    matrix.indptr = matrix.indptr.astype(np.int32)
+    return matrix
+
+
+def catalog_fingerprint(product_df):
+    """Hash of product ids and text, so an index is rebuilt when descriptions change"""
+    hashed = pd.util.hash_pandas_object(_product_text(product_df), index=True)
+    return format(int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF, '016x')
+
+
+class ContentIndex:
+    """L2-normalised sparse float32 TF-IDF vectors for the catalog, one row per product"""
+
+    def __init__(self, product_ids, matrix, fingerprint=None, idf=None):
+        self.product_ids = np.asarray(product_ids)
+        self.matrix = matrix
+        self.fingerprint = fingerprint
+        # Per-feature IDF weights, kept so changed products can be vectorised without a refit
+        self.idf = idf
+        self._rows = pd.Series(np.arange(len(self.product_ids)), index=self.product_ids)
+
+    @classmethod
+    def build(cls, product_df):
+        """Vectorise the text fields of a product table indexed by product_id"""
+        from sklearn.feature_extraction.text import TfidfTransformer
+        transformer = TfidfTransformer(sublinear_tf=True)
+        matrix = _compact(transformer.fit_transform(_hash_text(product_df)))
+        idf = transformer.idf_.astype(np.float32)
+        return cls(product_df.index.to_numpy(), matrix, catalog_fingerprint(product_df), idf)
+
+    def vectorize(self, product_df):
+        """Rows for products using the fitted IDF weights, matching what build() would produce"""
+        hashed = _hash_text(product_df).tocsr()
+        # sublinear_tf: 1 + log(tf)
+        hashed.data = np.log(hashed.data) + 1.0
+        weighted = sparse.csr_matrix(hashed.multiply(self.idf.reshape(1, -1)))
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return _compact(sparse.diags(1.0 / norms).dot(weighted))
+
+    def updated(self, changed_products=None, removed_ids=()):
+        """A new index with changed products re-vectorised and removed ones dropped
+
+        IDF weights stay those of the last full build, and the fingerprint is cleared so the next
+        scheduled rebuild refits the index from scratch.
+        """
+        changed_ids = [] if changed_products is None else changed_products.index.tolist()
+        drop = np.isin(self.product_ids, list(changed_ids) + list(removed_ids))
+        matrix, product_ids = self.matrix[~drop], self.product_ids[~drop]
+        if changed_ids:
+            matrix = sparse.vstack([matrix, self.vectorize(changed_products)])
+            product_ids = np.concatenate([product_ids, changed_products.index.to_numpy()])
+        return ContentIndex(product_ids, _compact(matrix), None, self.idf)
+
+    def save(self, path):
+        """Write the CSR arrays as .npy files that load() can memory-map"""
+        os.makedirs(path, exist_ok=True)
+        save_array(path, 'data', self.matrix.data)
+        save_array(path, 'indices', self.matrix.indices)
+        save_array(path, 'indptr', self.matrix.indptr)
+        save_array(path, 'product_ids', self.product_ids)
+        save_array(path, 'idf', self.idf)
+        # meta.json goes last so a reader never pairs new metadata with old arrays
+        save_json(path, 'meta.json', {'version': INDEX_VERSION, 'shape': list(self.matrix.shape), 'fingerprint': self.fingerprint})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved index; with mmap the arrays stay on disk and are paged in on demand"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Content index at {path} has version {meta.get('version')}, expected {INDEX_VERSION}")
+        mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in ('data', 'indices', 'indptr')]
+        matrix = sparse.csr_matrix(tuple(arrays), shape=tuple(meta['shape']), copy=False)
+        return cls(
+            np.load(os.path.join(path, 'product_ids.npy')), matrix, meta.get('fingerprint'),
+            np.load(os.path.join(path, 'idf.npy'), mmap_mode=mode)
+        )
+
+    def matches(self, product_df):
+        """Whether the index was built for exactly this catalog"""
+        return (
+            len(self.product_ids) == len(product_df)
+            and np.array_equal(self.product_ids, product_df.index.to_numpy())
+            and self.fingerprint == catalog_fingerprint(product_df)
+        )
+
+    def _seed_rows(self, seed_product_ids):
+        positions = self._rows.reindex(list(seed_product_ids))
+        known = positions.notna().to_numpy()
+        return positions[known].astype(int).to_numpy(), known
+
+    def scores(self, seed_product_ids, weights=None):
+        """Cosine similarity of every product to the (weighted) centroid of the seed products"""
+        rows, known = self._seed_rows(seed_product_ids)
+        if len(rows) == 0:
+            return np.zeros(len(self.product_ids), dtype=np.float32)
+        seeds = self.matrix[rows]
+        if weights is not None:
+            seeds = sparse.diags(np.asarray(weights, dtype=np.float32)[known]).dot(seeds)
+        query = sparse.csr_matrix(seeds.sum(axis=0), dtype=np.float32)
+        return self.matrix.dot(query.T).toarray().ravel()
+
+    def similar_to(self, seed_product_ids, k=10, exclude_seeds=True):
+        """Top-k (product_ids, scores) most similar to the seeds, best first"""
+        scores = self.scores(seed_product_ids)
+        if exclude_seeds:
+            scores[self._seed_rows(seed_product_ids)[0]] = -np.inf
+        k = min(k, len(scores))
+        if k <= 0:
+            return self.product_ids[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top]) & (scores[top] > 0)]
+        return self.product_ids[top], scores[top]
+
+
+def load_or_build_index(product_df, path=None):
+    """Reuse the persisted index when it matches the catalog, otherwise rebuild and persist it"""
+    if path and os.path.exists(os.path.join(path, 'meta.json')):
+        try:
+            index = ContentIndex.load(path)
+            if index.matches(product_df):
+                return index
+            logger.info('Content index at %s is stale, rebuilding', path)
+        except (OSError, ValueError) as e:
+            logger.warning('Could not load content index from %s: %s', path, e)
+
+    with timed('matrix_ops'):
+        index = ContentIndex.build(product_df)
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            logger.warning('Could not persist content index to %s: %s', path, e)
+    return index
+
+
+def get_content_scores(self, seed_product_ids, n_items=20, weights=None, allowed=None):
+    """Candidates: the n_items products most similar to the seed products, scaled to [0, 1]"""
+    index = self.content_index
+    if index is None or len(seed_product_ids) == 0:
+        return Candidates.empty()
+
+    scores = index.scores(seed_product_ids, weights)
+    # Items the user already interacted with are not worth recommending again
+    excluded = np.zeros(len(scores), dtype=bool)
+    excluded[index._seed_rows(seed_product_ids)[0]] = True
+    if allowed is not None:
+        positions = self.catalog.positions(index.product_ids)
+        excluded |= (positions < 0) | ~allowed[positions]
+    best = masked_top_k(scores, n_items, exclude=excluded, min_score=0.0)
+    return Candidates.from_positions(self.catalog.positions(index.product_ids[best]), scores[best], n_items).normalized()
@@ -1,36 +1,41 @@
-import pandas as pd
+import numpy as np
+
+from .loader import load_interactions
+
+def _popularity(self, product_ids):
+    scores = np.zeros(len(self.catalog), dtype=np.float32)
+    positions = self.catalog.positions(product_ids)
+    positions = positions[positions >= 0]
+    if len(positions) == 0:
+        return scores
+    scores[:] = np.bincount(positions, minlength=len(scores))
+    if scores.max() > 0:
+        scores /= scores.max()
+    return scores
+
+def get_context_popularity(self, time_of_day=None, device=None, location=None):
+    """Popularity among interactions made in one context, over all interactions when no context is given"""
+    query = {}
+    if time_of_day is not None or device is not None or location is not None:
+        query = {
+            'context.time_of_day': time_of_day,
+            'context.device': device,
+            'context.location': location
+        }
+    interactions = load_interactions(self.db.interactions, query, fields=('product_id',))
+    return _popularity(self, interactions.product_ids)
 
 def get_context_recommendations(self, user_id, n_items=20):
     try:
         user_id = int(user_id)
     except (ValueError, TypeError):
-        return pd.Series(0.0, index=self.product_df.index)
+        return np.zeros(len(self.catalog), dtype=np.float32)
 
     context = self.db.context.find_one({'user_id': user_id})
-    if not context:
-        interactions = pd.DataFrame(list(self.db.interactions.find()))
-        if interactions.empty:
-            return pd.Series(0.0, index=self.product_df.index)
-        interactions['product_id'] = pd.to_numeric(interactions['product_id'])
-        popular = interactions['product_id'].value_counts()
-        aligned = pd.Series(0.0, index=self.product_df.index)
-        aligned.loc[popular.index] = popular
-        if aligned.max() > 0:
-            aligned /= aligned.max()
-        return aligned
-
-    ctx_int = pd.DataFrame(list(self.db.interactions.find({
-        'context.time_of_day': context['time_of_day'],
-        'context.device': context['device'],
-        'context.location': context['location']
-    })))
-    if ctx_int.empty:
-        return pd.Series(0.0, index=self.product_df.index)
-
-    ctx_int['product_id'] = pd.to_numeric(ctx_int['product_id'])
-    counts = ctx_int['product_id'].value_counts()
-    aligned = pd.Series(0.0, index=self.product_df.index)
-    aligned.loc[counts.index] = counts
-    if aligned.max() > 0:
-        aligned /= aligned.max()
-    return aligned
+    if context:
+        # Users sharing a context share this scan, so it goes through the coalesced strategy
+        return self._get_context_popularity(context['time_of_day'], context['device'], context['location'])
+    if len(self.trending):
+        # Without a context the answer is plain popularity, which the streaming counters already hold
+        return self._get_trending_scores(n_items)
+    return self._get_context_popularity()
@@ -1,139 +1,485 @@
+import logging
+import os
+import threading
+import time
 import pandas as pd
 import numpy as np
 from pymongo import MongoClient
 from .base import RecommenderInterface
+from .content import load_or_build_index
+from .diversity import diversify
+from .executor import StrategyExecutor
+from .incremental import INTERACTION_WEIGHTS, apply_changes, interaction_weights
+from .archive import InteractionArchive
+from .loader import InteractionArrays, load_interactions, object_id_key
+from .factorization import DEFAULT_MODEL_DIR as DEFAULT_MF_MODEL_DIR, load_model
+from .ranking import Candidates, masked_top_k
+from .ratings import REVIEW_FIELDS, RatingStats, rating_summary
+from .rerank import get_reranker
+from .session import SessionIndex
+from .trending import TrendingCounter
+from .metrics import MongoCommandListener, timed, timed_strategy
+from .state import ModelState, pinned, pinned_state, state_field
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Window of history used by the recency strategy
+RECENT_DAYS = 30
+RECENT_INTERACTION_FIELDS = {'_id': 0, 'product_id': 1, 'interaction_type': 1, 'timestamp': 1}
+# Most heavily weighted items of a user that seed the content strategy
+CONTENT_SEED_ITEMS = 10
+# Strategies blended for users with history, in priority order
+BLEND_SOURCES = ('session', 'collaborative', 'recency', 'content')
+DEFAULT_CONTENT_INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'content_index')
+DEFAULT_TRENDING_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'trending')
+
 class HybridRecommender(RecommenderInterface):
+    # Derived data lives in one immutable ModelState; these read the version pinned for the current request
+    user_item_matrix = state_field('user_item_matrix')
+    product_df = state_field('product_df')
+    content_index = state_field('content_index')
+    mf_model = state_field('mf_model')
+    ratings = state_field('ratings')
+    sessions = state_field('sessions')
+
+    @property
+    def catalog(self):
+        """Catalog arrays of the pinned model version"""
+        return self.state.catalog
+
     def __init__(self):
-        self.user_item_matrix = None
-        self.product_df = None
+        self._state = ModelState()
+        self._state_lock = threading.Lock()
+        # Change batches applied while a rebuild is fetching, replayed onto the rebuilt state
+        self._build_log = None
         self.mongo = None
-        self.recency_weight = 0.6
+        self.mongo_uri = None
+        self.owns_mongo = True
+        # Weight of each source's [0, 1] candidate scores in the weighted re-ranker
+        self.session_weight = 1.0
         self.collab_weight = 0.4
+        self.recency_weight = 0.6
+        self.content_weight = 0.3
+        # Candidates each source hands to the re-ranker (never fewer than the k requested)
+        self.candidate_sizes = {'session': 50, 'collaborative': 100, 'recency': 100, 'content': 50}
+        # A rerank.RERANKERS name or any object with a rerank(recommender, candidates, k) method
+        self.reranker = os.getenv("RERANKER", "weighted")
+        # Recommendations taken from each strategy by the 'priority' re-ranker
+        self.items_per_strategy = 10
+        # Re-ranked items the diversity stage chooses the final k from
+        self.diversity_pool = 100
+        # Weight of dissimilarity against relevance in the diversity stage (0 keeps the re-ranker's order)
+        self.diversity = 0.3
+        # Most items one category or brand may take in a list; None for no cap
+        self.category_cap = 8
+        self.brand_cap = 5
+        # Most similar users consulted by collaborative filtering
+        self.n_neighbours = 5
+        self.executor = StrategyExecutor()
+        # Seconds each strategy may take before the blend goes ahead without it
+        self.strategy_timeouts = {'session': 1.0, 'collaborative': 1.0, 'recency': 1.0, 'content': 1.0}
+        # Where the content index is persisted; None keeps it in memory only
+        self.content_index_dir = os.getenv("CONTENT_INDEX_DIR", DEFAULT_CONTENT_INDEX_DIR)
+        # 'cosine' (user-user neighbours) or 'als' (factors trained offline by factorization.py)
+        self.collaborative_model = os.getenv("COLLABORATIVE_MODEL", "cosine")
+        self.mf_model_dir = os.getenv("MF_MODEL_DIR", DEFAULT_MF_MODEL_DIR)
+        # Parquet archive holding interactions older than its watermark (archive.py); None reads only MongoDB
+        self.archive_dir = os.getenv("INTERACTION_ARCHIVE_DIR")
+        # Decayed trending counters, fed by every interaction batch and caught up on each rebuild
+        self.trending = TrendingCounter.from_env()
+        # Where the trending counters are snapshotted after each rebuild; None keeps them in memory only
+        self.trending_dir = os.getenv("TRENDING_DIR", DEFAULT_TRENDING_DIR)
+        # RebuildScheduler notified of new interactions, attached by the interface module
+        self.scheduler = None
 
     def init_app(self, app):
-        self.mongo = MongoClient(app.config["MONGO_URI"])
-        self.db = self.mongo.get_database()
+        self.connect(app.config["MONGO_URI"])
+
+    def connect(self, uri, client=None):
+        """Open the MongoDB connection and build the in-memory matrices"""
+        self.attach(uri, client)
         self._update_matrices()
 
+    def attach(self, uri, client=None):
+        """Open the MongoDB connection without loading anything from it
+
+        A client passed in (such as the API's own) is shared rather than owned, so stopping
+        the recommender leaves it open.
+        """
+        self.owns_mongo = client is None
+        self.mongo_uri = uri
+        self.mongo = client or MongoClient(uri, event_listeners=[MongoCommandListener()])
+        self.db = self.mongo.get_database()
+
+    @property
+    def state(self):
+        """The model version serving the current request: the pinned one, else the latest"""
+        return pinned_state(self) or self._state
+
+    def pinned(self):
+        """Context manager that keeps the enclosed block on one model version across a hot swap"""
+        return pinned(self, self._state)
+
+    def publish(self, state):
+        """Atomically make state the version new requests are served from"""
+        state.prepare()
+        with self._state_lock:
+            self._state = state
+
+    def update_state(self, **changes):
+        with self._state_lock:
+            self._state = self._state.replace(**changes).prepare()
+
     def _update_matrices(self):
-        interactions = pd.DataFrame(list(self.db.interactions.find()))
-        products = pd.DataFrame(list(self.db.products.find()))
-
-        if not interactions.empty:
-            interactions['product_id'] = pd.to_numeric(interactions['product_id'])
-            weights = {'view': 1, 'add_to_cart': 3, 'purchase': 5}
-            interactions['weight'] = interactions['interaction_type'].map(weights)
-            self.user_item_matrix = interactions.pivot_table(
-                index='user_id',
-                columns='product_id',
-                values='weight',
-                aggfunc='sum',
-                fill_value=0
-            )
+        """Fetch everything from MongoDB, build a new model version and swap it in"""
+        started = time.perf_counter()
+        with self._state_lock:
+            self._build_log = []
+        state = None
+        try:
+            with timed('db_fetch'):
+                interactions, seen_ids = self._fetch_interactions()
+                products = pd.DataFrame(list(self.db.products.find()))
+                reviews = pd.DataFrame(list(self.db.reviews.find({}, REVIEW_FIELDS)))
+                user_locations = {
+                    user['user_id']: user.get('location')
+                    for user in self.db.users.find({}, {'_id': 0, 'user_id': 1, 'location': 1}) if 'user_id' in user
+                }
+            if '_id' in reviews:
+                seen_ids.update(object_id_key(value) for value in reviews['_id'])
+            state = self.build_state(interactions.to_frame(), products, reviews, started)
+        finally:
+            with self._state_lock:
+                missed, self._build_log = self._build_log, None
+                if state is not None:
+                    # Changes that landed after the snapshot was read would otherwise be lost until the next rebuild
+                    for batch in missed:
+                        state = apply_changes(state, batch, seen_ids)
+                    self._state = state.prepare()
+        if state is not None:
+            self._update_trending(interactions, user_locations)
+        return state
+
+    def _update_trending(self, interactions, user_locations):
+        """Catch the trending counters up with interactions past their watermark, then snapshot them"""
+        trending = self.trending
+        if trending.landmark is None and self.trending_dir:
+            # A fresh process resumes from the last snapshot and only counts what came after it
+            trending.load(self.trending_dir)
+        trending.user_locations = user_locations
+        if self._state.catalog is not None:
+            trending.add_interactions(interactions, self._state.catalog, newer_only=True)
+        if self.trending_dir:
+            try:
+                trending.save(self.trending_dir)
+            except OSError as e:
+                logger.warning('Could not persist trending counters to %s: %s', self.trending_dir, e)
+
+    def _fetch_interactions(self):
+        """All interactions, plus the _id keys of those read from MongoDB
+
+        With an archive configured only the interactions after its watermark come from
+        MongoDB; the rest are read from the Parquet parts.
+        """
+        if self.archive_dir is None:
+            interactions = load_interactions(self.db.interactions, with_ids=True)
+            return interactions, set(interactions.id_keys())
+        archive = InteractionArchive(self.archive_dir)
+        since = archive.watermark()
+        tail = load_interactions(
+            self.db.interactions, {} if since is None else {'timestamp': {'$gt': since}}, with_ids=True
+        )
+        return InteractionArrays.concat([archive.read(), tail]), set(tail.id_keys())
+
+    def apply_changes(self, batch):
+        """Fold a ChangeBatch from the change feed into a new version and publish it"""
+        with self._state_lock:
+            if self._build_log is not None:
+                self._build_log.append(batch)
+            self._state = state = apply_changes(self._state, batch).prepare()
+        if batch.interactions and state.catalog is not None:
+            self.trending.add_documents(batch.interactions, state.catalog)
+        return state
+
+    def refresh(self):
+        """Rebuild the model off the request path; readers keep the old version until the swap"""
+        return self._update_matrices()
 
-        if not products.empty:
-            products['product_id'] = pd.to_numeric(products['product_id'])
-            self.product_df = products.set_index('product_id')
+    def load_frames(self, interactions, products, reviews=None):
+        """Build the user-item matrix and product table from interaction, product and review DataFrames"""
+        self.publish(self.build_state(interactions, products, reviews))
 
-    def recommend(self, user_id, k=20):
-        """Generate hybrid recommendations for a user"""
+    def build_state(self, interactions, products, reviews=None, started=None):
+        """A complete new ModelState; fields with no new data carry over from the current version"""
+        started = started or time.perf_counter()
+        current = self._state
+        user_item_matrix, product_df = current.user_item_matrix, current.product_df
+        content_index, mf_model = current.content_index, current.mf_model
+        negative_weights = current.negative_weights
+        ratings = current.ratings or RatingStats()
+        sessions = current.sessions or SessionIndex()
+        has_reviews = reviews is not None and not reviews.empty
+        with timed('matrix_ops'):
+            if not interactions.empty or has_reviews:
+                # Explicit ratings shift the implicit interaction weights of the same user-item pair
+                user_item_matrix, negative_weights = interaction_weights(interactions, reviews)
+            if reviews is not None:
+                ratings = RatingStats.from_reviews(reviews)
+            if not interactions.empty:
+                sessions = SessionIndex.from_interactions(interactions)
+
+            if not products.empty:
+                products['product_id'] = pd.to_numeric(products['product_id'])
+                product_df = products.set_index('product_id')
+                content_index = load_or_build_index(product_df, self.content_index_dir)
+
+            if self.collaborative_model == 'als':
+                mf_model = load_model(self.mf_model_dir)
+                if mf_model is None:
+                    logger.warning('No ALS model at %s, falling back to cosine neighbours', self.mf_model_dir)
+        logger.info('Built user-item matrix for %d interactions and %d products', len(interactions), len(products))
+        return ModelState(
+            user_item_matrix, product_df, content_index, mf_model, ratings, sessions,
+            negative_weights=negative_weights, version=current.version + 1,
+            build_seconds=time.perf_counter() - started
+        )
+
+    def source_weights(self):
+        """Blend weight of each source for the weighted re-ranker"""
+        return {
+            'session': self.session_weight, 'collaborative': self.collab_weight,
+            'recency': self.recency_weight, 'content': self.content_weight,
+        }
+
+    def model_status(self):
+        state = self._state
+        return {
+            'version': state.version,
+            'built_at': state.built_at,
+            'age_seconds': state.age(),
+            'build_seconds': state.build_seconds,
+            'users': 0 if state.user_item_matrix is None else len(state.user_item_matrix),
+            'products': 0 if state.product_df is None else len(state.product_df),
+            'memory_bytes': state.memory_bytes(),
+        }
+
+    def add_interaction(self, user_id, product_id, interaction_type):
+        """Note an interaction already stored in MongoDB; the model picks it up on the next background rebuild"""
+        if self.scheduler is not None:
+            self.scheduler.notify_change()
+
+    def recommend(self, user_id, k=20, filters=None):
+        """Generate hybrid recommendations for a user, restricted to products matching filters (a Filters)"""
         try:
             user_id = int(user_id)
         except (ValueError, TypeError):
             return pd.DataFrame()
-        
-        # Get the user's location for demographic labeling
-        user = self.db.users.find_one({'user_id': user_id})
+
+        with timed('db_fetch'):
+            # Get the user's location for demographic labeling
+            user = self.db.users.find_one({'user_id': user_id}, {'_id': 0, 'location': 1})
+
+            # Check if user has any interactions
+            has_interactions = self.db.interactions.find_one({'user_id': user_id}, {'_id': 1}) is not None
+
+        # Recent interactions are fetched inside the recency strategy so the query overlaps collaborative scoring
+        return self.score_user(user_id, k, user, has_interactions, filters=filters)
+
+    def recent_interactions_query(self, user_id, now=None):
+        """Mongo filter for the interactions that feed the recency strategy"""
+        recent_cutoff = (now or datetime.now()) - timedelta(days=RECENT_DAYS)
+        return {'user_id': user_id, 'timestamp': {'$gte': recent_cutoff}}
+
+    def _fetch_recent_interactions(self, user_id, now=None):
+        with timed('db_fetch'):
+            return list(
+                self.db.interactions.find(self.recent_interactions_query(user_id, now), RECENT_INTERACTION_FIELDS)
+                .sort('timestamp', -1)
+            )
+
+    def score_user(self, user_id, k, user, has_interactions, recent_interactions=None, now=None, filters=None):
+        """Score a user from already-fetched inputs
+
+        recent_interactions may be None, in which case the recency strategy fetches them itself.
+        """
+        with self.pinned():
+            return self._score_user(user_id, k, user, has_interactions, recent_interactions, now, filters)
+
+    def _score_user(self, user_id, k, user, has_interactions, recent_interactions, now, filters=None):
         user_location = user.get('location') if user else None
+        # Every strategy applies the mask inside its own top-k, so filtered requests still get full candidate lists
+        allowed = filters.mask(self.catalog) if filters and self.catalog is not None else None
 
-        # Check if user has any interactions
-        user_interactions = self.db.interactions.find_one({'user_id': user_id})
-        
-        if not user_interactions:
+        if not has_interactions:
             # New user - use demographic and context recommendations
-            demographic_scores = self._get_demographic_recommendations(user_location, k)
-            demographic_scores['recommendation_source'] = 'demographic'
-            return demographic_scores
-            
-        else:
-            # Get scores from each strategy
-            collab_scores = self._get_collaborative_scores(user_id, k)
+            with timed_strategy('demographic'):
+                demographic_scores = self._get_demographic_recommendations(user_location, k, allowed)
+            if allowed is None or len(demographic_scores) >= k:
+                demographic_scores['recommendation_source'] = 'demographic'
+                return self._with_ratings(demographic_scores)
+            # Too few local picks pass the filters: top up like a filtered blended list
+            with timed('scoring'):
+                positions = self.catalog.positions(demographic_scores.index) if len(demographic_scores) else []
+                positions, scores, sources = self._fill(
+                    np.asarray(positions, dtype=np.intp),
+                    np.asarray(demographic_scores.get('score', []), dtype=np.float32),
+                    np.full(len(positions), 'demographic', dtype=object),
+                    k, allowed
+                )
+            return self._hydrate(user_id, positions, scores, sources)
 
-            
-            recent_cutoff = datetime.now() - timedelta(days=30)
-            try:
-                user_id = int(user_id)
-            except (ValueError, TypeError):
-                return pd.Series(0.0, index=self.product_df.index)
-
-            recent_interactions = pd.DataFrame(list(
-                self.db.interactions.find({
-                    'user_id': user_id,
-                    'timestamp': {'$gte': recent_cutoff}
-                }).sort('timestamp', -1)
-            ))
-
-            if recent_interactions.empty:
-                return pd.Series(0.0, index=self.product_df.index)
-
-            recent_interactions['product_id'] = pd.to_numeric(recent_interactions['product_id'])
-            recent_interactions['timestamp'] = pd.to_datetime(recent_interactions['timestamp'])
-            now = datetime.now()
-            time_diff_secs = (now - recent_interactions['timestamp']).dt.total_seconds()
-            recent_interactions['time_decay'] = 1.0 - np.exp(-0.05 * time_diff_secs)
-
-            weights = {'view': 1, 'add_to_cart': 3, 'purchase': 5}
-            recent_interactions['weight'] = recent_interactions['interaction_type'].map(weights)
-            recent_interactions['final_weight'] = recent_interactions['time_decay'] * recent_interactions['weight']
-            print(recent_interactions)
-            # Category and brand aggregation
-            category_weights = recent_interactions.merge(
-                self.product_df, left_on='product_id', right_index=True
-            ).groupby('category')['final_weight'].sum()
-
-            brand_weights = recent_interactions.merge(
-                self.product_df, left_on='product_id', right_index=True
-            ).groupby('brand')['final_weight'].sum()
-            
-            recency_scores = self._get_recency_scores(category_weights=category_weights, brand_weights=brand_weights, n_items=k)
-            
-            # Get top 10 from each strategy
-            ITEMS_PER_STRATEGY = 10
-            top_collab = collab_scores.nlargest(ITEMS_PER_STRATEGY)
-            
-            # Remove collaborative items from recency scores to avoid duplicates
-            recency_scores[top_collab.index] = 0
-            top_recency = recency_scores.nlargest(ITEMS_PER_STRATEGY)
-            
-            # Combine scores and mark sources
-            scores = pd.Series(0, index=self.product_df.index)
-            recommendation_sources = pd.Series('', index=self.product_df.index)
-            
-            # Add collaborative recommendations
-            scores[top_collab.index] = top_collab
-            recommendation_sources[top_collab.index] = 'collaborative'
-            
-            # Add recency recommendations
-            scores[top_recency.index] = top_recency
-            recommendation_sources[top_recency.index] = 'recency'
-
-        # Get top k recommendations
-        if scores.empty:
-            return pd.DataFrame()
-            
+        now = now or datetime.now()
+
+        def size(source):
+            return max(k, self.candidate_sizes.get(source, k))
+
+        def recency():
+            interactions = recent_interactions
+            if interactions is None:
+                interactions = self._fetch_recent_interactions(user_id, now)
+            return self._recency_from_interactions(interactions, size('recency'), now, allowed)
+
+        results = self.executor.run({
+            'session': lambda: self._get_session_scores(user_id, size('session'), now, allowed),
+            'collaborative': lambda: self._get_collaborative_scores(user_id, size('collaborative'), allowed),
+            'recency': recency,
+            'content': lambda: self._get_content_scores(self._content_seeds(user_id), size('content'), allowed=allowed),
+        }, timeouts=self.strategy_timeouts)
+
+        # The strategies above are timed on their own; the scoring stage is only the blend of their results
+        with timed('scoring'):
+            # Strategies with nothing to say (no recent history) are dropped like ones that missed their deadline
+            candidates = {
+                source: results[source] for source in BLEND_SOURCES
+                if results.get(source) is not None and len(results[source])
+            }
+            if candidates:
+                positions, scores, sources = get_reranker(self.reranker).rerank(
+                    self, candidates, max(k, self.diversity_pool)
+                )
+                chosen = diversify(
+                    positions, scores, self.catalog, k, self.diversity, self.category_cap, self.brand_cap
+                )
+                positions, scores, sources = positions[chosen], scores[chosen], sources[chosen]
+            elif allowed is None:
+                return pd.DataFrame()
+            else:
+                empty = Candidates.empty()
+                positions, scores, sources = empty.positions, empty.scores, np.empty(0, dtype=object)
+            if allowed is not None and len(positions) < k:
+                positions, scores, sources = self._fill(positions, scores, sources, k, allowed)
+        return self._hydrate(user_id, positions, scores, sources)
+
+    def _hydrate(self, user_id, positions, scores, sources):
+        """Catalog rows at positions with their scores, sources and ratings"""
         try:
-            top_products = scores.nlargest(k).index
-            recommendations = self.product_df.loc[top_products].copy()
-            recommendations['score'] = scores[top_products]
-            recommendations['recommendation_source'] = recommendation_sources[top_products]
-            return recommendations.sort_values('score', ascending=False)
-            
-        except KeyError:
-            print("Error accessing product information")
+            with timed('hydration'):
+                recommendations = self.product_df.iloc[positions].copy()
+                recommendations['score'] = scores
+                recommendations['recommendation_source'] = sources
+                return self._with_ratings(recommendations)
+
+        except (KeyError, IndexError):
+            logger.warning('Error accessing product information for user %s', user_id)
             return pd.DataFrame(columns=self.product_df.columns.tolist() + ['score', 'recommendation_source'])
 
+    def _fill(self, positions, scores, sources, k, allowed):
+        """Top a filtered list up to k with the allowed products trending most, then in catalog order"""
+        excluded = ~allowed
+        excluded[positions] = True
+        extra = masked_top_k(self._get_trending_scores(self.trending.top_k), k - len(positions), exclude=excluded)
+        return (
+            np.concatenate([positions, extra]),
+            np.concatenate([scores, np.zeros(len(extra), dtype=np.float32)]),
+            np.concatenate([sources, np.full(len(extra), 'trending', dtype=object)]),
+        )
+
+    def _with_ratings(self, recommendations):
+        """Attach avg_rating and rating_count from the in-memory review aggregates, rounded as rating_summary does"""
+        if recommendations.empty or self.ratings is None:
+            return recommendations
+        if 'product_id' in recommendations.columns:
+            product_ids = recommendations['product_id']
+        else:
+            product_ids = recommendations.index
+        means, counts = self.ratings.lookup(product_ids)
+        recommendations['avg_rating'] = np.round(means.astype(np.float64), 2)
+        recommendations['rating_count'] = counts
+        return recommendations
+
+    def product_ratings(self, product_id):
+        """Review summary for one product from the in-memory aggregates"""
+        means, counts = (self.ratings or RatingStats()).lookup([product_id])
+        return rating_summary(means[0], counts[0])
+
+    def _content_seeds(self, user_id):
+        """The user's most heavily weighted items, used to seed content similarity"""
+        if self.user_item_matrix is None or user_id not in self.user_item_matrix.index:
+            return []
+        row = self.user_item_matrix.loc[user_id].to_numpy(dtype=np.float32)
+        return self.user_item_matrix.columns[masked_top_k(row, CONTENT_SEED_ITEMS, min_score=0.0)].tolist()
+
+    def similar_products(self, product_id, k=10):
+        """Products whose text is most similar to the given product, best first"""
+        with self.pinned():
+            if self.content_index is None:
+                return pd.DataFrame()
+            with timed_strategy('content'):
+                product_ids, similarity = self.content_index.similar_to([product_id], k)
+            with timed('hydration'):
+                recommendations = self.product_df.loc[product_ids].copy()
+                recommendations['score'] = similarity
+                recommendations['recommendation_source'] = 'content'
+                return self._with_ratings(recommendations)
+
+    def products(self, product_ids):
+        """Catalog rows with ratings for product_ids in the order given, unknown ids left out; None before a model loads"""
+        with self.pinned():
+            if self.product_df is None:
+                return None
+            positions = self.catalog.positions(product_ids)
+            with timed('hydration'):
+                products = self.product_df.iloc[positions[positions >= 0]].drop(columns='_id', errors='ignore')
+                return self._with_ratings(products)
+
+    def trending_products(self, k=20, category=None, location=None):
+        """Products with the most time-decayed interaction weight, overall or within one category or location"""
+        with self.pinned():
+            if self.product_df is None:
+                return pd.DataFrame()
+            product_ids, scores = self.trending.top(k, category, location)
+            # Products deleted since they were counted drop out
+            known = self.catalog.positions(product_ids) >= 0
+            with timed('hydration'):
+                recommendations = self.product_df.loc[product_ids[known]].copy()
+                recommendations['score'] = scores[known]
+                recommendations['recommendation_source'] = 'trending'
+                return self._with_ratings(recommendations)
+
+    def _recency_from_interactions(self, recent_interactions, k, now, allowed=None):
+        """Recency scores from a user's recent interactions, or None when there are none"""
+        recent_interactions = pd.DataFrame(recent_interactions)
+        if recent_interactions.empty:
+            return None
+
+        recent_interactions['product_id'] = pd.to_numeric(recent_interactions['product_id'])
+        recent_interactions['timestamp'] = pd.to_datetime(recent_interactions['timestamp'])
+        time_diff_secs = (now - recent_interactions['timestamp']).dt.total_seconds()
+        recent_interactions['time_decay'] = 1.0 - np.exp(-0.05 * time_diff_secs)
+
+        recent_interactions['weight'] = recent_interactions['interaction_type'].map(INTERACTION_WEIGHTS)
+        recent_interactions['final_weight'] = recent_interactions['time_decay'] * recent_interactions['weight']
+        logger.debug('Recent interactions:\n%s', recent_interactions)
+        # Category and brand aggregation
+        with_products = recent_interactions.merge(self.product_df, left_on='product_id', right_index=True)
+        category_weights = with_products.groupby('category')['final_weight'].sum()
+        brand_weights = with_products.groupby('brand')['final_weight'].sum()
+
+        return self._get_recency_scores(
+            category_weights=category_weights, brand_weights=brand_weights, n_items=k, allowed=allowed
+        )
+
     def get_demographic_recommendations(self, location, k):
         return self._get_demographic_recommendations(location, k)
 
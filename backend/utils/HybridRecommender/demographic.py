@@ -1,83 +1,70 @@
+import logging
 import pandas as pd
 import numpy as np
-from bson import json_util
-import json
+from .loader import code_weights, load_interactions
+from .metrics import timed
+from .ranking import group_top_k, masked_top_k
+
+logger = logging.getLogger(__name__)
+
+# Interaction weights used to measure what is popular in a location
+DEMOGRAPHIC_WEIGHTS = {
+    'purchase': 3.0,    # Highest weight for purchases
+    'add_to_cart': 2.0, # Medium weight for add to cart
+    'view': 1.0        # Base weight for views
+}
+
+def get_demographic_recommendations(self, loc, n_items=20, allowed=None):
+
+    # Get interactions of users in the specified location
+    with timed('db_fetch'):
+        user_ids = [user['user_id'] for user in self.db.users.find({'location': loc}, {'_id': 0, 'user_id': 1})]
+        interactions = load_interactions(
+            self.db.interactions, {'user_id': {'$in': user_ids}}, fields=('product_id', 'interaction_type')
+        )
+    if not len(interactions):
+        return pd.DataFrame()
+
+    # Aggregate weights per catalog product, dropping products that are not in the catalog
+    catalog = self.catalog
+    positions = catalog.positions(interactions.product_ids)
+    weights = code_weights(DEMOGRAPHIC_WEIGHTS)[interactions.type_codes]
+    known = positions >= 0
+    product_weights = np.bincount(positions[known], weights=weights[known], minlength=len(catalog))
+    if allowed is not None:
+        # Slots are shared out among the categories of the allowed products only
+        product_weights[~allowed] = 0
 
-def get_demographic_recommendations(self, loc, n_items=20):
-    
-    # Get all interactions and users with proper datetime handling
-    int_data = list(self.db.interactions.find())
-    users_data = list(self.db.users.find({'location': loc}, {'user_id': 1}))
-    
-    int_df = pd.DataFrame(int_data)
-    users_df = pd.DataFrame(users_data)
-    
-    # Filter interactions for users in the specified location
-    int_df = int_df[int_df['user_id'].isin(users_df['user_id'])]
-    
-    #merge with products
-    products_df = pd.DataFrame(list(self.db.products.find()))
-    products_df['product_id'] = pd.to_numeric(products_df['product_id'])
-    products_df = products_df.set_index('product_id')
-    int_df = int_df.merge(products_df, left_on='product_id', right_index=True)
-    
-    # Assign weights based on interaction type
-    interaction_weights = {
-        'purchase': 3.0,    # Highest weight for purchases
-        'add_to_cart': 2.0, # Medium weight for add to cart
-        'view': 1.0        # Base weight for views
-    }
-    
-    # Create weight column based on interaction type
-    int_df['weight'] = int_df['interaction_type'].map(interaction_weights)
-    
     # 1) Compute category weights
-    cat_pop = int_df.groupby('category')['weight'].sum()
+    categorised = catalog.category_codes >= 0
+    cat_pop = np.bincount(
+        catalog.category_codes[categorised], weights=product_weights[categorised], minlength=len(catalog.categories)
+    )
+    if cat_pop.sum() == 0:
+        return pd.DataFrame()
     cat_weights = cat_pop / cat_pop.sum()
-    
+    present = cat_pop > 0
+
     # 2) Allocate each category an integer number of slots
-    cat_counts = (cat_weights * n_items).round().astype(int)
-    
+    cat_counts = np.round(cat_weights * n_items).astype(int)
+
     # 3) Correct rounding so total = n_items
     diff = n_items - cat_counts.sum()
     if diff > 0:
         # Give extra slots to top categories
-        for cat in cat_weights.nlargest(diff).index:
-            cat_counts[cat] += 1
+        cat_counts[masked_top_k(cat_weights, diff, exclude=~present)] += 1
     elif diff < 0:
         # Remove slots from smallest-weight categories
-        for cat in cat_weights.nsmallest(-diff).index:
-            cat_counts[cat] -= 1
-    
-    # 4) For each category, pick the top-weighted products
-    recommended_products = []
-    for cat, cnt in cat_counts.items():
-        if cnt <= 0:
-            continue
-        # Get products in category, weighted by interaction
-        prod_weights = (
-            int_df[int_df['category']==cat]
-            .groupby('product_id')['weight']
-            .sum()
-        )
-        if prod_weights.empty:
-            # Fallback: take any cnt products at random
-            picks = products_df[products_df['category']==cat].sample(cnt).index.tolist()
-        else:
-            # Deterministic: choose top cnt products
-            picks = prod_weights.nlargest(cnt).index.tolist()
-        recommended_products.extend(picks)
-    
-    # 5) Get full product details from MongoDB
-    product_details = []
-    for product_id in recommended_products:
-        product = self.db.products.find_one({'product_id': product_id}, {'_id': 0})
-        if product:
-            product_details.append(product)
-    
-    # Convert to DataFrame
-    recommendations_df = pd.DataFrame(product_details)
-    
-    print(recommendations_df)
+        cat_counts[masked_top_k(-cat_weights, -diff, exclude=~present)] -= 1
+
+    # 4) For each category, pick the top-weighted products it has interactions for
+    scores = np.where(product_weights > 0, product_weights, -np.inf)
+    picks = group_top_k(scores, catalog.category_codes, cat_counts)
+
+    # 5) Hydrate from the in-memory catalog
+    with timed('hydration'):
+        recommendations_df = self.product_df.iloc[picks].drop(columns='_id', errors='ignore')
+        recommendations_df['score'] = product_weights[picks]
+
+    logger.debug('Demographic recommendations for %s:\n%s', loc, recommendations_df)
     return recommendations_df
-    
@@ -0,0 +1,65 @@
+"""Diversity stage: maximal marginal relevance with per-category and per-brand caps
+
+Two items are as similar as the attributes they share: CATEGORY_SIMILARITY for the same
+category plus BRAND_SIMILARITY for the same brand, read from the catalog's integer codes.
+Each step picks the item with the best trade-off between relevance and its highest
+similarity to anything already picked. It then updates that running maximum against the
+new pick only, so choosing k of n candidates costs k vector passes over n codes. Ties go
+to the earlier, more relevant candidate, so the result is deterministic.
+"""
+import numpy as np
+
+CATEGORY_SIMILARITY = 0.6
+BRAND_SIMILARITY = 0.4
+
+
+def _counts(codes):
+    """Compact index of each code plus a zeroed counter per distinct code"""
+    distinct, index = np.unique(codes, return_inverse=True)
+    return index, np.zeros(len(distinct), dtype=np.int32)
+
+
+def diversify(positions, scores, catalog, k, diversity=0.3, category_cap=None, brand_cap=None):
+    """Indices into positions of the k items to show, in display order
+
+    diversity is the weight given to dissimilarity (0 keeps the relevance order). A cap
+    limits how many items one category or brand may take, but is ignored once no capped-in
+    candidate is left, so the list is never cut short because of it.
+    """
+    n = len(positions)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if diversity <= 0 and category_cap is None and brand_cap is None:
+        return np.argsort(-scores, kind='stable')[:k]
+
+    categories = catalog.category_codes[positions]
+    brands = catalog.brand_codes[positions]
+    relevance = scores / scores.max() if scores.max() > 0 else np.zeros(n, dtype=np.float32)
+    category_index, category_counts = _counts(categories)
+    brand_index, brand_counts = _counts(brands)
+
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked = np.empty(k, dtype=np.intp)
+    for step in range(k):
+        eligible = available.copy()
+        if category_cap is not None:
+            eligible &= (category_counts[category_index] < category_cap) | (categories < 0)
+        if brand_cap is not None:
+            eligible &= (brand_counts[brand_index] < brand_cap) | (brands < 0)
+        if not eligible.any():
+            eligible = available
+        gain = (1 - diversity) * relevance - diversity * max_similarity
+        pick = int(np.argmax(np.where(eligible, gain, -np.inf)))
+        picked[step] = pick
+        available[pick] = False
+        category_counts[category_index[pick]] += 1
+        brand_counts[brand_index[pick]] += 1
+        # Unknown codes (-1) are never similar to anything
+        similarity = (
+            CATEGORY_SIMILARITY * ((categories == categories[pick]) & (categories >= 0))
+            + BRAND_SIMILARITY * ((brands == brands[pick]) & (brands >= 0))
+        )
+        np.maximum(max_similarity, similarity, out=max_similarity)
+    return picked
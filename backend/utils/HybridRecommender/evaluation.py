@@ -0,0 +1,215 @@
+"""Offline evaluation of HybridRecommender by replaying logged interactions
+
+Usage (from backend/):
+    python -m utils.HybridRecommender.evaluation --data-dir ../data --k 10 --workers 4
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from .archive import InteractionArchive
+from .core import BLEND_SOURCES, HybridRecommender, RECENT_DAYS
+from .factorization import ALSModel
+from .interface import bind_strategies
+from .rerank import RERANKERS
+
+logger = logging.getLogger(__name__)
+
+_worker = None
+
+
+def load_data(data_dir, archive_dir=None):
+    """Read interactions and products from the CSV exports in data_dir, or interactions from a Parquet archive"""
+    if archive_dir is not None:
+        interactions = InteractionArchive(archive_dir).read_frame()
+        interactions['interaction_type'] = interactions['interaction_type'].astype(object)
+    else:
+        interactions = pd.read_csv(os.path.join(data_dir, 'interactions.csv'))
+        interactions['timestamp'] = pd.to_datetime(interactions['timestamp'])
+    products = pd.read_csv(os.path.join(data_dir, 'products.csv'))
+    return interactions, products
+
+
+def split_interactions(interactions, split='time', test_fraction=0.2):
+    """Split interactions into a training log and held-out test cases
+
+    split='time': everything after the (1 - test_fraction) timestamp quantile is held out and each
+    test user is scored as of that cutoff.
+    split='last': each user's last interaction is held out and the user is scored as of its timestamp.
+
+    Returns (train, cases) where cases maps user_id -> (as_of timestamp, set of held-out product ids).
+    """
+    interactions = interactions.sort_values('timestamp', kind='stable')
+    if split == 'time':
+        cutoff = interactions['timestamp'].quantile(1 - test_fraction)
+        train = interactions[interactions['timestamp'] < cutoff]
+        test = interactions[interactions['timestamp'] >= cutoff]
+        cases = {
+            int(user_id): (cutoff, set(group['product_id'].astype(int)))
+            for user_id, group in test.groupby('user_id')
+        }
+    elif split == 'last':
+        is_last = ~interactions.duplicated('user_id', keep='last')
+        # Users with a single interaction have nothing to train on
+        counts = interactions.groupby('user_id')['user_id'].transform('size')
+        held_out = interactions[is_last & (counts > 1)]
+        train = interactions.drop(held_out.index)
+        cases = {
+            int(row.user_id): (row.timestamp, {int(row.product_id)})
+            for row in held_out.itertuples()
+        }
+    else:
+        raise ValueError(f"Unknown split: {split}")
+    return train, cases
+
+
+def precision_recall_ndcg(recommended, relevant, k):
+    """precision@k, recall@k and binary-relevance NDCG@k for one user"""
+    recommended = list(recommended)[:k]
+    hits = np.array([item in relevant for item in recommended], dtype=float)
+    precision = hits.sum() / k
+    recall = hits.sum() / len(relevant) if relevant else 0.0
+    discounts = 1.0 / np.log2(np.arange(2, len(recommended) + 2))
+    dcg = float((hits * discounts).sum())
+    ideal = float((1.0 / np.log2(np.arange(2, min(len(relevant), k) + 2))).sum())
+    ndcg = dcg / ideal if ideal > 0 else 0.0
+    return precision, recall, ndcg
+
+
+def build_recommender(train, products, params=None, seed=0):
+    """A HybridRecommender built from in-memory frames, with no database attached"""
+    bind_strategies()
+    recommender = HybridRecommender()
+    # Keep the content index in memory so parallel workers do not race on the persisted copy
+    recommender.content_index_dir = None
+    recommender.mf_model_dir = None
+    for name, value in (params or {}).items():
+        setattr(recommender, name, value)
+    recommender.load_frames(train.copy(), products.copy())
+    if recommender.collaborative_model == 'als' and recommender.user_item_matrix is not None:
+        # Factors are trained on the training split only, never read from disk
+        recommender.mf_model = ALSModel.train(recommender.user_item_matrix, workers=1, seed=seed)
+    return recommender
+
+
+def _init_worker(train, products, params, seed):
+    global _worker
+    _worker = (build_recommender(train, products, params, seed), dict(tuple(train.groupby('user_id'))))
+
+
+def _score_shard(shard):
+    recommender, by_user = _worker
+    cases, k = shard
+    results = []
+    for user_id, as_of in cases:
+        history = by_user[user_id]
+        recent = history[history['timestamp'] >= as_of - timedelta(days=RECENT_DAYS)]
+        recent = recent[recent['timestamp'] < as_of]
+        recommendations = recommender.score_user(
+            user_id, k, None, True,
+            recent_interactions=recent[['product_id', 'interaction_type', 'timestamp']].to_dict('records'),
+            now=as_of.to_pydatetime()
+        )
+        results.append((user_id, [int(product_id) for product_id in recommendations.index]))
+    return results
+
+
+def evaluate(interactions, products, k=10, split='time', test_fraction=0.2, workers=None, params=None, seed=0):
+    """Score every test user with history through HybridRecommender and report ranking quality"""
+    train, cases = split_interactions(interactions, split, test_fraction)
+    known_users = set(train['user_id'].astype(int))
+    scorable = [(user_id, as_of) for user_id, (as_of, _) in sorted(cases.items()) if user_id in known_users]
+
+    workers = workers or os.cpu_count() or 1
+    shards = [
+        ([tuple(case) for case in shard], k)
+        for shard in np.array_split(np.array(scorable, dtype=object), max(1, workers * 4))
+        if len(shard)
+    ]
+
+    start = time.perf_counter()
+    recommended = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(train, products, params, seed)) as pool:
+        for shard_results in pool.map(_score_shard, shards):
+            recommended.update(shard_results)
+    elapsed = time.perf_counter() - start
+
+    per_user = np.array([
+        precision_recall_ndcg(items, cases[user_id][1], k) for user_id, items in recommended.items()
+    ]).reshape(-1, 3)
+    distinct_items = set(item for items in recommended.values() for item in items)
+
+    return {
+        'split': split,
+        'k': k,
+        'params': params or {},
+        'users_evaluated': len(recommended),
+        'users_skipped_cold': len(cases) - len(scorable),
+        f'precision@{k}': float(per_user[:, 0].mean()) if len(per_user) else 0.0,
+        f'recall@{k}': float(per_user[:, 1].mean()) if len(per_user) else 0.0,
+        f'ndcg@{k}': float(per_user[:, 2].mean()) if len(per_user) else 0.0,
+        'catalog_coverage': len(distinct_items) / len(products) if len(products) else 0.0,
+        'seconds': elapsed,
+        'users_per_second': len(recommended) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline evaluation of HybridRecommender')
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data'))
+    parser.add_argument('--archive-dir', default=None, help='Read interactions from a Parquet archive instead of the CSV')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--split', choices=['time', 'last'], default='time')
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--items-per-strategy', type=int, default=None)
+    parser.add_argument('--neighbours', type=int, default=None)
+    parser.add_argument('--session-weight', type=float, default=None)
+    parser.add_argument('--collab-weight', type=float, default=None)
+    parser.add_argument('--recency-weight', type=float, default=None)
+    parser.add_argument('--content-weight', type=float, default=None)
+    parser.add_argument('--candidates', type=int, default=None, help='Candidates taken from every source')
+    parser.add_argument('--reranker', choices=sorted(RERANKERS), default=None)
+    parser.add_argument('--diversity', type=float, default=None, help='0 keeps the re-ranked relevance order')
+    parser.add_argument('--category-cap', type=int, default=None, help='0 for no cap')
+    parser.add_argument('--brand-cap', type=int, default=None, help='0 for no cap')
+    parser.add_argument('--collaborative-model', choices=['cosine', 'als'], default=None)
+    args = parser.parse_args(argv)
+
+    params = {
+        name: value for name, value in (
+            ('items_per_strategy', args.items_per_strategy),
+            ('n_neighbours', args.neighbours),
+            ('session_weight', args.session_weight),
+            ('collab_weight', args.collab_weight),
+            ('recency_weight', args.recency_weight),
+            ('content_weight', args.content_weight),
+            ('candidate_sizes', None if args.candidates is None else dict.fromkeys(BLEND_SOURCES, args.candidates)),
+            ('reranker', args.reranker),
+            ('diversity', args.diversity),
+            ('category_cap', args.category_cap),
+            ('brand_cap', args.brand_cap),
+            ('collaborative_model', args.collaborative_model),
+        ) if value is not None
+    }
+    for name in ('category_cap', 'brand_cap'):
+        if params.get(name) == 0:
+            params[name] = None
+    interactions, products = load_data(args.data_dir, args.archive_dir)
+    report = evaluate(
+        interactions, products, k=args.k, split=args.split, test_fraction=args.test_fraction,
+        workers=args.workers, params=params, seed=args.seed
+    )
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
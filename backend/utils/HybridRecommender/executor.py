@@ -0,0 +1,93 @@
+"""Concurrent execution of independent recommendation strategies"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .metrics import STRATEGY_OUTCOMES, timed_strategy
+from .profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide thread pool shared by every recommender instance"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("STRATEGY_WORKERS", "8")),
+                thread_name_prefix='strategy'
+            )
+        return _pool
+
+
+class _Task:
+    """One submitted strategy and the moment a worker picked it up"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.started_at = None
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.started_at = time.monotonic()
+        self.started.set()
+        with timed_strategy(self.name):
+            # Profiled here too when the request is being profiled
+            return PROFILER.run_task(self.func)
+
+
+class StrategyExecutor:
+    """Runs named strategies concurrently and drops any that miss their deadline"""
+
+    def __init__(self, pool=None, default_timeout=1.0):
+        self._pool = pool
+        self.default_timeout = default_timeout
+
+    @property
+    def pool(self):
+        return self._pool or get_pool()
+
+    def run(self, strategies, timeouts=None):
+        """Run {name: callable} and return {name: result} for the strategies that finished in time
+
+        Timeouts are per strategy, in seconds, measured from when a worker starts it, so
+        time spent queued behind other requests does not count. A strategy still queued
+        after its timeout is cancelled before it starts. One that times out while running
+        keeps its worker until it returns, which is why STRATEGY_WORKERS should allow for
+        a few slow requests at once. A strategy that times out or raises is left out of the
+        result so callers can blend the rest.
+        """
+        timeouts = timeouts or {}
+        submitted = time.monotonic()
+        tasks = {name: _Task(name, func) for name, func in strategies.items()}
+        futures = {
+            # Each task runs in a copy of the caller's context so context-local state follows it
+            name: self.pool.submit(contextvars.copy_context().run, task)
+            for name, task in tasks.items()
+        }
+
+        results = {}
+        for name, future in futures.items():
+            task, timeout = tasks[name], timeouts.get(name, self.default_timeout)
+            try:
+                if not task.started.wait(max(0.0, submitted + timeout - time.monotonic())) and future.cancel():
+                    raise FutureTimeoutError()
+                task.started.wait()
+                results[name] = future.result(timeout=max(0.0, task.started_at + timeout - time.monotonic()))
+                STRATEGY_OUTCOMES.inc(strategy=name, outcome='ok')
+            except FutureTimeoutError:
+                # A running worker carries on, but its result is ignored
+                STRATEGY_OUTCOMES.inc(strategy=name, outcome='timeout')
+                logger.warning('Strategy %s missed its %.3fs deadline', name, timeout)
+            except Exception:
+                STRATEGY_OUTCOMES.inc(strategy=name, outcome='error')
+                logger.exception('Strategy %s failed', name)
+        return results
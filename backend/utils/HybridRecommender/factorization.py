@@ -0,0 +1,282 @@
+"""Implicit-feedback matrix factorization (ALS) trained offline on the user-item weights
+
+Train and save factors (from backend/):
+    python -m utils.HybridRecommender.factorization --factors 32 --iterations 15 --warm-start
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .ranking import Candidates, masked_top_k
+from .storage import save_array, save_json
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'als')
+# Fold-in vectors kept per model version for users who joined after training
+FOLD_IN_CACHE_SIZE = 1024
+
+
+def _solve_rows(indptr, indices, data, fixed, gram, regularization, alpha, rows):
+    """Least-squares update for a block of rows with the other side held fixed
+
+    Hu, Koren & Volinsky: x_u = (YtY + Yt(C_u - I)Y + lambda I)^-1 Yt C_u p(u),
+    with confidence C = 1 + alpha * r and preference p = 1 for every observed item.
+    """
+    n_factors = fixed.shape[1]
+    out = np.empty((len(rows), n_factors), dtype=np.float32)
+    eye = regularization * np.eye(n_factors, dtype=np.float64)
+    for i, row in enumerate(rows):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            out[i] = 0.0
+            continue
+        items = indices[start:end]
+        confidence = alpha * data[start:end]
+        factors = fixed[items].astype(np.float64)
+        a = gram + (factors.T * confidence) @ factors + eye
+        b = factors.T @ (1.0 + confidence)
+        out[i] = np.linalg.solve(a, b)
+    return out
+
+
+class ALSModel:
+    """User and item factor arrays (float32) for implicit-feedback scoring"""
+
+    def __init__(self, user_ids, item_ids, user_factors, item_factors, params=None):
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids)
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.params = params or {}
+        self._user_rows = {int(user_id): row for row, user_id in enumerate(self.user_ids)}
+
+    @property
+    def n_factors(self):
+        return self.item_factors.shape[1]
+
+    @classmethod
+    def train(cls, user_item_matrix, factors=32, regularization=0.1, alpha=10.0, iterations=10,
+              workers=None, previous=None, seed=0):
+        """Fit factors to a user x item weight DataFrame, warm-starting from a previous model if given"""
+        weights = sparse.csr_matrix(user_item_matrix.to_numpy(dtype=np.float32))
+        user_ids = user_item_matrix.index.to_numpy()
+        item_ids = user_item_matrix.columns.to_numpy()
+        rng = np.random.default_rng(seed)
+        user_factors = (rng.standard_normal((len(user_ids), factors)) * 0.01).astype(np.float32)
+        item_factors = (rng.standard_normal((len(item_ids), factors)) * 0.01).astype(np.float32)
+
+        if previous is not None and previous.n_factors == factors:
+            # Reuse factors for users and items the previous model already knew
+            _copy_known(previous.user_ids, previous.user_factors, user_ids, user_factors)
+            _copy_known(previous.item_ids, previous.item_factors, item_ids, item_factors)
+
+        workers = workers or os.cpu_count() or 1
+        by_user = weights
+        by_item = weights.T.tocsr()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='als') as pool:
+            for iteration in range(iterations):
+                user_factors = _alternate(pool, workers, by_user, item_factors, regularization, alpha)
+                item_factors = _alternate(pool, workers, by_item, user_factors, regularization, alpha)
+                logger.debug('ALS iteration %d done after %.2fs', iteration + 1, time.perf_counter() - start)
+
+        params = {'factors': factors, 'regularization': regularization, 'alpha': alpha, 'iterations': iterations}
+        return cls(user_ids, item_ids, user_factors, item_factors, params)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        save_array(path, 'user_factors', np.asarray(self.user_factors))
+        save_array(path, 'item_factors', np.asarray(self.item_factors))
+        save_array(path, 'user_ids', self.user_ids)
+        save_array(path, 'item_ids', self.item_ids)
+        save_json(path, 'meta.json', {'version': MODEL_VERSION, 'params': self.params})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != MODEL_VERSION:
+            raise ValueError(f"ALS model at {path} has version {meta.get('version')}, expected {MODEL_VERSION}")
+        mode = 'r' if mmap else None
+        return cls(
+            np.load(os.path.join(path, 'user_ids.npy')),
+            np.load(os.path.join(path, 'item_ids.npy')),
+            np.load(os.path.join(path, 'user_factors.npy'), mmap_mode=mode),
+            np.load(os.path.join(path, 'item_factors.npy'), mmap_mode=mode),
+            meta.get('params'),
+        )
+
+    def user_vector(self, user_id):
+        row = self._user_rows.get(int(user_id))
+        return None if row is None else self.user_factors[row]
+
+    def fold_in(self, item_weights):
+        """Factor vector for a user from {item_id: weight}, solved against the fixed item factors"""
+        item_rows = pd.Series(np.arange(len(self.item_ids)), index=self.item_ids)
+        weights = pd.Series(item_weights, dtype=np.float32)
+        weights = weights[weights.index.isin(item_rows.index) & (weights > 0)]
+        if weights.empty:
+            return np.zeros(self.n_factors, dtype=np.float32)
+        rows = item_rows[weights.index].to_numpy()
+        order = np.argsort(rows)
+        indices = rows[order].astype(np.int32)
+        data = weights.to_numpy()[order]
+        item_factors = np.asarray(self.item_factors)
+        gram = item_factors.T.astype(np.float64) @ item_factors
+        return _solve_rows(
+            np.array([0, len(indices)]), indices, data, item_factors, gram,
+            self.params.get('regularization', 0.1), self.params.get('alpha', 10.0), [0]
+        )[0]
+
+    def scores(self, user_vector):
+        """Predicted preference for every item, in item_ids order"""
+        return np.asarray(self.item_factors) @ user_vector
+
+    def top_k(self, user_vector, k, exclude_item_ids=()):
+        """(item_ids, scores) of the k best items, best first"""
+        scores = self.scores(user_vector)
+        if len(exclude_item_ids):
+            scores[np.isin(self.item_ids, list(exclude_item_ids))] = -np.inf
+        k = min(k, len(scores))
+        if k <= 0:
+            return self.item_ids[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        return self.item_ids[top], scores[top]
+
+
+class FoldInCache:
+    """Bounded LRU of fold-in vectors for users the model was not trained on
+
+    Each ModelState owns one, because the vectors come from its user_item_matrix rows;
+    the model itself is never changed, so published states stay immutable.
+    """
+
+    def __init__(self, size=FOLD_IN_CACHE_SIZE):
+        self.size = size
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, compute):
+        """The cached vector for user_id, or compute() stored as the most recent entry"""
+        with self._lock:
+            vector = self._vectors.get(user_id)
+            if vector is not None:
+                self._vectors.move_to_end(user_id)
+                return vector
+        vector = compute()
+        with self._lock:
+            self._vectors[user_id] = vector
+            while len(self._vectors) > self.size:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def __len__(self):
+        return len(self._vectors)
+
+
+def _copy_known(old_ids, old_factors, new_ids, new_factors):
+    old_rows = pd.Series(np.arange(len(old_ids)), index=old_ids)
+    positions = old_rows.reindex(new_ids)
+    known = positions.notna().to_numpy()
+    new_factors[known] = np.asarray(old_factors)[positions[known].astype(int).to_numpy()]
+
+
+def _alternate(pool, workers, weights, fixed, regularization, alpha):
+    """Recompute every row's factors against the fixed side, in parallel blocks"""
+    fixed = np.asarray(fixed)
+    gram = fixed.T.astype(np.float64) @ fixed
+    blocks = [block for block in np.array_split(np.arange(weights.shape[0]), workers * 4) if len(block)]
+    solved = pool.map(
+        lambda rows: _solve_rows(weights.indptr, weights.indices, weights.data, fixed, gram, regularization, alpha, rows),
+        blocks
+    )
+    return np.vstack(list(solved)) if blocks else np.zeros((0, fixed.shape[1]), dtype=np.float32)
+
+
+def load_model(path):
+    """The saved model at path, or None if there is none or it cannot be read"""
+    if not path or not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        return ALSModel.load(path)
+    except (OSError, ValueError) as e:
+        logger.warning('Could not load ALS model from %s: %s', path, e)
+        return None
+
+
+def get_als_scores(self, user_id, n_items=20, allowed=None):
+    """Collaborative candidates from the factor model: the n_items best scoring catalog products"""
+    vector = self.mf_model.user_vector(user_id)
+    if vector is None:
+        if self.user_item_matrix is None or user_id not in self.user_item_matrix.index:
+            return Candidates.empty()
+        # User joined after the last training run: fold them in from their current weights
+        model, weights = self.mf_model, self.user_item_matrix.loc[user_id]
+        vector = self.state.fold_ins.get(user_id, lambda: model.fold_in(weights.to_dict()))
+
+    if allowed is None:
+        item_ids, scores = self.mf_model.top_k(vector, n_items)
+        return Candidates.from_positions(self.catalog.positions(item_ids), scores, n_items).normalized()
+    # Filtered: the mask has to be applied before the top-k cut, so every item is mapped
+    scores = self.mf_model.scores(vector)
+    positions = self.catalog.positions(self.mf_model.item_ids)
+    best = masked_top_k(scores, n_items, exclude=(positions < 0) | ~allowed[positions], min_score=0.0)
+    return Candidates(positions[best], scores[best]).normalized()
+
+
+def main(argv=None):
+    from .evaluation import build_recommender, load_data
+
+    parser = argparse.ArgumentParser(description='Train the ALS collaborative model')
+    parser.add_argument('--data-dir', default=None, help='Train from CSV exports instead of MongoDB')
+    parser.add_argument('--model-dir', default=os.getenv("MF_MODEL_DIR", DEFAULT_MODEL_DIR))
+    parser.add_argument('--factors', type=int, default=32)
+    parser.add_argument('--regularization', type=float, default=0.1)
+    parser.add_argument('--alpha', type=float, default=10.0)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--warm-start', action='store_true', help='Initialise from the factors in --model-dir')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.data_dir:
+        interactions, products = load_data(args.data_dir)
+        recommender = build_recommender(interactions, products)
+    else:
+        import dotenv
+        from .core import HybridRecommender
+        from .interface import bind_strategies
+
+        dotenv.load_dotenv()
+        bind_strategies()
+        recommender = HybridRecommender()
+        recommender.connect(os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db"))
+
+    previous = load_model(args.model_dir) if args.warm_start else None
+    start = time.perf_counter()
+    model = ALSModel.train(
+        recommender.user_item_matrix, factors=args.factors, regularization=args.regularization,
+        alpha=args.alpha, iterations=args.iterations, workers=args.workers, previous=previous
+    )
+    model.save(args.model_dir)
+    logger.info(
+        'Trained %d users x %d items in %.2fs, saved to %s',
+        len(model.user_ids), len(model.item_ids), time.perf_counter() - start, args.model_dir
+    )
+
+
+if __name__ == '__main__':
+    main()
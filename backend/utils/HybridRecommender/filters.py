@@ -0,0 +1,54 @@
+"""Constraints on which products a recommendation may contain
+
+A Filters turns into a boolean mask over the catalog by AND-ing the catalog's
+precomputed packed bitsets (one per category and per brand) with a price band cut
+from its sorted price index. Strategies apply the mask inside their top-k selection,
+so a constrained request ranks the same number of candidates as an unconstrained one.
+"""
+import numpy as np
+
+
+class Filters:
+    """Category, brand and price band a recommendation must match; None means unconstrained"""
+
+    def __init__(self, category=None, brand=None, min_price=None, max_price=None):
+        self.category = category
+        self.brand = brand
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def from_args(cls, args):
+        """From request query arguments; raises ValueError for a price that is not a number"""
+        prices = [args.get(name) for name in ('min_price', 'max_price')]
+        min_price, max_price = [None if value in (None, '') else float(value) for value in prices]
+        return cls(args.get('category') or None, args.get('brand') or None, min_price, max_price)
+
+    def __bool__(self):
+        return any(value is not None for value in (self.category, self.brand, self.min_price, self.max_price))
+
+    def _key(self):
+        return self.category, self.brand, self.min_price, self.max_price
+
+    def __eq__(self, other):
+        return isinstance(other, Filters) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return (f'Filters(category={self.category!r}, brand={self.brand!r}, '
+                f'min_price={self.min_price!r}, max_price={self.max_price!r})')
+
+    def mask(self, catalog):
+        """Boolean array in catalog order marking the allowed products, or None when nothing is filtered"""
+        if not self:
+            return None
+        bits = catalog.all_bitset()
+        if self.category is not None:
+            bits &= catalog.category_bitset(self.category)
+        if self.brand is not None:
+            bits &= catalog.brand_bitset(self.brand)
+        if self.min_price is not None or self.max_price is not None:
+            bits &= catalog.price_bitset(self.min_price, self.max_price)
+        return np.unpackbits(bits, count=len(catalog)).astype(bool)
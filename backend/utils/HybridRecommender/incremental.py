@@ -0,0 +1,173 @@
+"""Applying database changes to a ModelState without a full rebuild"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .loader import object_id_key
+from .ratings import RatingStats, review_weights
+
+logger = logging.getLogger(__name__)
+
+INTERACTION_WEIGHTS = {'view': 1, 'add_to_cart': 3, 'purchase': 5}
+
+
+class ChangeBatch:
+    """Product upserts, product deletions, new interactions and new reviews collected from the change feed"""
+
+    def __init__(self, products=None, deleted_products=None, interactions=None, reviews=None, needs_rebuild=False,
+                 sessions_only=False):
+        # product_id -> latest full document
+        self.products = products or {}
+        self.deleted_products = set(deleted_products or ())
+        self.interactions = interactions or []
+        self.reviews = reviews or []
+        # Interaction/review deletes and edits only carry an _id, so their old weight cannot be
+        # subtracted; a full rebuild is needed
+        self.needs_rebuild = needs_rebuild
+        # The interactions only advance live sessions; their weights arrive with the next rebuild
+        self.sessions_only = sessions_only
+
+    def __bool__(self):
+        return bool(self.products or self.deleted_products or self.interactions or self.reviews or self.needs_rebuild)
+
+    def __len__(self):
+        return len(self.products) + len(self.deleted_products) + len(self.interactions) + len(self.reviews)
+
+
+def raw_weights(interactions, reviews=None):
+    """user x product sums of interaction and review weights, which can be negative"""
+    pairs = []
+    if interactions is not None and not interactions.empty:
+        interactions['product_id'] = pd.to_numeric(interactions['product_id'])
+        interactions['weight'] = interactions['interaction_type'].map(INTERACTION_WEIGHTS).astype(float)
+        pairs.append(interactions[['user_id', 'product_id', 'weight']])
+    if reviews is not None and not reviews.empty:
+        pairs.append(review_weights(reviews))
+    return pd.concat(pairs).pivot_table(
+        index='user_id',
+        columns='product_id',
+        values='weight',
+        aggfunc='sum',
+        fill_value=0
+    )
+
+
+def interaction_weights(interactions, reviews=None):
+    """(user x product weight matrix, negative_weights) from interaction and review DataFrames
+
+    A bad review can cancel out the interactions that preceded it, but never go below no
+    signal, so the matrix is clipped at 0. negative_weights keeps the sums that were clipped,
+    as a Series indexed by (user_id, product_id), so later changes add to the true sum.
+    """
+    return split_negative(raw_weights(interactions, reviews))
+
+
+def split_negative(raw):
+    """(raw clipped at 0, the negative cells of raw stacked by (user_id, product_id))"""
+    negative = raw.where(raw < 0).stack()
+    return raw.clip(lower=0), negative[negative < 0]
+
+
+def add_weights(user_item_matrix, negative_weights, delta):
+    """(user_item_matrix, negative_weights) with the raw delta added, clipped once
+
+    Only the cells of the delta's users and products are recomputed. When the delta brings
+    no new users or products they are written into the float64 matrix's own array, which the
+    returned matrix shares, so a batch costs its touched cells rather than a copy of the
+    whole matrix. New users or products, or another dtype, copy it once into a new array.
+    """
+    if user_item_matrix is None:
+        return split_negative(delta)
+    users = user_item_matrix.index.union(delta.index)
+    products = user_item_matrix.columns.union(delta.columns)
+    if len(users) == len(user_item_matrix.index) and len(products) == len(user_item_matrix.columns):
+        users, products = user_item_matrix.index, user_item_matrix.columns
+        # A view of the matrix's own block unless it has to be converted to float64
+        values = user_item_matrix.to_numpy(dtype=np.float64)
+        if not values.flags.writeable:
+            values = values.copy()
+    else:
+        values = np.zeros((len(users), len(products)))
+        values[np.ix_(users.get_indexer(user_item_matrix.index), products.get_indexer(user_item_matrix.columns))] = \
+            user_item_matrix.to_numpy(dtype=np.float64)
+
+    cells = pd.MultiIndex.from_product([delta.index, delta.columns], names=['user_id', 'product_id'])
+    touched = np.ix_(users.get_indexer(delta.index), products.get_indexer(delta.columns))
+    if negative_weights is None:
+        negative_weights = pd.Series(dtype=np.float64, index=cells[:0])
+    prior = negative_weights.reindex(cells, fill_value=0).to_numpy().reshape(delta.shape)
+    total = values[touched] + prior + delta.to_numpy(dtype=np.float64)
+    values[touched] = np.maximum(total, 0)
+
+    negative = pd.Series(total.ravel(), index=cells)
+    negative_weights = pd.concat([
+        negative_weights.drop(negative_weights.index.intersection(cells)),
+        negative[negative < 0],
+    ])
+    return pd.DataFrame(values, index=users, columns=products, copy=False), negative_weights
+
+
+def apply_changes(state, batch, seen_ids=None):
+    """A new ModelState with the batch applied
+
+    state keeps its own fields, except that weights for users and products already in its
+    matrix are written into the matrix's array, which the new state shares (see add_weights).
+    That write comes after everything that can fail, so a failed batch leaves state as it was.
+
+    seen_ids (object_id_key values) lets a rebuild replay batches that arrived while it was
+    fetching without counting interactions or reviews its own snapshot already contains.
+    """
+    user_item_matrix, product_df, content_index = state.user_item_matrix, state.product_df, state.content_index
+    ratings, sessions, negative_weights = state.ratings, state.sessions, state.negative_weights
+
+    interactions, reviews = batch.interactions, batch.reviews
+    if seen_ids is not None:
+        interactions = [doc for doc in interactions if object_id_key(doc.get('_id')) not in seen_ids]
+        reviews = [doc for doc in reviews if object_id_key(doc.get('_id')) not in seen_ids]
+    if interactions and sessions is not None:
+        sessions = sessions.updated(interactions)
+    if batch.sessions_only:
+        interactions = []
+    delta = None
+    if interactions or reviews:
+        reviews = pd.DataFrame(reviews) if reviews else None
+        # Unclipped, so a bad review lowers weights added by earlier batches like it would in a rebuild
+        delta = raw_weights(pd.DataFrame(interactions) if interactions else None, reviews)
+        if reviews is not None:
+            ratings = (ratings or RatingStats()).with_reviews(reviews)
+
+    if batch.products:
+        changed = pd.DataFrame(list(batch.products.values()))
+        changed['product_id'] = pd.to_numeric(changed['product_id'])
+        changed = changed.set_index('product_id')
+        if product_df is None:
+            product_df = changed
+        else:
+            product_df = pd.concat([product_df.drop(product_df.index.intersection(changed.index)), changed])
+
+    deleted = list(batch.deleted_products)
+    if deleted and product_df is not None:
+        product_df = product_df.drop(product_df.index.intersection(deleted))
+
+    if content_index is not None and content_index.idf is not None and (batch.products or deleted):
+        changed_rows = product_df.loc[product_df.index.intersection(list(batch.products))] if batch.products else None
+        content_index = content_index.updated(changed_rows, deleted)
+
+    if delta is not None:
+        user_item_matrix, negative_weights = add_weights(user_item_matrix, negative_weights, delta)
+    if deleted:
+        if user_item_matrix is not None:
+            user_item_matrix = user_item_matrix.drop(columns=user_item_matrix.columns.intersection(deleted))
+        if negative_weights is not None and len(negative_weights):
+            negative_weights = negative_weights[~negative_weights.index.get_level_values('product_id').isin(deleted)]
+
+    return state.replace(
+        user_item_matrix=user_item_matrix,
+        product_df=product_df,
+        content_index=content_index,
+        ratings=ratings,
+        sessions=sessions,
+        negative_weights=negative_weights,
+        version=state.version + 1,
+    )
@@ -1,31 +1,173 @@
 """Interface module for HybridRecommender package"""
+import functools
+import hashlib
+import threading
+
+import numpy as np
 
 from .base import RecommenderInterface
 from .core import HybridRecommender
-from .recency import get_recency_scores
-from .collaborative import _get_collaborative_scores
-from .context import get_context_recommendations
-from .demographic import get_demographic_recommendations
+# Strategy functions are aliased so the module-level wrappers below cannot shadow them
+from .recency import get_recency_scores as _recency_strategy
+from .collaborative import _get_collaborative_scores as _collaborative_strategy
+from .context import get_context_recommendations as _context_strategy
+from .context import get_context_popularity as _context_popularity_strategy
+from .demographic import get_demographic_recommendations as _demographic_strategy
+from .content import get_content_scores as _content_strategy
+from .factorization import get_als_scores as _als_strategy
+from .session import get_session_scores as _session_strategy
+from .trending import get_trending_scores as _trending_strategy
+from .coalesce import COALESCER
+from .metrics import MODEL_AGE_SECONDS, MODEL_VERSION
+from .profiling import PROFILER
+from .incremental import ChangeBatch
+from .tenants import DEFAULT_TENANT, Tenant, TenantRegistry
+
+def _key_part(value):
+    """value as a hashable key component; arrays such as filter masks go by digest"""
+    if isinstance(value, np.ndarray):
+        return hashlib.sha1(value.tobytes()).hexdigest()
+    return value
+
+def _coalesced(operation, strategy, shared=False):
+    """strategy with concurrent identical calls against the same model version merged into one run
 
-# bind strategies into the class with proper naming convention
-HybridRecommender._get_recency_scores = get_recency_scores
-HybridRecommender._get_collaborative_scores = _get_collaborative_scores
-HybridRecommender._get_context_recommendations = get_context_recommendations
-HybridRecommender._get_demographic_recommendations = get_demographic_recommendations
+    shared lets worker processes reuse each other's results, so it is only for results that
+    do not index into the catalog (whose positions are private to each process). Version
+    numbers are counted per process, so shared keys name the database the result was read
+    from and the catalog it was hydrated with instead.
+    """
+    @functools.wraps(strategy)
+    def coalesced(self, *args):
+        state = self.state
+        if shared:
+            catalog = state.catalog
+            scope = (self.mongo_uri, getattr(self.db, 'name', None), catalog.version if catalog is not None else None)
+        else:
+            scope = (id(self), state.version)
+        key = scope + tuple(_key_part(arg) for arg in args)
+        return COALESCER.do(operation, key, strategy, self, *args, shared=shared)
+    return coalesced
+
+def bind_strategies():
+    """Bind strategies into the class with proper naming convention"""
+    HybridRecommender._get_recency_scores = _recency_strategy
+    HybridRecommender._get_collaborative_scores = _collaborative_strategy
+    HybridRecommender._get_context_recommendations = _context_strategy
+    HybridRecommender._get_demographic_recommendations = _coalesced('demographic', _demographic_strategy, shared=True)
+    HybridRecommender._get_context_popularity = _coalesced('context_popularity', _context_popularity_strategy)
+    HybridRecommender._get_content_scores = _content_strategy
+    HybridRecommender._get_als_scores = _als_strategy
+    HybridRecommender._get_session_scores = _session_strategy
+    HybridRecommender._get_trending_scores = _trending_strategy
+
+bind_strategies()
 
 _recommender = HybridRecommender()
+_async_recommender = None
+_default_tenant = Tenant(DEFAULT_TENANT, recommender=_recommender)
+_tenants = TenantRegistry.from_env(_default_tenant)
+_claim_lock = threading.Lock()
+
+MODEL_AGE_SECONDS.set_function(lambda: _recommender.state.age())
+MODEL_VERSION.set_function(lambda: _recommender.state.version)
+
+def init_app(app, client=None):
+    """Bind a recommender to a Flask app's database, sharing client (a MongoClient) when given
+
+    The first app in a process gets the default tenant, which the metrics and callers that
+    name no tenant use; any later app (tests, a second config) gets a tenant of its own.
+    The tenant is kept in app.extensions['recommender'] and returned; its start() loads it.
+    """
+    with _claim_lock:
+        tenant = Tenant(DEFAULT_TENANT) if _default_tenant.uri is not None else _default_tenant
+        tenant.uri = app.config["MONGO_URI"]
+    tenant.client = client
+    app.extensions['recommender'] = tenant
+    return tenant
+
+def get_tenant(name=None):
+    """The recommender tenant for a storefront (the app's own database for None); raises UnknownTenant
+
+    A Tenant, such as the one init_app() made for an app, is returned as it is.
+    """
+    if isinstance(name, Tenant):
+        return name
+    return _tenants.get(name)
+
+def get_tenant_stats():
+    """Memory, load source and latency percentiles of every configured tenant"""
+    return _tenants.stats()
 
-def init_app(app):
-    """Initialize the recommender with Flask app"""
-    _recommender.init_app(app)
+def subscribe_to_changes(callback):
+    """Call callback(batch) whenever the change feed applies a batch of database changes"""
+    if _default_tenant.change_feed is not None:
+        _default_tenant.change_feed.subscribe(callback)
 
-def recommend(user_id, k=20):
-    """Get recommendations for a user"""
-    return _recommender.recommend(user_id, k)
+def add_recommender_review(review, tenant=None):
+    """Fold a stored review into the rating signal; with the change feed running it arrives that way instead"""
+    tenant = get_tenant(tenant)
+    if tenant.change_feed is None:
+        tenant.recommender.apply_changes(ChangeBatch(reviews=[review]))
+    if tenant.scheduler is not None:
+        tenant.scheduler.notify_change()
 
-def add_recommender_interaction(user_id, product_id, interaction_type):
-    """Add a new interaction and update recommendations"""
-    _recommender.add_interaction(user_id, product_id, interaction_type)
+def get_catalog_version(tenant=None):
+    """Fingerprint of the catalog being served, None until the model has loaded"""
+    catalog = get_tenant(tenant).recommender.state.catalog
+    return None if catalog is None else catalog.version
+
+def get_product_ratings(product_id, tenant=None):
+    """Average rating and review count for a product, from memory"""
+    return get_tenant(tenant).recommender.product_ratings(product_id)
+
+def request_model_rebuild(tenant=None):
+    """Ask the background scheduler for a rebuild without waiting for it"""
+    tenant = get_tenant(tenant)
+    tenant.start_workers()
+    tenant.scheduler.request_rebuild()
+
+def get_model_status(tenant=None):
+    """Version, age and build duration of the model being served"""
+    tenant = get_tenant(tenant)
+    status = tenant.recommender.model_status() if tenant.scheduler is None else tenant.scheduler.status()
+    if tenant.change_feed is not None:
+        status['change_feed'] = tenant.change_feed.status()
+    return status
+
+def init_async_app(uri):
+    """Initialize the recommender plus a non-blocking Mongo client for the ASGI app"""
+    global _async_recommender
+    # Imported lazily so the WSGI app does not require motor
+    from .async_service import AsyncRecommender
+    _default_tenant.uri = uri
+    _default_tenant.start()
+    _async_recommender = AsyncRecommender(_recommender)
+    _async_recommender.connect(uri)
+    return _async_recommender
+
+async def recommend_async(user_id, k=20, filters=None):
+    """Get recommendations for a user without blocking the event loop"""
+    return await _async_recommender.recommend(user_id, k, filters)
+
+def recommend(user_id, k=20, tenant=None, filters=None):
+    """Get recommendations for a user, optionally restricted by a Filters"""
+    tenant = get_tenant(tenant)
+    # Components of one page asking for the same list at once share a single computation. Only
+    # within this process: another process's matrix may hold different interactions
+    key = (id(tenant.recommender), tenant.recommender.state.version, str(user_id), k, filters or None)
+    return PROFILER.run(
+        'HybridRecommender.recommend', tenant.call,
+        COALESCER.do, 'recommend', key, tenant.recommender.recommend, user_id, k, filters
+    )
+
+def add_recommender_interaction(interaction, tenant=None):
+    """Record a stored interaction: it advances the user's live session now and reaches the weights in the background"""
+    tenant = get_tenant(tenant)
+    if tenant.change_feed is None:
+        # With the change feed running the interaction arrives that way instead
+        tenant.recommender.apply_changes(ChangeBatch(interactions=[interaction], sessions_only=True))
+    tenant.recommender.add_interaction(interaction['user_id'], interaction['product_id'], interaction['interaction_type'])
 
 def get_recency_scores(category_weights, brand_weights, n_items=20):
     """Get recency scores for a user"""
@@ -39,6 +181,21 @@ def get_context_recommendations(user_id, n_items=20):
     """Get context recommendations for a user"""
     return _recommender.get_context_recommendations(user_id, n_items)
 
-def get_demographic_recommendations(location, n_items=20):
+def get_products_by_id(product_ids, tenant=None):
+    """Products by id from the in-memory catalog, in the order given; None while the model is loading"""
+    tenant = get_tenant(tenant)
+    return tenant.call(tenant.recommender.products, product_ids)
+
+def get_similar_products(product_id, k=10, tenant=None):
+    """Get products with similar text to a product"""
+    tenant = get_tenant(tenant)
+    return tenant.call(tenant.recommender.similar_products, product_id, k)
+
+def get_trending(k=20, category=None, location=None, tenant=None):
+    """Products trending now, overall or within one category or location"""
+    tenant = get_tenant(tenant)
+    return tenant.call(tenant.recommender.trending_products, k, category, location)
+
+def get_demographic_recommendations(location, n_items=20, tenant=None):
     """Get demographic recommendations for a user"""
-    return _recommender.get_demographic_recommendations(location, n_items)
+    return get_tenant(tenant).recommender.get_demographic_recommendations(location, n_items)
@@ -0,0 +1,183 @@
+"""Streaming interaction loads: projected cursor batches decoded into typed NumPy arrays
+
+A full pd.DataFrame(list(find())) holds every field of every document as Python objects
+before anything is converted. Here only the requested fields leave the server, each
+cursor batch is decoded and packed into compact arrays straight away, and the batch's
+documents are dropped before the next one arrives. Peak memory is the packed chunks, one
+decoded batch and the final concatenation.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId, decode_all
+from bson.codec_options import CodecOptions, DatetimeConversion
+
+# Interaction types in code order; documents with any other type get code -1
+INTERACTION_TYPES = ('view', 'add_to_cart', 'purchase')
+INTERACTION_FIELDS = ('user_id', 'product_id', 'interaction_type', 'timestamp')
+BATCH_SIZE = 10000
+
+_TYPE_CODES = {name: code for code, name in enumerate(INTERACTION_TYPES)}
+# Datetimes come back as plain millisecond counts instead of datetime objects
+_CODEC_OPTIONS = CodecOptions(datetime_conversion=DatetimeConversion.DATETIME_MS)
+_MISSING_TIME = np.iinfo(np.int64).min
+
+
+def code_weights(weights):
+    """Lookup array turning type codes into weights from an {interaction_type: weight} mapping
+
+    It has one extra trailing 0 so that code -1 (an unknown type) indexes to no weight.
+    """
+    return np.array([weights.get(name, 0) for name in INTERACTION_TYPES] + [0], dtype=np.float32)
+
+
+def object_id_key(value):
+    """Compact hashable key for an _id: the 12 raw bytes of an ObjectId, anything else unchanged"""
+    return value.binary if isinstance(value, ObjectId) else value
+
+
+def _ints(values):
+    try:
+        return np.array(values, dtype=np.int32)
+    except (ValueError, TypeError, OverflowError):
+        return pd.to_numeric(pd.Series(values), errors='coerce').fillna(-1).to_numpy(np.int32)
+
+
+def _millis(value):
+    if value is None:
+        return _MISSING_TIME
+    if isinstance(value, datetime):
+        # Stored datetimes are naive UTC
+        return int(value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp() * 1000)
+    return int(value)
+
+
+class InteractionArrays:
+    """Interaction columns as typed arrays; fields that were not loaded are None"""
+
+    def __init__(self, user_ids=None, product_ids=None, type_codes=None, timestamps=None, ids=None):
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        # int8 index into INTERACTION_TYPES, -1 for unknown types
+        self.type_codes = type_codes
+        # datetime64[ms], NaT where the document had no timestamp
+        self.timestamps = timestamps
+        # 12-byte ObjectIds as V12, or an object array for other _id types
+        self.ids = ids
+
+    def __len__(self):
+        for column in self._columns().values():
+            return len(column)
+        return 0
+
+    def _columns(self):
+        columns = {
+            'user_ids': self.user_ids, 'product_ids': self.product_ids, 'type_codes': self.type_codes,
+            'timestamps': self.timestamps, 'ids': self.ids,
+        }
+        return {name: column for name, column in columns.items() if column is not None}
+
+    @classmethod
+    def from_documents(cls, documents, fields=INTERACTION_FIELDS, with_ids=False):
+        columns = {}
+        if 'user_id' in fields:
+            columns['user_ids'] = _ints([doc.get('user_id', -1) for doc in documents])
+        if 'product_id' in fields:
+            columns['product_ids'] = _ints([doc.get('product_id', -1) for doc in documents])
+        if 'interaction_type' in fields:
+            columns['type_codes'] = np.array(
+                [_TYPE_CODES.get(doc.get('interaction_type'), -1) for doc in documents], dtype=np.int8
+            )
+        if 'timestamp' in fields:
+            columns['timestamps'] = np.array(
+                [_millis(doc.get('timestamp')) for doc in documents], dtype=np.int64
+            ).view('datetime64[ms]')
+        if with_ids:
+            ids = [doc.get('_id') for doc in documents]
+            if all(isinstance(value, ObjectId) for value in ids):
+                columns['ids'] = np.frombuffer(b''.join(value.binary for value in ids), dtype='V12')
+            else:
+                columns['ids'] = np.array(ids, dtype=object)
+        return cls(**columns)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """From a DataFrame with the usual interaction columns, e.g. a CSV export"""
+        columns = {}
+        if 'user_id' in frame:
+            columns['user_ids'] = pd.to_numeric(frame['user_id']).to_numpy(np.int32)
+        if 'product_id' in frame:
+            columns['product_ids'] = pd.to_numeric(frame['product_id']).to_numpy(np.int32)
+        if 'interaction_type' in frame:
+            columns['type_codes'] = frame['interaction_type'].map(_TYPE_CODES).astype(float).fillna(-1).to_numpy(np.int8)
+        if 'timestamp' in frame:
+            columns['timestamps'] = pd.to_datetime(frame['timestamp']).to_numpy().astype('datetime64[ms]')
+        return cls(**columns)
+
+    @classmethod
+    def concat(cls, chunks, fields=INTERACTION_FIELDS, with_ids=False):
+        """Chunks joined end to end; a column missing from any chunk is dropped"""
+        if not chunks:
+            return cls.from_documents([], fields, with_ids)
+        if len(chunks) == 1:
+            return chunks[0]
+        names = set.intersection(*(set(chunk._columns()) for chunk in chunks))
+        return cls(**{name: np.concatenate([chunk._columns()[name] for chunk in chunks]) for name in names})
+
+    def take(self, rows):
+        """The interactions at rows (an index array or boolean mask)"""
+        return InteractionArrays(**{name: column[rows] for name, column in self._columns().items()})
+
+    def id_keys(self):
+        """object_id_key of every _id, for matching against change feed documents"""
+        if self.ids is None:
+            return []
+        if self.ids.dtype == object:
+            return [object_id_key(value) for value in self.ids]
+        return self.ids.tolist()
+
+    def to_frame(self):
+        """DataFrame with the usual interaction column names; interaction_type is categorical"""
+        columns = {}
+        if self.user_ids is not None:
+            columns['user_id'] = self.user_ids
+        if self.product_ids is not None:
+            columns['product_id'] = self.product_ids
+        if self.type_codes is not None:
+            columns['interaction_type'] = pd.Categorical.from_codes(self.type_codes, categories=INTERACTION_TYPES)
+        if self.timestamps is not None:
+            columns['timestamp'] = self.timestamps
+        return pd.DataFrame(columns)
+
+
+def _document_batches(collection, query, projection, batch_size):
+    """Lists of at most batch_size decoded documents"""
+    find_raw_batches = getattr(collection, 'find_raw_batches', None)
+    if find_raw_batches is not None:
+        try:
+            for raw in find_raw_batches(query, projection, batch_size=batch_size):
+                yield decode_all(raw, _CODEC_OPTIONS)
+            return
+        except NotImplementedError:
+            pass
+    # Stand-ins without raw batch support still stream, one batch of dicts at a time
+    batch = []
+    for doc in collection.find(query, projection).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_interactions(collection, query=None, fields=INTERACTION_FIELDS, with_ids=False, batch_size=BATCH_SIZE):
+    """Stream the matching interactions into an InteractionArrays holding only fields (plus _id if with_ids)"""
+    projection = {name: 1 for name in fields}
+    projection['_id'] = 1 if with_ids else 0
+    chunks = [
+        InteractionArrays.from_documents(documents, fields, with_ids)
+        for documents in _document_batches(collection, query or {}, projection, batch_size)
+    ]
+    return InteractionArrays.concat(chunks, fields, with_ids)
@@ -0,0 +1,275 @@
+"""Latency metrics for the recommender, exported in Prometheus text format"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Upper bounds in seconds, tuned for request-path work (1ms .. 10s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed tuple of label names"""
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        # Index of the first bucket whose upper bound holds the value
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def total(self, **labels):
+        """(sum of observed values, number of observations) for one label set"""
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            return (series[1], series[2]) if series is not None else (0.0, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a fixed tuple of label names"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for key, value in snapshot:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down, set directly or read from a callback at render time"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func, **labels):
+        """Report func() for these labels whenever the metric is rendered"""
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._functions[key] = func
+
+    def render(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, func in functions:
+            value = func()
+            if value is not None:
+                with self._lock:
+                    self._values[key] = value
+        return super().render()
+
+
+class MetricsRegistry:
+    """Holds every metric exported from the /metrics route"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, label_names, buckets)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, label_names=()):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, documentation, label_names)
+            return self._metrics[name]
+
+    def gauge(self, name, documentation, label_names=()):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, documentation, label_names)
+            return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'recommender_stage_seconds',
+    'Time spent in each recommendation pipeline stage',
+    ('stage',),
+)
+STRATEGY_SECONDS = REGISTRY.histogram(
+    'recommender_strategy_seconds',
+    'Time spent computing scores for each recommendation strategy',
+    ('strategy',),
+)
+MONGO_COMMAND_SECONDS = REGISTRY.histogram(
+    'mongo_command_seconds',
+    'MongoDB command round-trip duration as reported by the driver',
+    ('command', 'outcome'),
+)
+STRATEGY_OUTCOMES = REGISTRY.counter(
+    'recommender_strategy_outcomes_total',
+    'Strategy executions by outcome (ok, timeout, error)',
+    ('strategy', 'outcome'),
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds',
+    'Flask request handling time per endpoint',
+    ('endpoint', 'method', 'status'),
+)
+
+MODEL_BUILD_SECONDS = REGISTRY.histogram(
+    'recommender_model_build_seconds',
+    'Time taken to fetch data and build a new model version',
+    ('trigger', 'outcome'),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+CHANGE_EVENTS = REGISTRY.counter(
+    'recommender_change_events_total',
+    'Database changes picked up by the change feed',
+    ('collection', 'operation'),
+)
+TENANT_REQUEST_SECONDS = REGISTRY.histogram(
+    'recommender_tenant_request_seconds',
+    'Recommendation latency per tenant',
+    ('tenant',),
+)
+TENANT_MEMORY_BYTES = REGISTRY.gauge(
+    'recommender_tenant_memory_bytes',
+    'Approximate resident model size per loaded tenant',
+    ('tenant',),
+)
+TENANT_EVICTIONS = REGISTRY.counter(
+    'recommender_tenant_evictions_total',
+    'Tenants evicted to their on-disk snapshot to stay within the memory budget',
+    ('tenant',),
+)
+SINGLE_FLIGHT_CALLS = REGISTRY.counter(
+    'recommender_single_flight_calls_total',
+    'Coalesced calls by outcome: computed, shared (joined a run in this process) or stored (reused from another process)',
+    ('operation', 'outcome'),
+)
+MODEL_AGE_SECONDS = REGISTRY.gauge(
+    'recommender_model_age_seconds',
+    'Seconds since the model version being served was built',
+)
+MODEL_VERSION = REGISTRY.gauge(
+    'recommender_model_version',
+    'Sequence number of the model version being served',
+)
+
+
+@contextmanager
+def timed(stage):
+    """Record the wall time of the enclosed block under the given pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+@contextmanager
+def timed_strategy(strategy):
+    """Record the wall time of the enclosed block under the given strategy name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STRATEGY_SECONDS.observe(time.perf_counter() - start, strategy=strategy)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo listener feeding command durations into MONGO_COMMAND_SECONDS"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome='success')
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome='failure')
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format"""
+    return REGISTRY.render()
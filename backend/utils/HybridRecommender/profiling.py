@@ -0,0 +1,243 @@
+"""Opt-in profiling of slow recommendation requests"""
+import cProfile
+import contextvars
+import heapq
+import io
+import itertools
+import logging
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Requests carrying this header with a value of "1" are always profiled
+PROFILE_HEADER = 'X-Profile'
+
+# The _Capture of the call being profiled; copied into the strategy pool's tasks with the rest of the context
+_capture = contextvars.ContextVar('profile_capture', default=None)
+
+
+class StackSampler(threading.Thread):
+    """Samples the call stack of one thread at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _StatsHolder:
+    """Adapter letting pstats.Stats load a raw stats dict (it consumes the dict it is given)"""
+
+    def __init__(self, stats):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+
+class _Capture:
+    """Stats and stacks from the worker threads a profiled call hands work to"""
+
+    def __init__(self):
+        self.stats = []
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stats, stacks):
+        with self._lock:
+            if stats:
+                self.stats.append(stats)
+            self.stacks.update(stacks)
+
+
+def _start_profile():
+    """An enabled cProfile.Profile, or None when another profiler is already running
+
+    Python 3.12+ allows one profiler at a time per process, so concurrent profiled
+    requests (and pool tasks under one) fall back to stack samples alone.
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+
+def _stop_profile(profile):
+    """The stats of a profile from _start_profile, None if it never started"""
+    if profile is None:
+        return None
+    profile.disable()
+    profile.create_stats()
+    return profile.stats
+
+
+def _merge_stats(stats):
+    """One cProfile stats dict summing the given ones; empty when there are none"""
+    stats = [entry for entry in stats if entry]
+    if not stats:
+        return {}
+    merged = pstats.Stats(_StatsHolder(stats[0]))
+    if len(stats) > 1:
+        merged.add(*(_StatsHolder(other) for other in stats[1:]))
+    return merged.stats
+
+
+class CapturedProfile:
+    """A single profiled call with its cProfile stats and sampled stacks"""
+
+    def __init__(self, profile_id, name, duration, started_at, stats, stacks):
+        self.profile_id = profile_id
+        self.name = name
+        self.duration = duration
+        self.started_at = started_at
+        self.stats = stats
+        self.stacks = stacks
+
+    def summary(self):
+        return {
+            'profile_id': self.profile_id,
+            'name': self.name,
+            'duration_ms': round(self.duration * 1000, 3),
+            'started_at': self.started_at.isoformat(),
+            'samples': sum(self.stacks.values()),
+        }
+
+    def to_text(self, limit=40):
+        """Human-readable pstats report sorted by cumulative time"""
+        if not self.stats:
+            return 'No cProfile stats: another profiler was running; see the sampled stacks\n'
+        buffer = io.StringIO()
+        stats = pstats.Stats(_StatsHolder(self.stats), stream=buffer)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return buffer.getvalue()
+
+    def to_pstats(self):
+        """Marshalled stats in the format written by cProfile.Profile.dump_stats"""
+        return marshal.dumps(self.stats)
+
+    def to_collapsed(self):
+        """Collapsed stacks ("frame;frame;frame count" per line) for flamegraph tools"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+
+class Profiler:
+    """Profiles opted-in or sampled calls and keeps the N slowest captures"""
+
+    def __init__(self, sample_rate=0.0, capacity=20, interval=0.005):
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.interval = interval
+        self._heap = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, sample_rate=None, capacity=None, interval=None):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if capacity is not None:
+            self.capacity = capacity
+        if interval is not None:
+            self.interval = interval
+
+    def should_profile(self, force=False):
+        return force or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def run(self, name, func, *args, force=False, **kwargs):
+        """Call func, profiling it if forced or sampled and no outer call is already profiling
+
+        Work func hands to the strategy pool is profiled there by run_task and merged in.
+        """
+        if _capture.get() is not None or not self.should_profile(force):
+            return func(*args, **kwargs)
+
+        capture = _Capture()
+        token = _capture.set(capture)
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        sampler.start()
+        profile = _start_profile()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            own_stats = _stop_profile(profile)
+            sampler.stop()
+            duration = time.perf_counter() - start
+            _capture.reset(token)
+            with capture._lock:
+                stats = _merge_stats([own_stats] + capture.stats)
+                stacks = sampler.stacks + capture.stacks
+            self._record(CapturedProfile(next(self._ids), name, duration, started_at, stats, stacks))
+
+    def run_task(self, func, *args):
+        """Call func on a worker thread, adding its profile to the profiled call it works for, if any"""
+        capture = _capture.get()
+        if capture is None:
+            return func(*args)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        profile = _start_profile()
+        try:
+            return func(*args)
+        finally:
+            stats = _stop_profile(profile)
+            sampler.stop()
+            capture.add(stats, sampler.stacks)
+
+    def _record(self, captured):
+        with self._lock:
+            entry = (captured.duration, captured.profile_id, captured)
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, entry)
+            elif self._heap and captured.duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+            else:
+                return
+        logger.info('Captured profile %d for %s (%.1f ms)', captured.profile_id, captured.name, captured.duration * 1000)
+
+    def profiles(self):
+        """Captured profiles, slowest first"""
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        return [captured for _, _, captured in entries]
+
+    def get(self, profile_id):
+        for captured in self.profiles():
+            if captured.profile_id == profile_id:
+                return captured
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+PROFILER = Profiler()
@@ -0,0 +1,118 @@
+"""Top-k selection kernels and candidate shortlists over scores in catalog order
+
+Every function takes and returns positions into the catalog (the row order of
+product_df), never product ids, so strategies and the blend can stay in NumPy until
+the final hydration step.
+"""
+import numpy as np
+
+
+def top_k(scores, k):
+    """Positions of the k highest scores, best first; ties keep catalog order"""
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # argpartition is not stable: among items tied with the k-th score, keep the earliest ones
+        threshold = scores[candidates].min()
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def masked_top_k(scores, k, exclude=None, min_score=None):
+    """top_k restricted to positions not in the exclude mask and scoring strictly above min_score"""
+    keep = np.ones(len(scores), dtype=bool) if exclude is None else ~exclude
+    if min_score is not None:
+        keep &= scores > min_score
+    positions = np.flatnonzero(keep)
+    return positions[top_k(scores[positions], k)]
+
+
+class Candidates:
+    """A source's shortlist: catalog positions and their scores, best first"""
+
+    __slots__ = ('positions', 'scores')
+
+    def __init__(self, positions, scores):
+        self.positions = np.asarray(positions, dtype=np.intp)
+        self.scores = np.asarray(scores, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+
+    @classmethod
+    def from_scores(cls, scores, k, min_score=0.0, allowed=None):
+        """The k best of a dense score array in catalog order, keeping only scores above min_score
+
+        allowed is an optional boolean mask of the positions that may be picked (see filters.py).
+        """
+        positions = masked_top_k(scores, k, exclude=None if allowed is None else ~allowed, min_score=min_score)
+        return cls(positions, scores[positions])
+
+    @classmethod
+    def from_positions(cls, positions, scores, k, min_score=0.0, allowed=None):
+        """The k best of scores at possibly repeated catalog positions (-1 for unknown items)
+
+        Repeats are summed, so sources can pass one entry per piece of evidence.
+        """
+        known = positions >= 0
+        if allowed is not None:
+            known &= allowed[positions]
+        unique, inverse = np.unique(positions[known], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[known], minlength=len(unique)).astype(np.float32)
+        best = masked_top_k(totals, k, min_score=min_score)
+        return cls(unique[best], totals[best])
+
+    def normalized(self):
+        """Scores divided by the best one, so every source scores in [0, 1]"""
+        if not len(self) or self.scores.max() <= 0:
+            return self
+        return Candidates(self.positions, self.scores / self.scores.max())
+
+
+def merge_by_source(candidates, quota):
+    """Take up to quota candidates from each source in priority order, skipping items an earlier source took
+
+    candidates is a list of Candidates (None for a source that produced nothing). Returns
+    (positions, scores, source codes), where the code is the index of the source in the list.
+    """
+    taken = np.empty(0, dtype=np.intp)
+    positions, scores, sources = [], [], []
+    for code, source in enumerate(candidates):
+        if source is None:
+            continue
+        fresh = ~np.isin(source.positions, taken)
+        picked, picked_scores = source.positions[fresh][:quota], source.scores[fresh][:quota]
+        taken = np.concatenate([taken, picked])
+        positions.append(picked)
+        scores.append(picked_scores)
+        sources.append(np.full(len(picked), code, dtype=np.int8))
+    if not positions:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int8)
+    return np.concatenate(positions), np.concatenate(scores), np.concatenate(sources)
+
+
+def group_top_k(scores, group_codes, counts):
+    """Best counts[g] positions within each group g, grouped by code and best first within a group
+
+    Positions with a non-finite score are never picked, so a group may return fewer items
+    than its count.
+    """
+    counts = np.asarray(counts)
+    order = np.lexsort((np.arange(len(scores)), -scores, group_codes))
+    groups = group_codes[order]
+    # Rank of each item inside its group: distance from the group's first position in the sorted order
+    rank = np.arange(len(order)) - np.searchsorted(groups, groups, side='left')
+    keep = (groups >= 0) & (rank < counts[np.clip(groups, 0, None)]) & np.isfinite(scores[order])
+    return order[keep]
@@ -0,0 +1,61 @@
+"""Explicit review ratings: extra user-item weight and per-product rating aggregates"""
+import numpy as np
+import pandas as pd
+
+REVIEW_FIELDS = {'_id': 1, 'user_id': 1, 'product_id': 1, 'rating': 1}
+# Ratings above neutral add weight to the user-item pair, ratings below take it away
+NEUTRAL_RATING = 3
+RATING_WEIGHT = 1.5
+
+
+def review_weights(reviews):
+    """(user_id, product_id, weight) rows contributed by reviews"""
+    weights = reviews[['user_id', 'product_id']].copy()
+    weights['product_id'] = pd.to_numeric(weights['product_id'])
+    weights['weight'] = (pd.to_numeric(reviews['rating']) - NEUTRAL_RATING) * RATING_WEIGHT
+    return weights
+
+
+def rating_summary(avg_rating, rating_count):
+    """JSON-ready review summary; avg_rating is None for unreviewed products"""
+    if avg_rating is None or np.isnan(avg_rating):
+        return {'avg_rating': None, 'rating_count': int(rating_count or 0)}
+    return {'avg_rating': round(float(avg_rating), 2), 'rating_count': int(rating_count)}
+
+
+class RatingStats:
+    """Review count and rating sum per product, in compact arrays"""
+
+    def __init__(self, product_ids=(), counts=None, sums=None):
+        self.product_ids = pd.Index(np.asarray(product_ids, dtype=np.int64))
+        self.counts = np.zeros(len(self.product_ids), dtype=np.int32) if counts is None else counts
+        self.sums = np.zeros(len(self.product_ids), dtype=np.float32) if sums is None else sums
+
+    @classmethod
+    def from_reviews(cls, reviews):
+        if reviews is None or reviews.empty:
+            return cls()
+        grouped = pd.to_numeric(reviews['rating']).groupby(pd.to_numeric(reviews['product_id'])).agg(['count', 'sum'])
+        return cls(grouped.index, grouped['count'].to_numpy(np.int32), grouped['sum'].to_numpy(np.float32))
+
+    def with_reviews(self, reviews):
+        """New stats with more reviews counted in; self is left untouched"""
+        added = RatingStats.from_reviews(reviews)
+        product_ids = self.product_ids.union(added.product_ids)
+        counts = np.zeros(len(product_ids), dtype=np.int32)
+        sums = np.zeros(len(product_ids), dtype=np.float32)
+        for stats in (self, added):
+            rows = product_ids.get_indexer(stats.product_ids)
+            counts[rows] += stats.counts
+            sums[rows] += stats.sums
+        return RatingStats(product_ids, counts, sums)
+
+    def lookup(self, product_ids):
+        """(mean rating, review count) arrays for product_ids; the mean is NaN for unreviewed products"""
+        rows = self.product_ids.get_indexer(pd.Index(product_ids).astype(np.int64))
+        known = rows >= 0
+        counts = np.zeros(len(rows), dtype=np.int32)
+        means = np.full(len(rows), np.nan, dtype=np.float32)
+        counts[known] = self.counts[rows[known]]
+        means[known] = self.sums[rows[known]] / np.maximum(self.counts[rows[known]], 1)
+        return means, counts
@@ -1,32 +1,26 @@
-import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 
-def get_recency_scores(self, category_weights, brand_weights, n_items=20):
-    
+from .ranking import Candidates
 
-    scores = pd.Series(0.0, index=self.product_df.index)
+# Score added per unit of log1p(recent weight) in a category or brand
+CATEGORY_AFFINITY = 0.3
+BRAND_AFFINITY = 0.25
 
-    for category, w in category_weights.items():
-        mask = self.product_df['category'] == category
-        scores[mask] += np.log1p(w) * 0.3
-        for other_cat in self.product_df.loc[~mask, 'category'].unique():
-            scores[self.product_df['category'] == other_cat] += np.random.uniform(0.05, 0.15)
 
-    for brand, w in brand_weights.items():
-        mask = self.product_df['brand'] == brand
-        scores[mask] += np.log1p(w) * 0.25
-        scores[self.product_df['brand'] != brand] += np.random.uniform(0.03, 0.1)
+def _affinity(values, weights, scale):
+    """Affinity per code of values (categories or brands), with a trailing 0 that code -1 indexes"""
+    affinity = np.zeros(len(values) + 1, dtype=np.float32)
+    codes = values.get_indexer(weights.index)
+    known = codes >= 0
+    np.add.at(affinity, codes[known], np.log1p(weights.to_numpy(dtype=np.float32)[known]) * scale)
+    return affinity
 
-    # exploration & diversity
-    scores += np.random.uniform(0.03, 0.1, size=len(scores))
-    
-    diversity_boost = pd.Series(0.2, index=self.product_df.index)
-    
-    scores += diversity_boost
-
-    if scores.max() > 0:
-        scores /= scores.max()
-
-    return scores
 
+def get_recency_scores(self, category_weights, brand_weights, n_items=20, allowed=None):
+    """Candidates from the categories and brands of the user's recent interactions; deterministic"""
+    catalog = self.catalog
+    scores = (
+        _affinity(catalog.categories, category_weights, CATEGORY_AFFINITY)[catalog.category_codes]
+        + _affinity(catalog.brands, brand_weights, BRAND_AFFINITY)[catalog.brand_codes]
+    )
+    return Candidates.from_scores(scores, n_items, allowed=allowed).normalized()
@@ -0,0 +1,67 @@
+"""Second stage of a recommendation: turning the sources' candidate sets into one ranked list
+
+A re-ranker is any object with rerank(recommender, candidates, k), where candidates maps
+source name -> Candidates in BLEND_SOURCES priority order (sources with nothing to say are
+left out). It returns (positions, scores, source names) for at most k items, best first.
+Its cost depends on the number of candidates only, never on the catalog size.
+"""
+import numpy as np
+
+from .ranking import merge_by_source, top_k
+
+
+class WeightedBlend:
+    """Sum of each source's normalised score times the source's weight over the union of candidates
+
+    An item suggested by several sources collects all their contributions and is credited to
+    the source that contributed the most.
+    """
+
+    def rerank(self, recommender, candidates, k):
+        weights = recommender.source_weights()
+        names = list(candidates)
+        positions = np.concatenate([candidates[name].positions for name in names])
+        contributions = np.concatenate([
+            candidates[name].normalized().scores * np.float32(weights.get(name, 0.0)) for name in names
+        ])
+        codes = np.concatenate([np.full(len(candidates[name]), code, dtype=np.int8) for code, name in enumerate(names)])
+        if not len(positions):
+            return positions, contributions, np.empty(0, dtype=object)
+
+        # Deduplicate: one row per item with the summed contributions
+        items, inverse = np.unique(positions, return_inverse=True)
+        blended = np.bincount(inverse, weights=contributions, minlength=len(items)).astype(np.float32)
+        # The largest contribution of each item names its source; ties go to the higher-priority source
+        order = np.lexsort((codes, -contributions, inverse))
+        leaders = order[np.searchsorted(inverse[order], np.arange(len(items)))]
+
+        best = top_k(blended, k)
+        return items[best], blended[best], np.array(names, dtype=object)[codes[leaders[best]]]
+
+
+class PriorityMerge:
+    """Up to items_per_strategy candidates from each source in priority order, earlier sources winning duplicates
+
+    The blend used before candidate weights existed, kept for comparison in offline evaluation.
+    """
+
+    def rerank(self, recommender, candidates, k):
+        names = list(candidates)
+        # Strategies that are missing leave their slots to the others
+        quota = recommender.items_per_strategy if len(names) > 1 else k
+        positions, scores, codes = merge_by_source([candidates[name] for name in names], quota)
+        best = top_k(scores, k)
+        return positions[best], scores[best], np.array(names, dtype=object)[codes[best]]
+
+
+RERANKERS = {'weighted': WeightedBlend, 'priority': PriorityMerge}
+
+
+def get_reranker(reranker):
+    """A re-ranker instance from a RERANKERS name, or reranker itself if it is already one"""
+    if isinstance(reranker, str):
+        try:
+            return RERANKERS[reranker]()
+        except KeyError:
+            raise ValueError(f"Unknown reranker: {reranker}") from None
+    return reranker
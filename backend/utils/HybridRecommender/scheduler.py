@@ -0,0 +1,158 @@
+"""Background rebuilds of the recommender model, off the request threads"""
+import logging
+import threading
+import time
+
+from .metrics import MODEL_BUILD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Wait before retrying a failed build; doubles with each failure in a row, up to the interval
+RETRY_AFTER_SECONDS = 1.0
+
+
+class RebuildScheduler:
+    """Rebuilds the model every `interval` seconds, or sooner once `change_threshold` changes are pending
+
+    Requests keep being served from the previous version while a rebuild runs; the
+    recommender swaps the finished version in with a single reference assignment.
+    """
+
+    def __init__(self, recommender, interval=300.0, change_threshold=1000):
+        self.recommender = recommender
+        self.interval = interval
+        self.change_threshold = change_threshold
+        self.pending_changes = 0
+        self.last_error = None
+        self.last_trigger = None
+        # Failed builds in a row, and the monotonic time before which none is retried automatically
+        self.failures = 0
+        self.next_attempt_at = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._requested = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name='model-rebuild', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify_change(self, count=1):
+        """Count writes since the last build and wake the worker once enough have accumulated"""
+        with self._lock:
+            self.pending_changes += count
+            due = self.change_threshold and self.pending_changes >= self.change_threshold
+        if due:
+            self._wake.set()
+
+    def request_rebuild(self):
+        """Ask the worker to rebuild as soon as possible"""
+        with self._lock:
+            self._requested = True
+        self._wake.set()
+
+    def rebuild(self, trigger='manual'):
+        """Build and swap in a new version now, on the calling thread; returns False if one is already running"""
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                # Changes that arrive during the build are counted towards the next one
+                consumed, self.pending_changes = self.pending_changes, 0
+                self._requested = False
+            start = time.perf_counter()
+            try:
+                state = self.recommender.refresh()
+            except Exception as e:
+                MODEL_BUILD_SECONDS.observe(time.perf_counter() - start, trigger=trigger, outcome='error')
+                with self._lock:
+                    # The failed build picked none of them up; the retry is due once the backoff ends
+                    self.pending_changes += consumed
+                    self.failures += 1
+                    self.last_error = str(e)
+                    self.next_attempt_at = time.monotonic() + self.retry_delay()
+                logger.exception('Model rebuild (%s) failed %d time(s) in a row, still serving the previous version',
+                                 trigger, self.failures)
+                return False
+            MODEL_BUILD_SECONDS.observe(time.perf_counter() - start, trigger=trigger, outcome='ok')
+            with self._lock:
+                self.failures = 0
+                self.last_error = None
+                self.next_attempt_at = None
+            self.last_trigger = trigger
+            logger.info('Swapped in model version %d after %.2fs (%s)', state.version, state.build_seconds, trigger)
+            return True
+        finally:
+            self._build_lock.release()
+
+    def retry_delay(self):
+        """Seconds to wait after the current run of failures; the interval (or 300s without one) caps it"""
+        cap = self.interval or 300.0
+        return min(RETRY_AFTER_SECONDS * 2 ** max(self.failures - 1, 0), cap)
+
+    def status(self):
+        with self._lock:
+            pending, requested = self.pending_changes, self._requested
+            failures, last_error, next_attempt_at = self.failures, self.last_error, self.next_attempt_at
+        retry_in = None if next_attempt_at is None else round(max(0.0, next_attempt_at - time.monotonic()), 3)
+        return {
+            **self.recommender.model_status(),
+            'pending_changes': pending,
+            'rebuild_requested': requested,
+            'rebuilding': self._build_lock.locked(),
+            'interval_seconds': self.interval,
+            'change_threshold': self.change_threshold,
+            'last_trigger': self.last_trigger,
+            'failures': failures,
+            'last_error': last_error,
+            'retry_in_seconds': retry_in,
+        }
+
+    def _backing_off(self):
+        """Seconds left before a failed build may be retried automatically, or None"""
+        with self._lock:
+            if self.next_attempt_at is None:
+                return None
+            left = self.next_attempt_at - time.monotonic()
+        return left if left > 0 else None
+
+    def _next_trigger(self):
+        with self._lock:
+            if self._requested:
+                return 'manual'
+        # A failing build (MongoDB unreachable, say) would otherwise be retried in a tight loop
+        if self._backing_off() is not None:
+            return None
+        with self._lock:
+            if self.change_threshold and self.pending_changes >= self.change_threshold:
+                return 'changes'
+            if self.failures:
+                # Whatever asked for the failed build still wants it, even with no interval set
+                return 'retry'
+        if self.interval and self.recommender.state.age() >= self.interval:
+            return 'interval'
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            trigger = self._next_trigger()
+            if trigger:
+                self.rebuild(trigger)
+                continue
+            timeout = self._backing_off()
+            if timeout is None and self.interval:
+                timeout = max(0.0, self.interval - self.recommender.state.age())
+            self._wake.wait(timeout)
+            self._wake.clear()
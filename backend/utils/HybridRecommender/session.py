@@ -0,0 +1,173 @@
+"""Live-session next-item signal: where shoppers go next from the products in the current session"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .incremental import INTERACTION_WEIGHTS
+from .ranking import Candidates
+
+# Events further apart than this belong to different sessions
+SESSION_GAP = timedelta(minutes=30)
+# Latest events kept per user; the live session is the unbroken run of them ending near now
+SESSION_LENGTH = 5
+# Each event links to this many following events of its session, weighted 1 / distance
+TRANSITION_WINDOW = 3
+# Next items kept per product for scoring; the raw counts keep COUNT_SLACK times more so the ranking can shift
+TOP_NEXT_ITEMS = 20
+COUNT_SLACK = 4
+# Weight of a session event relative to the one after it
+SESSION_DECAY = 0.7
+
+
+def _top_next(row):
+    """(next product ids, weights) of a count row, best first, pruned to TOP_NEXT_ITEMS"""
+    best = sorted(row.items(), key=lambda item: (-item[1], item[0]))[:TOP_NEXT_ITEMS]
+    return (
+        np.array([product_id for product_id, _ in best], dtype=np.int64),
+        np.array([weight for _, weight in best], dtype=np.float32),
+    )
+
+
+def _session_tail(events, now):
+    """The events that form the session still open at now, oldest first"""
+    tail = []
+    for product_id, timestamp in reversed(events):
+        if timestamp > now:
+            continue
+        if now - timestamp > SESSION_GAP:
+            break
+        tail.append(product_id)
+        now = timestamp
+    return tail[::-1]
+
+
+class SessionIndex:
+    """Product -> next-product transition weights and each user's latest events
+
+    Immutable like the ModelState that holds it: updated() returns a new index that
+    shares every row the new interactions did not touch.
+    """
+
+    def __init__(self, counts=None, next_items=None, events=None):
+        # product_id -> {next product_id: weight}, pruned to TOP_NEXT_ITEMS * COUNT_SLACK entries
+        self.counts = counts or {}
+        # product_id -> (next product ids, weights) best first, for scoring
+        self.next_items = next_items or {}
+        # user_id -> ((product_id, timestamp), ...) oldest first, at most SESSION_LENGTH long
+        self.events = events or {}
+
+    @classmethod
+    def from_interactions(cls, interactions):
+        """Build from an interaction DataFrame with user_id, product_id, interaction_type and timestamp"""
+        if interactions is None or interactions.empty or 'timestamp' not in interactions:
+            return cls()
+        log = pd.DataFrame({
+            'user_id': pd.to_numeric(interactions['user_id']),
+            'product_id': pd.to_numeric(interactions['product_id']),
+            'weight': interactions['interaction_type'].map(INTERACTION_WEIGHTS).astype(float).fillna(0),
+            'timestamp': pd.to_datetime(interactions['timestamp']),
+        }).sort_values(['user_id', 'timestamp'], kind='stable')
+        users = log['user_id'].to_numpy()
+        products = log['product_id'].to_numpy(np.int64)
+        weights = log['weight'].to_numpy(np.float32)
+        times = log['timestamp'].to_numpy()
+        boundary = np.ones(len(log), dtype=bool)
+        boundary[1:] = (users[1:] != users[:-1]) | (np.diff(times) > np.timedelta64(SESSION_GAP))
+        sessions = np.cumsum(boundary)
+
+        sources, targets, pair_weights = [], [], []
+        for distance in range(1, TRANSITION_WINDOW + 1):
+            linked = (sessions[:-distance] == sessions[distance:]) & (products[:-distance] != products[distance:])
+            sources.append(products[:-distance][linked])
+            targets.append(products[distance:][linked])
+            pair_weights.append(weights[distance:][linked] / distance)
+        pairs = pd.DataFrame({
+            'source': np.concatenate(sources), 'target': np.concatenate(targets), 'weight': np.concatenate(pair_weights)
+        }).groupby(['source', 'target'], as_index=False)['weight'].sum()
+        pairs = pairs.sort_values(['source', 'weight', 'target'], ascending=[True, False, True], kind='stable')
+        pairs = pairs[pairs.groupby('source').cumcount() < TOP_NEXT_ITEMS * COUNT_SLACK]
+
+        counts, next_items = {}, {}
+        source = pairs['source'].to_numpy(np.int64)
+        bounds = np.flatnonzero(np.diff(source)) + 1
+        starts = np.concatenate([[0], bounds]).astype(int) if len(source) else []
+        for start, target, weight in zip(
+            starts, np.split(pairs['target'].to_numpy(np.int64), bounds), np.split(pairs['weight'].to_numpy(), bounds)
+        ):
+            counts[int(source[start])] = dict(zip(target.tolist(), weight.tolist()))
+            next_items[int(source[start])] = (target[:TOP_NEXT_ITEMS], weight[:TOP_NEXT_ITEMS].astype(np.float32))
+
+        latest = log.groupby('user_id', sort=False).tail(SESSION_LENGTH)
+        events = {}
+        for user_id, product_id, timestamp in zip(
+            latest['user_id'].tolist(), latest['product_id'].tolist(), latest['timestamp'].dt.to_pydatetime()
+        ):
+            events[user_id] = events.get(user_id, ()) + ((product_id, timestamp),)
+        return cls(counts, next_items, events)
+
+    def updated(self, interactions):
+        """A new index with interaction documents appended; self is left untouched"""
+        interactions = [doc for doc in interactions if isinstance(doc.get('timestamp'), datetime)]
+        if not interactions:
+            return self
+        counts, next_items, events = dict(self.counts), dict(self.next_items), dict(self.events)
+        touched = {}
+        for doc in sorted(interactions, key=lambda doc: doc['timestamp']):
+            user_id, product_id, timestamp = int(doc['user_id']), int(doc['product_id']), doc['timestamp']
+            history = events.get(user_id, ())
+            weight = INTERACTION_WEIGHTS.get(doc.get('interaction_type'), 0)
+            previous = _session_tail(history, timestamp)[-TRANSITION_WINDOW:]
+            for distance, source in enumerate(reversed(previous), start=1):
+                if source == product_id:
+                    continue
+                if source not in touched:
+                    touched[source] = dict(counts.get(source, {}))
+                row = touched[source]
+                row[product_id] = row.get(product_id, 0.0) + weight / distance
+            events[user_id] = (history + ((product_id, timestamp),))[-SESSION_LENGTH:]
+
+        for source, row in touched.items():
+            if len(row) > TOP_NEXT_ITEMS * COUNT_SLACK:
+                row = dict(sorted(row.items(), key=lambda item: -item[1])[:TOP_NEXT_ITEMS * COUNT_SLACK])
+            counts[source] = row
+            next_items[source] = _top_next(row)
+        return SessionIndex(counts, next_items, events)
+
+    def live_session(self, user_id, now):
+        """Product ids of the user's session still open at now, oldest first"""
+        return _session_tail(self.events.get(user_id, ()), now)
+
+    def memory_bytes(self):
+        """Rough resident size: scoring arrays plus an estimate for the dict entries"""
+        arrays = sum(ids.nbytes + weights.nbytes for ids, weights in self.next_items.values())
+        entries = sum(len(row) for row in self.counts.values()) + sum(len(events) for events in self.events.values())
+        return arrays + entries * 100
+
+
+def get_session_scores(self, user_id, n_items=20, now=None, allowed=None):
+    """Candidates for the user's live session, the n_items likeliest next products; None without a session"""
+    sessions = self.sessions
+    try:
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        return None
+    session = sessions.live_session(user_id, now or datetime.now()) if sessions is not None else []
+    if not session:
+        return None
+
+    next_ids, weights = [], []
+    for age, product_id in enumerate(reversed(session)):
+        row = sessions.next_items.get(product_id)
+        if row is not None:
+            next_ids.append(row[0])
+            weights.append(row[1] * np.float32(SESSION_DECAY ** age))
+    if not next_ids:
+        return None
+    next_ids = np.concatenate(next_ids)
+    # The session's own products are the ones the user has just seen
+    fresh = ~np.isin(next_ids, session)
+    candidates = Candidates.from_positions(
+        self.catalog.positions(next_ids[fresh]), np.concatenate(weights)[fresh], n_items, allowed=allowed
+    )
+    return candidates.normalized() if len(candidates) else None
@@ -0,0 +1,217 @@
+"""Immutable model snapshots that are swapped in whole and pinned per request"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .factorization import FoldInCache
+
+# (recommender, ModelState) pinned for the current request; copied into strategy worker threads
+_pinned = contextvars.ContextVar('recommender_model_state', default=None)
+
+
+class Catalog:
+    """Product attributes as arrays in catalog order (the row order of product_df)"""
+
+    def __init__(self, product_df):
+        self.product_ids = product_df.index
+        self.category_codes, self.categories = pd.factorize(product_df['category'])
+        self.brand_codes, self.brands = pd.factorize(product_df['brand'])
+        # One packed bitset per category and per brand, for filters.Filters
+        self.category_bits = _bitsets(self.category_codes, len(self.categories))
+        self.brand_bits = _bitsets(self.brand_codes, len(self.brands))
+        # Positions sorted by price (missing prices last) and the matching prices, for price bands
+        prices = np.full(len(product_df), np.nan)
+        if 'price' in product_df:
+            prices = pd.to_numeric(product_df['price'], errors='coerce').to_numpy(np.float64)
+        self.price_order = np.argsort(prices, kind='stable')
+        self.sorted_prices = prices[self.price_order]
+        # Changes whenever any product field does, for HTTP cache validators
+        self.version = _fingerprint(product_df)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def positions(self, product_ids):
+        """Catalog position of each product id, -1 for ids not in the catalog"""
+        return self.product_ids.get_indexer(product_ids)
+
+    def all_bitset(self):
+        """Packed bitset with every catalog position set"""
+        return np.packbits(np.ones(len(self), dtype=bool))
+
+    def category_bitset(self, category):
+        """Packed bitset of the products in category"""
+        return self._bitset(self.categories, self.category_bits, category)
+
+    def brand_bitset(self, brand):
+        """Packed bitset of the products of brand"""
+        return self._bitset(self.brands, self.brand_bits, brand)
+
+    def _bitset(self, values, bitsets, value):
+        code = values.get_indexer([value])[0]
+        return bitsets[code] if code >= 0 else np.zeros((len(self) + 7) // 8, dtype=np.uint8)
+
+    def price_bitset(self, min_price=None, max_price=None):
+        """Packed bitset of the products priced within [min_price, max_price]"""
+        low = 0 if min_price is None else np.searchsorted(self.sorted_prices, min_price, side='left')
+        high = np.searchsorted(self.sorted_prices, np.inf if max_price is None else max_price, side='right')
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.price_order[low:high]] = True
+        return np.packbits(mask)
+
+
+def _fingerprint(product_df):
+    """16 hex digits hashing every product row and field except the Mongo _id"""
+    frame = product_df.drop(columns='_id', errors='ignore')
+    try:
+        hashed = pd.util.hash_pandas_object(frame, index=True)
+    except TypeError:
+        # Nested documents are not hashable as they are
+        hashed = pd.util.hash_pandas_object(frame.astype(str), index=True)
+    return format(int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF, '016x')
+
+
+def _bitsets(codes, count):
+    """Packed bitsets, one row per code, marking the positions that have it"""
+    if count == 0:
+        return np.zeros((0, (len(codes) + 7) // 8), dtype=np.uint8)
+    return np.packbits(codes[np.newaxis, :] == np.arange(count)[:, np.newaxis], axis=1)
+
+
+class ModelState:
+    """One consistent version of everything the recommender derives from the database
+
+    Instances are never mutated after they are published: a rebuild creates a new
+    ModelState and replaces the recommender's reference to it in a single assignment.
+    The one exception is the user_item_matrix array, which a change batch that adds no
+    users or products updates in place for the next version (incremental.add_weights), so
+    a request still on this version can see those cells move to their new weights.
+    """
+
+    FIELDS = (
+        'user_item_matrix', 'product_df', 'content_index', 'mf_model', 'ratings', 'sessions', 'negative_weights',
+        'version', 'built_at', 'build_seconds'
+    )
+    __slots__ = FIELDS + ('_catalog', 'fold_ins')
+
+    def __init__(self, user_item_matrix=None, product_df=None, content_index=None, mf_model=None, ratings=None,
+                 sessions=None, negative_weights=None, version=0, built_at=None, build_seconds=0.0):
+        self.user_item_matrix = user_item_matrix
+        self.product_df = product_df
+        self.content_index = content_index
+        self.mf_model = mf_model
+        # RatingStats aggregated from reviews
+        self.ratings = ratings
+        # SessionIndex of next-item transitions and users' latest events
+        self.sessions = sessions
+        # Weight sums below zero, clipped out of user_item_matrix; a Series by (user_id, product_id)
+        self.negative_weights = negative_weights
+        self.version = version
+        self.built_at = time.time() if built_at is None else built_at
+        self.build_seconds = build_seconds
+        self._catalog = None
+        # ALS vectors of users the factor model was not trained on, from this version's matrix
+        self.fold_ins = FoldInCache()
+
+    def replace(self, **changes):
+        """A copy of this state with some fields changed"""
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields.update(changes)
+        state = ModelState(**fields)
+        if state.product_df is self.product_df:
+            # Same products, so the derived catalog arrays still hold
+            state._catalog = self._catalog
+        return state
+
+    @property
+    def catalog(self):
+        """Catalog arrays for product_df, derived on first use"""
+        if self._catalog is None and self.product_df is not None:
+            self._catalog = Catalog(self.product_df)
+        return self._catalog
+
+    def age(self):
+        return time.time() - self.built_at
+
+    def prepare(self):
+        """Build lazily derived lookups before the state is shared between threads
+
+        pandas fills an index's hash table on its first lookup and does not do so
+        thread-safely, so concurrent strategies could see a half-filled table.
+        """
+        indexes = []
+        for frame in (self.user_item_matrix, self.product_df):
+            if frame is not None:
+                indexes += [frame.index, frame.columns]
+        if self.ratings is not None:
+            indexes.append(self.ratings.product_ids)
+        if self.content_index is not None:
+            indexes.append(self.content_index._rows.index)
+        for index in indexes:
+            if len(index) and index.is_unique:
+                index.get_loc(index[0])
+        self.catalog
+        return self
+
+    def memory_bytes(self):
+        """Approximate resident size; memory-mapped arrays live in the page cache and are not counted"""
+        total = 0
+        if self.user_item_matrix is not None:
+            total += int(self.user_item_matrix.memory_usage(index=True).sum())
+        if self.product_df is not None:
+            total += int(self.product_df.memory_usage(index=True, deep=True).sum())
+        if self.content_index is not None:
+            matrix = self.content_index.matrix
+            total += sum(_resident(array) for array in (matrix.data, matrix.indices, matrix.indptr))
+        if self.mf_model is not None:
+            total += _resident(self.mf_model.user_factors) + _resident(self.mf_model.item_factors)
+        if self.ratings is not None:
+            total += self.ratings.counts.nbytes + self.ratings.sums.nbytes
+        if self.sessions is not None:
+            total += self.sessions.memory_bytes()
+        if self.negative_weights is not None:
+            total += int(self.negative_weights.memory_usage(index=True))
+        return total
+
+
+def _resident(array):
+    return 0 if isinstance(array, np.memmap) else array.nbytes
+
+
+@contextmanager
+def pinned(owner, state):
+    """Make owner read from state for the enclosed block, unless a state is already pinned for it"""
+    current = _pinned.get()
+    if current is not None and current[0] is owner:
+        yield current[1]
+        return
+    token = _pinned.set((owner, state))
+    try:
+        yield state
+    finally:
+        _pinned.reset(token)
+
+
+def pinned_state(owner):
+    """The state pinned for owner in this context, or None"""
+    current = _pinned.get()
+    if current is not None and current[0] is owner:
+        return current[1]
+    return None
+
+
+def state_field(name):
+    """Property reading a ModelState field from the pinned state, falling back to the live one
+
+    Assigning the property publishes a new state with that field replaced.
+    """
+    def getter(self):
+        return getattr(self.state, name)
+
+    def setter(self, value):
+        self.update_state(**{name: value})
+
+    return property(getter, setter, doc=f'{name} of the model version serving this request')
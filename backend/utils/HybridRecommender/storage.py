@@ -0,0 +1,26 @@
+"""Crash- and reader-safe writes for persisted model artifacts"""
+import json
+import os
+
+import numpy as np
+
+
+def save_array(directory, name, array):
+    """Write name.npy by renaming a finished temp file over it
+
+    Replacing the directory entry instead of rewriting the file in place keeps any live
+    memory map of the previous version valid until its model is dropped.
+    """
+    path = os.path.join(directory, f'{name}.npy')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def save_json(directory, name, payload):
+    path = os.path.join(directory, name)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
@@ -0,0 +1,359 @@
+"""One recommender per storefront database, loaded lazily and kept within a memory budget
+
+Tenants other than the default one are built on first use. When the loaded tenants
+together grow past the budget, the least recently used ones are written to an on-disk
+snapshot and dropped; the next request for them loads the snapshot instead of
+re-reading their whole database.
+"""
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from .content import load_or_build_index
+from .core import HybridRecommender
+from .factorization import load_model
+from .metrics import TENANT_EVICTIONS, TENANT_MEMORY_BYTES, TENANT_REQUEST_SECONDS
+from .scheduler import RebuildScheduler
+from .changefeed import ChangeFeed
+from .state import ModelState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = 'default'
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'tenants')
+SNAPSHOT_VERSION = 3
+SNAPSHOT_FILE = 'state.pkl'
+# Per-tenant latency window used for the percentiles in stats()
+LATENCY_WINDOW = 1024
+
+
+class UnknownTenant(KeyError):
+    """Raised for a tenant name that is not configured"""
+
+
+def save_snapshot(state, path):
+    """Write the DataFrame and rating parts of a state; the content index and ALS model already live on disk"""
+    os.makedirs(path, exist_ok=True)
+    payload = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'user_item_matrix': state.user_item_matrix,
+        'negative_weights': state.negative_weights,
+        'product_df': state.product_df,
+        'ratings': state.ratings,
+        'sessions': state.sessions,
+        'version': state.version,
+        'built_at': state.built_at,
+        'build_seconds': state.build_seconds,
+    }
+    target = os.path.join(path, SNAPSHOT_FILE)
+    tmp = target + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, target)
+
+
+def load_snapshot(recommender, path):
+    """The ModelState saved at path, or None when there is no usable snapshot"""
+    target = os.path.join(path, SNAPSHOT_FILE)
+    if not os.path.exists(target):
+        return None
+    with open(target, 'rb') as f:
+        payload = pickle.load(f)
+    if payload.get('snapshot_version') != SNAPSHOT_VERSION:
+        logger.warning('Ignoring snapshot %s with version %s', target, payload.get('snapshot_version'))
+        return None
+    product_df = payload['product_df']
+    content_index = load_or_build_index(product_df, recommender.content_index_dir) if product_df is not None else None
+    mf_model = load_model(recommender.mf_model_dir) if recommender.collaborative_model == 'als' else None
+    return ModelState(
+        user_item_matrix=payload['user_item_matrix'],
+        negative_weights=payload['negative_weights'],
+        product_df=product_df,
+        content_index=content_index,
+        mf_model=mf_model,
+        ratings=payload['ratings'],
+        sessions=payload['sessions'],
+        version=payload['version'],
+        built_at=payload['built_at'],
+        build_seconds=payload['build_seconds'],
+    )
+
+
+class Tenant:
+    """A recommender bound to one storefront database, with its own rebuild scheduler and change feed"""
+
+    def __init__(self, name, uri=None, recommender=None, snapshot_dir=None):
+        self.name = name
+        self.uri = uri
+        # An already open MongoClient to use instead of opening one from uri
+        self.client = None
+        self.recommender = recommender or HybridRecommender()
+        self.snapshot_path = os.path.join(snapshot_dir, name) if snapshot_dir else None
+        if recommender is None and self.snapshot_path:
+            # Keep each tenant's persisted index and ALS model apart
+            self.recommender.content_index_dir = os.path.join(self.snapshot_path, 'content_index')
+            self.recommender.mf_model_dir = os.path.join(self.snapshot_path, 'als')
+            self.recommender.trending_dir = os.path.join(self.snapshot_path, 'trending')
+            if self.recommender.archive_dir is not None:
+                self.recommender.archive_dir = os.path.join(self.snapshot_path, 'archive')
+        self.scheduler = None
+        self.change_feed = None
+        self.loaded_from = None
+        self.load_seconds = None
+        self.last_used = time.time()
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        # Calls running now; an evicted tenant keeps its Mongo client until they finish
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def start(self):
+        """Load the model from the snapshot if there is one, else from the database, then start the workers"""
+        started = time.perf_counter()
+        state = load_snapshot(self.recommender, self.snapshot_path) if self.snapshot_path else None
+        if state is not None:
+            self.recommender.attach(self.uri, self.client)
+            self.recommender.publish(state)
+            self.loaded_from = 'snapshot'
+        else:
+            self.recommender.connect(self.uri, self.client)
+            self.loaded_from = 'database'
+        self.load_seconds = time.perf_counter() - started
+        self.start_workers()
+        if self.loaded_from == 'snapshot':
+            # Writes made while the tenant was evicted never reached the change feed
+            self.scheduler.request_rebuild()
+        logger.info('Tenant %s loaded from %s in %.2fs', self.name, self.loaded_from, self.load_seconds)
+        return self
+
+    def start_workers(self):
+        """Start background rebuilds (REBUILD_INTERVAL, REBUILD_AFTER_CHANGES) and the change feed (CHANGE_FEED)"""
+        if self.scheduler is None:
+            self.scheduler = RebuildScheduler(
+                self.recommender,
+                interval=float(os.getenv("REBUILD_INTERVAL", "300")),
+                change_threshold=int(os.getenv("REBUILD_AFTER_CHANGES", "1000"))
+            )
+            self.recommender.scheduler = self.scheduler
+            self.scheduler.start()
+        mode = os.getenv("CHANGE_FEED", "auto")
+        if self.change_feed is None and mode != 'off':
+            self.change_feed = ChangeFeed(
+                self.recommender,
+                mode=mode,
+                interval=float(os.getenv("CHANGE_FEED_INTERVAL", "1.0"))
+            )
+            self.change_feed.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_workers(timeout)
+        self.close()
+
+    def stop_workers(self, timeout=5.0):
+        if self.change_feed is not None:
+            self.change_feed.stop(timeout)
+            self.change_feed = None
+        if self.scheduler is not None:
+            self.scheduler.stop(timeout)
+            self.scheduler = None
+            self.recommender.scheduler = None
+
+    def close(self):
+        if self.recommender.mongo is not None and self.recommender.owns_mongo:
+            self.recommender.mongo.close()
+
+    def wait_idle(self, timeout=None):
+        """Block until no call() is running; False if timeout passed first"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def snapshot(self):
+        save_snapshot(self.recommender.state, self.snapshot_path)
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def call(self, func, *args, **kwargs):
+        """Run func, recording its latency against this tenant"""
+        self.touch()
+        with self._idle:
+            self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._idle:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._idle.notify_all()
+            self.requests += 1
+            self._latencies.append(elapsed)
+            TENANT_REQUEST_SECONDS.observe(elapsed, tenant=self.name)
+
+    def memory_bytes(self):
+        return self.recommender.state.memory_bytes()
+
+    def stats(self):
+        latencies = np.array(self._latencies)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (None, None, None)
+        return {
+            'memory_bytes': self.memory_bytes(),
+            'model_version': self.recommender.state.version,
+            'loaded_from': self.loaded_from,
+            'load_seconds': self.load_seconds,
+            'idle_seconds': round(time.time() - self.last_used, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': {
+                name: None if value is None else round(value * 1000, 3)
+                for name, value in (('p50', p50), ('p95', p95), ('p99', p99))
+            },
+        }
+
+
+class TenantRegistry:
+    """Loaded tenants in least-recently-used order, evicted to snapshots past memory_budget bytes
+
+    The default tenant serves the API's own database and is never evicted.
+    """
+
+    def __init__(self, default, uris=None, memory_budget=None, snapshot_dir=None):
+        self.default = default
+        self.uris = dict(uris or {})
+        self.memory_budget = memory_budget
+        self.snapshot_dir = snapshot_dir
+        self.evictions = 0
+        self._loaded = OrderedDict([(default.name, default)])
+        self._lock = threading.Lock()
+        self._loading = {}
+        # Evicted tenants still being snapshotted and closed, by name
+        self._retiring = {}
+
+    @classmethod
+    def from_env(cls, default):
+        """TENANT_URIS (JSON name -> Mongo URI), TENANT_MEMORY_BUDGET_MB, TENANT_SNAPSHOT_DIR"""
+        budget = float(os.getenv("TENANT_MEMORY_BUDGET_MB", "1024"))
+        return cls(
+            default,
+            uris=json.loads(os.getenv("TENANT_URIS", "{}")),
+            memory_budget=int(budget * 1024 * 1024) if budget > 0 else None,
+            snapshot_dir=os.getenv("TENANT_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR),
+        )
+
+    def names(self):
+        return [self.default.name] + [name for name in self.uris if name != self.default.name]
+
+    def get(self, name=None):
+        """The tenant called name (the default one for None), loading it on first use"""
+        name = name or self.default.name
+        tenant = self._loaded_tenant(name)
+        if tenant is not None:
+            return tenant
+        if name not in self.uris:
+            raise UnknownTenant(name)
+
+        # One load per tenant at a time; requests for other tenants are not held up
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            tenant = self._loaded_tenant(name)
+            if tenant is None:
+                # Load the snapshot only once an earlier eviction has finished writing it
+                with self._lock:
+                    retiring = self._retiring.get(name)
+                if retiring is not None:
+                    retiring.join()
+                tenant = Tenant(name, self.uris[name], snapshot_dir=self.snapshot_dir).start()
+                with self._lock:
+                    self._loaded[name] = tenant
+            self.enforce_budget(keep=name)
+        return tenant
+
+    def _loaded_tenant(self, name):
+        with self._lock:
+            tenant = self._loaded.get(name)
+            if tenant is not None:
+                self._loaded.move_to_end(name)
+                tenant.touch()
+            return tenant
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded.values())
+
+    def enforce_budget(self, keep=None):
+        """Evict least recently used tenants until the loaded ones fit in the budget"""
+        sizes = {tenant.name: tenant.memory_bytes() for tenant in self.loaded()}
+        for name, size in sizes.items():
+            TENANT_MEMORY_BYTES.set(size, tenant=name)
+        if self.memory_budget is None:
+            return
+        total = sum(sizes.values())
+        with self._lock:
+            order = [name for name in self._loaded if name not in (self.default.name, keep)]
+        for name in order:
+            if total <= self.memory_budget:
+                break
+            if self.evict(name):
+                total -= sizes.get(name, 0)
+
+    def evict(self, name):
+        """Drop a tenant from memory; its snapshot and shutdown run on a background thread"""
+        with self._lock:
+            if name == self.default.name or name not in self._loaded:
+                return False
+            tenant = self._loaded.pop(name)
+            thread = threading.Thread(target=self._retire, args=(tenant,), name=f'evict-{name}', daemon=True)
+            self._retiring[name] = thread
+        thread.start()
+        self.evictions += 1
+        TENANT_EVICTIONS.inc(tenant=name)
+        TENANT_MEMORY_BYTES.set(0, tenant=name)
+        return True
+
+    def _retire(self, tenant):
+        """Snapshot an evicted tenant, then close its client once the calls already holding it finish"""
+        try:
+            tenant.stop_workers()
+            if tenant.snapshot_path:
+                tenant.snapshot()
+            # Requests that got the tenant before the eviction still read recommender.db
+            tenant.wait_idle()
+            tenant.close()
+            logger.info('Evicted tenant %s to %s', tenant.name, tenant.snapshot_path)
+        except Exception:
+            logger.exception('Evicting tenant %s failed', tenant.name)
+        finally:
+            with self._lock:
+                if self._retiring.get(tenant.name) is threading.current_thread():
+                    del self._retiring[tenant.name]
+
+    def wait_for_evictions(self, timeout=None):
+        """Block until evicted tenants have been snapshotted and closed"""
+        with self._lock:
+            threads = list(self._retiring.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        loaded = {tenant.name: tenant.stats() for tenant in self.loaded()}
+        return {
+            'memory_budget_bytes': self.memory_budget,
+            'memory_bytes': sum(stats['memory_bytes'] for stats in loaded.values()),
+            'evictions': self.evictions,
+            'tenants': {
+                name: dict(loaded[name], loaded=True) if name in loaded else {'loaded': False}
+                for name in self.names()
+            },
+        }
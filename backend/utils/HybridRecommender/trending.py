@@ -0,0 +1,223 @@
+"""Streaming "trending now" counters: exponentially time-decayed interaction weight per product
+
+Every interaction adds its weight to three scopes: all products, the product's category
+and the user's location. Counts live in one count-min sketch, so memory is fixed no matter
+how many products or scopes there are. Each scope also keeps its TOP_K heaviest products,
+the only ones a trending query can return.
+
+Decay uses a landmark time L: an event at t adds weight * 2 ** ((t - L) / half_life). The
+relative order of products never depends on when the counters are read, so nothing has
+to be decayed in place. When the multiplier grows large, everything is scaled down and L
+moves forward.
+"""
+import json
+import logging
+import os
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .incremental import INTERACTION_WEIGHTS
+from .loader import InteractionArrays, code_weights
+from .storage import save_array, save_json
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+# Sketch shape: collisions overestimate a count by about total weight * e / WIDTH with probability 1 - e ** -DEPTH
+WIDTH = 2 ** 14
+DEPTH = 4
+# Products tracked per scope
+TOP_K = 100
+HASH_SEED = 20240101
+# Move the landmark once new events weigh this many half-lives more than it
+RESCALE_AFTER = 256
+OVERALL = 'all'
+
+
+def scope_key(kind, value):
+    """Name of the category or location scope for value"""
+    return f'{kind}:{value}'
+
+
+def _scope_ids(scopes):
+    return np.array([zlib.crc32(scope.encode()) for scope in scopes], dtype=np.uint64)
+
+
+class TrendingCounter:
+    """Count-min sketch of decayed weights plus per-scope heavy hitters; safe to share between threads"""
+
+    def __init__(self, half_life_hours=24.0, width=WIDTH, depth=DEPTH, top_k=TOP_K):
+        self.half_life = half_life_hours * 3600.0
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        # Landmark as epoch seconds; None until the first event
+        self.landmark = None
+        # Newest event timestamp counted, as epoch seconds
+        self.watermark = None
+        # scope -> {product_id: decayed weight relative to the landmark}
+        self.hitters = {}
+        # user_id -> location, refreshed from the users collection on every rebuild
+        self.user_locations = {}
+        rng = np.random.default_rng(HASH_SEED)
+        # Multiply-shift hashing: one odd 64-bit multiplier per sketch row
+        self._multipliers = rng.integers(1, 2 ** 63, size=(depth, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._shift = np.uint64(64 - int(np.log2(width)))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(half_life_hours=float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")))
+
+    def __len__(self):
+        return len(self.hitters.get(OVERALL, {}))
+
+    def _columns(self, keys):
+        return (keys[np.newaxis, :] * self._multipliers) >> self._shift
+
+    def _estimate(self, keys):
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, np.newaxis], columns].min(axis=0)
+
+    def _rescale(self, newest):
+        if self.landmark is None:
+            self.landmark = newest
+            return
+        if (newest - self.landmark) / self.half_life < RESCALE_AFTER:
+            return
+        factor = 2.0 ** (-(newest - self.landmark) / self.half_life)
+        self.table *= factor
+        for counts in self.hitters.values():
+            for product_id in counts:
+                counts[product_id] *= factor
+        self.landmark = newest
+
+    def add(self, product_ids, categories, locations, type_codes, timestamps):
+        """Count a batch of interactions given as parallel arrays
+
+        categories and locations hold the scope value of each interaction, None where it is
+        unknown; type_codes index into loader.INTERACTION_TYPES and timestamps are datetime64.
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(product_ids):
+            return 0
+        seconds = np.asarray(timestamps, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+        weights = code_weights(INTERACTION_WEIGHTS)[np.asarray(type_codes)].astype(np.float64)
+
+        scope_names, scope_rows = [OVERALL], [np.arange(len(product_ids))]
+        for kind, values in (('category', categories), ('location', locations)):
+            values = pd.Series(values, dtype=object)
+            for value, rows in values.groupby(values, sort=False).indices.items():
+                scope_names.append(scope_key(kind, value))
+                scope_rows.append(rows)
+        rows = np.concatenate(scope_rows)
+        scopes = np.repeat(_scope_ids(scope_names), [len(r) for r in scope_rows])
+        keys = (scopes << np.uint64(32)) | (product_ids[rows].astype(np.uint64) & np.uint64(0xFFFFFFFF))
+
+        newest = float(seconds.max())
+        with self._lock:
+            self._rescale(newest)
+            increments = weights[rows] * np.exp2((seconds[rows] - self.landmark) / self.half_life)
+            columns = self._columns(keys)
+            for row in range(self.depth):
+                np.add.at(self.table[row], columns[row], increments)
+            self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+
+            for name, scope_id, scope_rows_ in zip(scope_names, _scope_ids(scope_names), scope_rows):
+                counts = self.hitters.get(name, {})
+                candidates = np.union1d(np.fromiter(counts, dtype=np.int64, count=len(counts)), product_ids[scope_rows_])
+                estimates = self._estimate(
+                    (scope_id << np.uint64(32)) | (candidates.astype(np.uint64) & np.uint64(0xFFFFFFFF))
+                )
+                if len(candidates) > self.top_k:
+                    best = np.argpartition(-estimates, self.top_k - 1)[:self.top_k]
+                    candidates, estimates = candidates[best], estimates[best]
+                self.hitters[name] = dict(zip(candidates.tolist(), estimates.tolist()))
+        return len(product_ids)
+
+    def add_interactions(self, interactions, catalog, newer_only=False):
+        """Count InteractionArrays with user_ids, product_ids, type_codes and timestamps
+
+        With newer_only, interactions at or before the watermark are skipped, so a rebuild
+        can catch the counters up from the full log without counting anything twice.
+        """
+        if newer_only and self.watermark is not None:
+            interactions = interactions.take(interactions.timestamps.astype(np.int64) > int(self.watermark * 1000))
+        positions = catalog.positions(interactions.product_ids)
+        codes = np.where(positions >= 0, catalog.category_codes[positions], -1)
+        categories = np.where(codes >= 0, np.asarray(catalog.categories, dtype=object)[codes], None)
+        locations = [self.user_locations.get(user_id) for user_id in interactions.user_ids.tolist()]
+        return self.add(interactions.product_ids, categories, locations, interactions.type_codes, interactions.timestamps)
+
+    def add_documents(self, documents, catalog):
+        """Count interaction documents from the change feed or the API"""
+        return self.add_interactions(InteractionArrays.from_documents(documents), catalog)
+
+    def top(self, k=20, category=None, location=None):
+        """(product_ids, scores) of the k heaviest products in a scope, best first, scores relative to the best"""
+        scope = OVERALL
+        if category is not None:
+            scope = scope_key('category', category)
+        elif location is not None:
+            scope = scope_key('location', location)
+        with self._lock:
+            counts = dict(self.hitters.get(scope, {}))
+        if not counts or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        product_ids = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        order = np.lexsort((product_ids, -weights))[:k]
+        return product_ids[order], (weights[order] / weights[order[0]]).astype(np.float32)
+
+    def memory_bytes(self):
+        return self.table.nbytes + sum(len(counts) for counts in self.hitters.values()) * 100
+
+    def save(self, path):
+        """Write the sketch and heavy hitters so a restart resumes where this process left off"""
+        with self._lock:
+            table = self.table.copy()
+            meta = {
+                'version': SNAPSHOT_VERSION, 'half_life': self.half_life, 'width': self.width, 'depth': self.depth,
+                'top_k': self.top_k, 'landmark': self.landmark, 'watermark': self.watermark,
+                'hitters': {scope: [[product_id, weight] for product_id, weight in counts.items()]
+                            for scope, counts in self.hitters.items()},
+            }
+        os.makedirs(path, exist_ok=True)
+        save_array(path, 'sketch', table)
+        # meta.json goes last so a reader never pairs new metadata with an old sketch
+        save_json(path, 'meta.json', meta)
+
+    def load(self, path):
+        """Replace the counters with the snapshot at path; returns False when there is no usable one"""
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            table = np.load(os.path.join(path, 'sketch.npy'))
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != SNAPSHOT_VERSION or table.shape != (self.depth, self.width):
+            logger.warning('Ignoring trending snapshot at %s with a different version or shape', path)
+            return False
+        with self._lock:
+            self.table = table
+            self.half_life = meta['half_life']
+            self.landmark = meta['landmark']
+            self.watermark = meta['watermark']
+            self.hitters = {scope: {int(product_id): weight for product_id, weight in counts}
+                            for scope, counts in meta['hitters'].items()}
+        return True
+
+
+def get_trending_scores(self, n_items=20, category=None, location=None):
+    """Trending products as a float32 array in catalog order, scaled to [0, 1]"""
+    catalog = self.catalog
+    scores = np.zeros(len(catalog), dtype=np.float32)
+    product_ids, weights = self.trending.top(n_items, category, location)
+    positions = catalog.positions(product_ids)
+    known = positions >= 0
+    scores[positions[known]] = weights[known]
+    return scores
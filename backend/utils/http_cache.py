@@ -0,0 +1,114 @@
+"""Conditional GETs and cached response bytes for the catalog routes
+
+The catalog version is the fingerprint of the product table the recommender serves. It
+is the ETag of every catalog response, and the moment a worker first sees a version is
+its Last-Modified. A client holding the current version gets a 304 without the route
+running. Otherwise a repeat request is answered from bytes serialized earlier for the
+same route and arguments. A new version drops all stored bytes, so browsing between catalog
+changes costs neither MongoDB queries nor JSON encoding.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+# Serialized responses kept per catalog version; searches add one entry per distinct query
+MAX_ENTRIES = 512
+
+
+class CatalogCache:
+    """Response bytes for the current catalog version; safe to share between threads"""
+
+    def __init__(self, version_func, max_entries=MAX_ENTRIES):
+        # Returns the catalog version now, or None while the catalog is not loaded
+        self.version_func = version_func
+        self.max_entries = max_entries
+        self.version = None
+        self.last_modified = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current(self):
+        """(version, last_modified) of the catalog being served; a new version drops every stored body"""
+        version = self.version_func()
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+                self._entries.clear()
+            return self.version, self.last_modified
+
+    def get(self, version, key):
+        with self._lock:
+            body = self._entries.get(key) if version == self.version else None
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, version, key, body):
+        with self._lock:
+            # A body rendered while the version moved on belongs to no current version
+            if version != self.version:
+                return
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'version': self.version, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def catalog_cached(cache_control, validator=None):
+    """Serve a GET route from the app's catalog cache, answering conditional requests with 304
+
+    The cache is the CatalogCache in app.extensions['catalog_cache']. cache_control is the route's Cache-Control header. validator(**view_args), if given,
+    returns a string for data the route shows that is not part of the catalog (such as a
+    product's rating). That string goes into the ETag and the cache key. Such routes send
+    no Last-Modified, because the catalog's date would hide changes to that data. A validator
+    returning None (say, for an id that cannot exist) leaves the route to answer uncached.
+    """
+    def decorate(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            cache = current_app.extensions['catalog_cache']
+            version, last_modified = cache.current()
+            if version is None:
+                # Catalog still loading: no version to validate against yet
+                return view(**view_args)
+            etag = version
+            if validator is not None:
+                extra = validator(**view_args)
+                if extra is None:
+                    return view(**view_args)
+                etag, last_modified = f'{version}-{extra}', None
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                key = (request.endpoint, etag, tuple(sorted(view_args.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                body = cache.get(version, key)
+                if body is None:
+                    response = current_app.make_response(view(**view_args))
+                    if response.status_code != 200:
+                        return response
+                    cache.put(version, key, response.get_data())
+                else:
+                    response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            if last_modified is not None:
+                # Assigning None would stamp the current time instead
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorate
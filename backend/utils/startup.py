@@ -0,0 +1,83 @@
+"""Timed startup stages and the background warm-up behind the readiness endpoint
+
+create_app() times each stage of bringing a worker up: imports, app setup, the Mongo
+client, index creation, the cart and order views and the recommender model. The slow
+stages run as a warm-up on a daemon thread, so a worker answers health checks straight
+away and reports ready once the warm-up has finished.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Startup:
+    """Stage timings of one app start; safe to read while the warm-up runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.running = None
+        self.error = None
+        self.ready = threading.Event()
+        self.ready_seconds = None
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """Add a stage timed elsewhere, such as the module imports"""
+        with self._lock:
+            self.stages[name] = round(seconds, 4)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name"""
+        with self._lock:
+            self.running = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+            with self._lock:
+                self.running = None
+
+    def warm_up(self, steps, background=True):
+        """Run the (name, func) steps in order as timed stages, then mark the app ready
+
+        In the background a failing step is logged and reported by report(), and the app
+        never becomes ready; run in the foreground it raises as usual.
+        """
+        def run():
+            for name, func in steps:
+                try:
+                    with self.stage(name):
+                        func()
+                except Exception as e:
+                    if not background:
+                        raise
+                    logger.exception('Warm-up failed in stage %s', name)
+                    with self._lock:
+                        self.error = f'{name}: {e}'
+                    return
+            self.ready_seconds = round(time.perf_counter() - self.started, 4)
+            self.ready.set()
+            logger.info('Ready after %.2fs: %s', self.ready_seconds, self.stages)
+
+        if background:
+            threading.Thread(target=run, name='warm-up', daemon=True).start()
+        else:
+            run()
+
+    def report(self):
+        """Readiness, the stage in progress and the seconds taken by every finished stage"""
+        with self._lock:
+            return {
+                'ready': self.ready.is_set(),
+                'running': self.running,
+                'error': self.error,
+                'ready_seconds': self.ready_seconds,
+                'uptime_seconds': round(time.perf_counter() - self.started, 3),
+                'stages': dict(self.stages),
+            }
@@ -0,0 +1,159 @@
+"""Materialized per-user cart and order documents
+
+Each user has one document per view holding their items newest first, with the product
+fields copied in at write time, so reading a page is a single indexed find_one.
+
+Rebuild from the raw interaction log with: python -m utils.user_views
+"""
+import logging
+import os
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Interaction type -> collection holding its materialized view
+VIEW_COLLECTIONS = {
+    'add_to_cart': 'carts',
+    'purchase': 'orders',
+}
+PRODUCT_FIELDS = ('product_name', 'price', 'description', 'category', 'brand')
+PRODUCT_PROJECTION = {'_id': 0, 'product_id': 1, **{field: 1 for field in PRODUCT_FIELDS}}
+
+# Items kept per user document; older entries fall off the end but still count towards the total
+MAX_ITEMS = 1000
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def ensure_indexes(db):
+    for collection in VIEW_COLLECTIONS.values():
+        db[collection].create_index('user_id', unique=True)
+
+
+def view_item(product, timestamp):
+    """The embedded item stored in a view, shaped like the old $lookup projection"""
+    item = {'product_id': product['product_id'], 'timestamp': timestamp}
+    for field in PRODUCT_FIELDS:
+        item[field] = product.get(field)
+    return item
+
+
+def view_update(user_id, product, interaction_type, timestamp):
+    """(collection, filter, update) that records an interaction in its view, or None if it has no view"""
+    collection = VIEW_COLLECTIONS.get(interaction_type)
+    if collection is None:
+        return None
+    update = {
+        '$push': {'items': {'$each': [view_item(product, timestamp)], '$position': 0, '$slice': MAX_ITEMS}},
+        '$inc': {'count': 1},
+        '$set': {'updated_at': timestamp},
+    }
+    return collection, {'user_id': user_id}, update
+
+
+def record_interaction(db, user_id, product, interaction_type, timestamp):
+    """Apply an add_to_cart/purchase interaction to the user's view; other types are ignored"""
+    spec = view_update(user_id, product, interaction_type, timestamp)
+    if spec is None:
+        return
+    collection, query, update = spec
+    try:
+        db[collection].update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first interaction for the same user inserted the document first
+        db[collection].update_one(query, update)
+
+
+def refresh_items(items, products):
+    """items with their product fields taken from products (a DataFrame indexed by product_id) where it has them
+
+    Views keep the fields copied at write time; a cart should show today's name and price.
+    """
+    if products is None or products.empty:
+        return items
+    fields = [field for field in PRODUCT_FIELDS if field in products.columns]
+    current = products.loc[~products.index.duplicated(), fields]
+    current = current.astype(object).where(current.notna(), None).to_dict('index')
+    return [{**item, **current.get(item['product_id'], {})} for item in items]
+
+
+def parse_page_args(args):
+    """(limit, offset) from request query args, clamped to sane bounds"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(args.get('offset', 0))
+    except (TypeError, ValueError):
+        raise ValueError('limit and offset must be integers')
+    return max(1, min(limit, MAX_PAGE_SIZE)), max(0, offset)
+
+
+def page_projection(limit, offset):
+    return {'_id': 0, 'count': 1, 'items': {'$slice': [offset, limit]}}
+
+
+def page_from_document(document):
+    """(items, total) from a view document fetched with page_projection"""
+    if not document:
+        return [], 0
+    return document.get('items', []), document.get('count', 0)
+
+
+def get_page(db, interaction_type, user_id, limit=DEFAULT_PAGE_SIZE, offset=0):
+    """One page of a user's view, newest first, plus the total number of entries"""
+    collection = VIEW_COLLECTIONS[interaction_type]
+    document = db[collection].find_one({'user_id': user_id}, page_projection(limit, offset))
+    return page_from_document(document)
+
+
+def rebuild_if_empty(db):
+    """Backfill the views on first start after a migration, when they do not exist yet"""
+    if any(db[collection].estimated_document_count() for collection in VIEW_COLLECTIONS.values()):
+        return False
+    if not db.interactions.find_one({'interaction_type': {'$in': list(VIEW_COLLECTIONS)}}, {'_id': 1}):
+        return False
+    rebuild(db)
+    return True
+
+
+def rebuild(db):
+    """Recompute every view from the raw interaction log"""
+    ensure_indexes(db)
+    products = {product['product_id']: product for product in db.products.find({}, PRODUCT_PROJECTION)}
+    for interaction_type, collection in VIEW_COLLECTIONS.items():
+        items_by_user = {}
+        counts = {}
+        cursor = db.interactions.find(
+            {'interaction_type': interaction_type},
+            {'_id': 0, 'user_id': 1, 'product_id': 1, 'timestamp': 1}
+        ).sort('timestamp', -1)
+        for interaction in cursor:
+            product = products.get(interaction['product_id'])
+            if product is None:
+                continue
+            user_id = interaction['user_id']
+            counts[user_id] = counts.get(user_id, 0) + 1
+            items = items_by_user.setdefault(user_id, [])
+            if len(items) < MAX_ITEMS:
+                items.append(view_item(product, interaction.get('timestamp')))
+
+        db[collection].delete_many({})
+        now = datetime.utcnow()
+        documents = [
+            {'user_id': user_id, 'items': items, 'count': counts[user_id], 'updated_at': now}
+            for user_id, items in items_by_user.items()
+        ]
+        if documents:
+            db[collection].insert_many(documents)
+        logger.info('Rebuilt %d %s documents', len(documents), collection)
+
+
+if __name__ == '__main__':
+    import dotenv
+    from pymongo import MongoClient
+
+    dotenv.load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/ecommerce_db"))
+    rebuild(client.get_database())
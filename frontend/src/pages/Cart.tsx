@@ -34,8 +34,9 @@ const Cart: React.FC = () => {
           acc[pid].quantity++;
           return acc;
         }, {});
-        
-        setCart(Object.values(grouped));
+
+        // The endpoint already carries current names and prices, so one request fills the page
+        setCart(Object.values(grouped) as CartItem[]);
       } catch (error) {
         console.error('Error fetching cart:', error);
       } finally {
@@ -13,9 +13,19 @@ interface Product {
   image?: string;
 }
 
+interface SimilarProduct {
+  product_id: string;
+  product_name: string;
+  price: number;
+  category: string;
+  brand: string;
+  score: number;
+}
+
 const ProductDetail: React.FC = () => {
   const { id } = useParams<{ id: string }>();
   const [product, setProduct] = useState<Product | null>(null);
+  const [similar, setSimilar] = useState<SimilarProduct[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const { user } = useAuth();
@@ -42,7 +52,19 @@ const ProductDetail: React.FC = () => {
       }
     };
 
+    const fetchSimilar = async () => {
+      try {
+        const response = await axios.get<{ products: SimilarProduct[] }>(
+          `${process.env.REACT_APP_API_URL}/api/products/${id}/similar?k=8`
+        );
+        setSimilar(response.data.products);
+      } catch (err) {
+        setSimilar([]);
+      }
+    };
+
     fetchProduct();
+    fetchSimilar();
   }, [id, user]);
 
   const handleInteraction = async (productId: string, interactionType: string) => {
@@ -126,6 +148,32 @@ const ProductDetail: React.FC = () => {
           </div>
         </div>
       </div>
+
+      {similar.length > 0 && (
+        <div className="similar-products">
+          <h2>Similar products</h2>
+          <div className="grid">
+            {similar.map((item) => (
+              <div
+                key={item.product_id}
+                className="card product-card"
+                onClick={() => navigate(`/product/${item.product_id}`)}
+              >
+                <img
+                  className="card-media"
+                  src={`https://via.placeholder.com/300x200?text=${item.brand}`}
+                  alt={item.product_name}
+                />
+                <div className="card-content">
+                  <h2 className="product-title">{item.product_name}</h2>
+                  <p className="product-category">{item.category} • {item.brand}</p>
+                  <p className="price">${item.price.toFixed(2)}</p>
+                </div>
+              </div>
+            ))}
+          </div>
+        </div>
+      )}
     </div>
   );
 };
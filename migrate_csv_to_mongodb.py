@@ -40,6 +40,10 @@ def migrate_csv_to_mongodb(
         
         # Convert DataFrame to list of dictionaries
         products = products_df.to_dict('records')
+        # The polling change feed finds product edits by updated_at; tools editing products should bump it too
+        imported_at = datetime.utcnow()
+        for product in products:
+            product['updated_at'] = imported_at
         
         # Insert into MongoDB
         if products:
@@ -116,8 +120,31 @@ def migrate_csv_to_mongodb(
             db.interactions.drop()  # Remove existing collection
             result = db.interactions.insert_many(interactions)
             print(f"Inserted {len(result.inserted_ids)} interactions")
+            # Cart/order views are derived from interactions; the API rebuilds them on next start
+            db.carts.drop()
+            db.orders.drop()
     else:
         print(f"Interactions file not found: {interactions_file}")
+
+    # 4. Migrate reviews
+    reviews_file = os.path.join(csv_dir, "reviews.csv")
+    if os.path.exists(reviews_file):
+        print(f"Importing reviews from {reviews_file}")
+        reviews_df = pd.read_csv(reviews_file)
+        reviews_df['user_id'] = reviews_df['user_id'].astype(int)
+        reviews_df['product_id'] = reviews_df['product_id'].astype(int)
+        reviews_df['rating'] = reviews_df['rating'].astype(int)
+        reviews_df['review_text'] = reviews_df['review_text'].fillna('')
+        reviews_df['created_at'] = datetime.utcnow()
+
+        reviews = reviews_df.to_dict('records')
+        if reviews:
+            db.reviews.drop()
+            result = db.reviews.insert_many(reviews)
+            db.reviews.create_index('product_id')
+            print(f"Inserted {len(result.inserted_ids)} reviews")
+    else:
+        print(f"Reviews file not found: {reviews_file}")
     
     print("Migration completed!")
 